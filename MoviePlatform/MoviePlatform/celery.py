@@ -4,6 +4,7 @@
 import os
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MoviePlatform.settings')
 
@@ -18,3 +19,27 @@ app.conf.update(
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks(['tasks'])
+
+
+_pinning_scopes = {}
+
+
+@task_prerun.connect
+def open_pinning_scope(task_id=None, **kwargs):
+    """
+    Каждая задача начинает с чтения из реплик, даже если предыдущая задача в этом потоке писала.
+    Задача, выполняемая сразу внутри запроса (CELERY_TASK_ALWAYS_EAGER), наследует его закрепление.
+    """
+    from MoviePlatform.db_routing import is_primary_pinned, pinning_scope
+
+    scope = pinning_scope(is_primary_pinned())
+    scope.__enter__()
+    _pinning_scopes[task_id] = scope
+
+
+@task_postrun.connect
+def close_pinning_scope(task_id=None, **kwargs):
+    """Восстановление закрепления после задачи"""
+    scope = _pinning_scopes.pop(task_id, None)
+    if scope is not None:
+        scope.__exit__(None, None, None)
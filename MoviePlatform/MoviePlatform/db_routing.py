@@ -0,0 +1,132 @@
+"""
+Маршрутизация запросов между основной базой и репликами для чтения.
+
+Записи всегда идут в основную базу (default), чтения — в случайную реплику из REPLICA_DATABASES.
+После первой записи в рамках запроса или задачи все последующие чтения закрепляются за основной базой,
+чтобы пользователь видел свои изменения, пока реплики их не получили.
+"""
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_primary_pinned = ContextVar('primary_pinned', default=False)
+_primary_written = ContextVar('primary_written', default=False)
+_primary_forced = ContextVar('primary_forced', default=False)
+
+REPLICA_SYNCED_AT_KEY = 'replica_synced_at:{}'
+
+
+def get_replicas():
+    """Метод для получения псевдонимов реплик"""
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def get_replicas_synced_at():
+    """
+    Метод для получения момента, до которого реплики гарантированно содержат данные основной базы:
+    время начала последней синхронизации самой отстающей реплики; 0, если какая-то реплика ещё не синхронизирована
+    """
+    replicas = get_replicas()
+    synced_at = cache.get_many([REPLICA_SYNCED_AT_KEY.format(alias) for alias in replicas])
+    if len(synced_at) < len(replicas):
+        return 0
+    return min(synced_at.values())
+
+
+def is_primary_pinned():
+    """Метод для проверки, закреплены ли чтения за основной базой"""
+    return _primary_pinned.get()
+
+
+def has_written():
+    """Метод для проверки, была ли запись в основную базу в текущей области закрепления"""
+    return _primary_written.get()
+
+
+def pin_primary():
+    """Метод для закрепления чтений за основной базой до конца запроса или задачи"""
+    _primary_pinned.set(True)
+
+
+@contextmanager
+def pinning_scope(pinned=False):
+    """Контекстный менеджер области закрепления (запрос, задача); по выходу восстанавливается прежнее состояние"""
+    pinned_token = _primary_pinned.set(pinned)
+    written_token = _primary_written.set(False)
+    try:
+        yield
+    finally:
+        _primary_written.reset(written_token)
+        _primary_pinned.reset(pinned_token)
+
+
+@contextmanager
+def use_primary():
+    """
+    Контекстный менеджер для чтения из основной базы.
+    Нужен там, где прочитанное сохраняется в общий кэш: данные отстающей реплики остались бы в нём надолго.
+    """
+    token = _primary_forced.set(True)
+    try:
+        yield
+    finally:
+        _primary_forced.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Роутер баз данных: запись в основную базу, чтение из реплик"""
+
+    def db_for_read(self, model, **hints):
+        """Метод для выбора базы чтения"""
+        replicas = get_replicas()
+        if (
+            not replicas or _primary_pinned.get() or _primary_forced.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        """Метод для выбора базы записи; после записи чтения закрепляются за основной базой"""
+        pin_primary()
+        _primary_written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Все базы содержат одни и те же данные, поэтому связи между объектами из них допустимы"""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Миграции применяются только к основной базе, реплики получают схему при синхронизации"""
+        return db == DEFAULT_DB_ALIAS
+
+
+def sync_replicas(aliases=None):
+    """
+    Метод для копирования основной базы SQLite в файлы реплик через backup API.
+    Копия согласованная: backup читает снимок базы, не останавливая запись. Время начала копирования
+    сохраняется в кэш как отметка синхронизации реплики: все записи, зафиксированные до него, в реплике уже есть.
+    Возвращает псевдонимы реплик.
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    if source.vendor != 'sqlite':
+        raise ValueError('Синхронизация файлов реплик поддерживается только для SQLite')
+
+    source.ensure_connection()
+    aliases = aliases or get_replicas()
+    for alias in aliases:
+        connections[alias].close()
+        destination = sqlite3.connect(connections[alias].settings_dict['NAME'])
+        started = time.time()
+        try:
+            source.connection.backup(destination)
+        finally:
+            destination.close()
+        cache.set(REPLICA_SYNCED_AT_KEY.format(alias), started, timeout=None)
+    return aliases
@@ -0,0 +1,75 @@
+"""Промежуточные слои проекта"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .db_routing import get_replicas, get_replicas_synced_at, has_written, pinning_scope
+
+PIN_PRIMARY_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class PrimaryPinningMiddleware:
+    """
+    Закрепление чтений за основной базой.
+    Изменяющие запросы читают из основной базы с самого начала. После записи ставится cookie со временем записи,
+    и следующие запросы этого пользователя (например, после редиректа) читают из основной базы, пока все реплики
+    не синхронизированы после этого времени. REPLICA_PIN_SECONDS — лишь верхняя граница жизни cookie.
+    Поддерживает и синхронную, и асинхронную цепочку, чтобы под ASGI не добавлять переключение потоков.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def should_pin(request):
+        """Метод для определения, читает ли запрос из основной базы с самого начала"""
+        if request.method not in SAFE_METHODS:
+            return True
+        if PIN_PRIMARY_COOKIE not in request.COOKIES:
+            return False
+        try:
+            written_at = float(request.COOKIES[PIN_PRIMARY_COOKIE])
+        except ValueError:
+            return True
+        return get_replicas_synced_at() <= written_at
+
+    @staticmethod
+    def remember_write(response):
+        """Метод для закрепления следующих запросов пользователя после записи"""
+        response.set_cookie(
+            PIN_PRIMARY_COOKIE, f'{time.time():.3f}', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not get_replicas():
+            return self.get_response(request)
+
+        with pinning_scope(self.should_pin(request)):
+            response = self.get_response(request)
+            wrote = has_written()
+
+        if wrote:
+            self.remember_write(response)
+        return response
+
+    async def __acall__(self, request):
+        """Асинхронный вариант __call__"""
+        if not get_replicas():
+            return await self.get_response(request)
+
+        with pinning_scope(self.should_pin(request)):
+            response = await self.get_response(request)
+            wrote = has_written()
+
+        if wrote:
+            self.remember_write(response)
+        return response
@@ -68,6 +68,7 @@ LOGOUT_REDIRECT_URL = '/'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'MoviePlatform.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -128,15 +129,40 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_MODULES = ['tasks.tasks']
+# Задачи, загружающие процессор, идут в отдельную очередь: её обслуживает воркер с пулом solo, а не gevent,
+# где расчёт блокировал бы остальные задачи, а ProcessPoolExecutor может зависнуть
+CELERY_TASK_ROUTES = {
+    'tasks.tasks.build_recommendations': {'queue': 'cpu'},
+}
 CELERY_BEAT_SCHEDULE = {
     'send_high_rated_media_to_users': {
         'task': 'tasks.tasks.send_high_rated_media_to_users',
-        'schedule': crontab(minute='*'),  # Каждую минуту
+        'schedule': crontab(minute=0, hour=10, day_of_week='mon'),  # По понедельникам в 10:00
+    },
+    'build_recommendations': {
+        'task': 'tasks.tasks.build_recommendations',
+        'schedule': crontab(minute=0, hour=9, day_of_week='mon'),  # По понедельникам в 9:00, до рассылки
+    },
+    'rebuild_similar_index': {
+        'task': 'tasks.tasks.rebuild_similar_index',
+        'schedule': crontab(minute=30, hour=3),  # Каждый день в 3:30
+    },
+    'maintain_trending': {
+        'task': 'tasks.tasks.maintain_trending',
+        'schedule': crontab(minute=15),  # Каждый час
+    },
+    'flush_rating_buffer': {
+        'task': 'tasks.tasks.flush_rating_buffer',
+        'schedule': crontab(minute='*'),  # Каждую минуту, если запуск после оценки пропущен
     },
     'clean_empty_ratings': {
         'task': 'tasks.tasks.clean_empty_ratings',
         'schedule': crontab(minute='*'),  # Каждую минуту
     },
+    'build_home_snapshot': {
+        'task': 'tasks.tasks.build_home_snapshot',
+        'schedule': crontab(minute='*/5'),  # Каждые 5 минут
+    },
 }
 
 
@@ -163,13 +189,55 @@ WSGI_APPLICATION = 'MoviePlatform.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# WAL позволяет читать во время записи; timeout — сколько секунд ждать блокировку вместо ошибки
+# «database is locked»; IMMEDIATE берёт блокировку записи в начале транзакции, а не при первой записи,
+# когда повторить ожидание уже нельзя
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+        },
     }
 }
 
+# Реплики для чтения: пути к файлам SQLite через запятую, например
+# DATABASE_REPLICAS=replica1.sqlite3,replica2.sqlite3; файлы создаёт и обновляет команда sync_replicas
+REPLICA_DATABASES = []
+for number, path in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica_{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / path.strip(),
+        'OPTIONS': {
+            'timeout': 20,
+            'init_command': 'PRAGMA query_only=ON',
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica_{number}')
+
+if REPLICA_DATABASES:
+    CELERY_BEAT_SCHEDULE['sync_replicas'] = {
+        'task': 'tasks.tasks.sync_replicas',
+        'schedule': crontab(minute='*'),  # Каждую минуту
+    }
+
+DATABASE_ROUTERS = ['MoviePlatform.db_routing.PrimaryReplicaRouter']
+
+# Сколько секунд после записи пользователь может читать из основной базы. Закрепление снимается раньше,
+# как только все реплики синхронизированы после записи; граница с запасом покрывает интервал синхронизации
+# (минута) и время самого копирования
+REPLICA_PIN_SECONDS = 60 * 3
+
+# Каталог индекса похожих медиа; общий для всех процессов веб-сервера и Celery на одной машине
+SIMILAR_INDEX_DIR = os.getenv('SIMILAR_INDEX_DIR', BASE_DIR / 'similar_index')
+
+# Отложенная запись оценок: оценки из форм попадают в очередь Redis и пишутся в базу пачками задачей Celery
+RATING_WRITE_BEHIND = os.getenv('RATING_WRITE_BEHIND') == '1'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -212,6 +280,11 @@ STATICFILES_DIRS = [
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'static/img')
 
+# Отдача файлов медиа через прокси: 'nginx' (X-Accel-Redirect на внутренний адрес MEDIA_FILE_OFFLOAD_PREFIX,
+# location с internal и alias на MEDIA_ROOT) или 'apache' (X-Sendfile); пусто — файлы отдаёт Django
+MEDIA_FILE_OFFLOAD = os.getenv('MEDIA_FILE_OFFLOAD', '')
+MEDIA_FILE_OFFLOAD_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
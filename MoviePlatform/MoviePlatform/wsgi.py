@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MoviePlatform.settings')
 
 application = get_wsgi_application()
+
+# Индекс подсказок строится в фоне при запуске процесса, а не в первом запросе
+from media.suggest import suggest_index  # noqa: E402
+
+suggest_index.warm_up()
@@ -0,0 +1,206 @@
+"""
+Модуль асинхронных представлений API только для чтения.
+Под ASGI ожидание базы и кэша не занимает рабочий поток; под WSGI представления тоже работают
+(Django выполняет их через async_to_sync), но без выигрыша.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views import View
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from api.mixins import ConditionalGetMixin
+from api.pagination import MediaPagination
+from api.views import HIGH_RATED_KEY, HIGH_RATED_TIMEOUT
+from media.caching import aget_table_last_modified, aget_table_versions, get_or_compute
+from media.models import Movie, TVShow
+from media.pagination import InvalidCursor, KeysetPaginator
+from media.serializer import CountrySerializer, MovieSerializer, TVShowSerializer
+
+
+class AsyncMovieSerializer(MovieSerializer):
+    """
+    Сериализатор фильма для асинхронных представлений.
+    Страна берётся из select_related: кэш справочников при промахе обращается к базе синхронно,
+    а это запрещено внутри event loop.
+    """
+    country = CountrySerializer()
+
+
+class AsyncTVShowSerializer(TVShowSerializer):
+    """Сериализатор сериала для асинхронных представлений, страна берётся из select_related"""
+    country = CountrySerializer()
+
+
+def json_response(data, status=200):
+    """Метод для получения JSON-ответа в том же виде, что у DRF: UTF-8 без экранирования кириллицы"""
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+class AsyncReadView(View):
+    """
+    Базовое асинхронное представление чтения медиа с поддержкой ETag / Last-Modified.
+    Валидаторы строятся из версий таблиц, прочитанных асинхронными вызовами кэша, до обращения к базе.
+    """
+    http_method_names = ['get', 'head', 'options']
+    model = None
+    serializer_class = None
+    etag_tables = []
+
+    def get_queryset(self):
+        """Метод для получения queryset со связями, нужными сериализатору"""
+        return self.serializer_class.setup_eager_loading(self.model.objects.all())
+
+    def serialize(self, data, **kwargs):
+        """Метод для сериализации загруженных объектов; к базе сериализатор не обращается"""
+        return self.serializer_class(data, context={'request': self.request}, **kwargs).data
+
+    async def get_etag(self, request):
+        """Метод для получения ETag запроса"""
+        user = await request.auser()
+        raw = ':'.join([await aget_table_versions(*self.etag_tables), str(user.pk), request.get_full_path()])
+        return '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+    async def get(self, request, *args, **kwargs):
+        """Метод для обработки GET-запроса с поддержкой условных запросов"""
+        etag = await self.get_etag(request)
+        last_modified = await aget_table_last_modified(*self.etag_tables)
+
+        exists = not ConditionalGetMixin.matches_any_etag(request) or await self.resource_exists(**kwargs)
+        if ConditionalGetMixin.is_not_modified(request, etag, last_modified, exists):
+            response = HttpResponseNotModified()
+        else:
+            response = await self.get_data_response(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Cookie', 'Authorization'])
+        return response
+
+    async def resource_exists(self, **kwargs):
+        """Метод для проверки, что запрошенный ресурс существует; список существует всегда"""
+        return True
+
+    async def get_data_response(self, request, *args, **kwargs):
+        """Метод для получения ответа с данными"""
+        raise NotImplementedError
+
+
+class AsyncListView(AsyncReadView):
+    """
+    Асинхронный список медиа с keyset-пагинацией, как у MediaPagination в режиме курсора:
+    ?cursor=, ?ordering= и фильтр ?country= по названию страны. COUNT(*) не выполняется.
+    """
+
+    async def get_data_response(self, request, *args, **kwargs):
+        """Метод для получения страницы списка"""
+        queryset = self.get_queryset()
+        country = request.GET.get('country')
+        if country:
+            queryset = queryset.filter(country__name=country)
+
+        ordering = MediaPagination.orderings.get(request.GET.get('ordering', MediaPagination.default_ordering))
+        if ordering is None:
+            return json_response({'ordering': [f'Допустимые значения: {", ".join(MediaPagination.orderings)}']}, 400)
+
+        try:
+            page = await KeysetPaginator(queryset, ordering, api_settings.PAGE_SIZE).apage(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return json_response({'detail': str(e)}, 404)
+
+        def link(cursor):
+            return replace_query_param(request.build_absolute_uri(), 'cursor', cursor) if cursor else None
+
+        return json_response({
+            'next': link(page.next_cursor),
+            'previous': link(page.previous_cursor),
+            'results': self.serialize(page.object_list, many=True),
+        })
+
+
+class AsyncDetailView(AsyncReadView):
+    """Асинхронное получение медиа по ID"""
+
+    async def resource_exists(self, **kwargs):
+        """Метод для проверки, что медиа существует"""
+        return await self.model.objects.filter(pk=kwargs['pk']).aexists()
+
+    async def get_data_response(self, request, *args, **kwargs):
+        """Метод для получения медиа"""
+        try:
+            obj = await self.get_queryset().aget(pk=kwargs['pk'])
+        except self.model.DoesNotExist:
+            return json_response({'detail': 'Страница не найдена.'}, 404)
+        return json_response(self.serialize(obj))
+
+
+class AsyncHighRatedView(AsyncReadView):
+    """
+    Асинхронный список медиа с высоким рейтингом.
+    Ключ кэша общий с действием high_rated синхронного API и содержит версии таблиц ETag.
+    Свежее значение читается асинхронно, а пересчёт с защитой от одновременного пересчёта выполняется в потоке через get_or_compute.
+    """
+    cache_key = None
+
+    def compute(self):
+        """Метод для построения списка"""
+        return self.serialize(self.serializer_class.setup_eager_loading(self.model.get_high_rated()), many=True)
+
+    async def get_data_response(self, request, *args, **kwargs):
+        """Метод для получения списка из кэша"""
+        cache_key = HIGH_RATED_KEY.format(self.cache_key, await aget_table_versions(*self.etag_tables))
+        entry = await cache.aget(cache_key)
+        if entry is not None and entry[1] > time.time():
+            return json_response(entry[0])
+
+        data = await sync_to_async(get_or_compute)(cache_key, self.compute, timeout=HIGH_RATED_TIMEOUT)
+        return json_response(data)
+
+
+class AsyncMovieMixin:
+    """Настройки асинхронных представлений фильмов"""
+    model = Movie
+    serializer_class = AsyncMovieSerializer
+    etag_tables = ['movie', 'rating', 'genre', 'country']
+    cache_key = 'movies'
+
+
+class AsyncTVShowMixin:
+    """Настройки асинхронных представлений сериалов"""
+    model = TVShow
+    serializer_class = AsyncTVShowSerializer
+    etag_tables = ['tvshow', 'rating', 'genre', 'country']
+    cache_key = 'tvshows'
+
+
+class AsyncMovieListView(AsyncMovieMixin, AsyncListView):
+    """Асинхронный список фильмов"""
+
+
+class AsyncMovieDetailView(AsyncMovieMixin, AsyncDetailView):
+    """Асинхронное получение фильма"""
+
+
+class AsyncMovieHighRatedView(AsyncMovieMixin, AsyncHighRatedView):
+    """Асинхронный список фильмов с высоким рейтингом"""
+
+
+class AsyncTVShowListView(AsyncTVShowMixin, AsyncListView):
+    """Асинхронный список сериалов"""
+
+
+class AsyncTVShowDetailView(AsyncTVShowMixin, AsyncDetailView):
+    """Асинхронное получение сериала"""
+
+
+class AsyncTVShowHighRatedView(AsyncTVShowMixin, AsyncHighRatedView):
+    """Асинхронный список сериалов с высоким рейтингом"""
@@ -0,0 +1,24 @@
+"""Модуль фильтров API"""
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+from media.search import SEARCH_ORDERING, search_media
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Поиск по полнотекстовому индексу медиа вместо LIKE '%q%' по search_fields.
+    Выдача сортируется по релевантности, если не задан ?ordering=;
+    для моделей, ссылающихся на медиа, путь к нему задаёт search_lookup.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        """Метод для фильтрации queryset по параметру search"""
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+
+        queryset = search_media(queryset, query, getattr(view, 'search_lookup', 'pk'))
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return queryset
+        return queryset.order_by(*SEARCH_ORDERING)
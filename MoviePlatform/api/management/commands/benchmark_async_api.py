@@ -0,0 +1,120 @@
+"""Команда для сравнения пропускной способности синхронного (WSGI) и асинхронного (ASGI) путей чтения API"""
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from media.models import Movie
+
+BASE_URL = 'http://localhost'
+# Адрес клиента вне INTERNAL_IPS, чтобы debug toolbar не участвовал в замерах
+CLIENT_ADDRESS = '10.0.0.1'
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочное сравнение путей чтения фильмов внутри процесса, без сети и HTTP-сервера.
+    Для каждого эндпоинта меряются синхронный DRF под WSGI (пул потоков размером с число одновременных
+    запросов), тот же DRF под ASGI и асинхронные представления под ASGI (задачи в одном event loop).
+    На настоящем сервере асинхронный путь запускается через uvicorn MoviePlatform.asgi:application.
+    """
+    help = 'Сравнивает пропускную способность синхронных и асинхронных эндпоинтов чтения при одновременных запросах'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=20, help='Количество одновременных запросов')
+
+    @staticmethod
+    def get_endpoints():
+        """Метод для получения пар URL (синхронный DRF, асинхронный) для каждого эндпоинта"""
+        movie = Movie.objects.first()
+        if movie is None:
+            raise CommandError('Нет фильмов для замера.')
+
+        return {
+            'list': (reverse('movie-list') + '?pagination=cursor', reverse('async-movie-list')),
+            'detail': (reverse('movie-detail', args=[movie.pk]), reverse('async-movie-detail', args=[movie.pk])),
+            'high_rated': (reverse('movie-high-rated'), reverse('async-movie-high-rated')),
+        }
+
+    @staticmethod
+    def run_wsgi(app, url, total, concurrency):
+        """Метод для замера под WSGI: каждый поток пула держит своего клиента"""
+        transport = httpx.WSGITransport(app=app, remote_addr=CLIENT_ADDRESS)
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'client'):
+                local.client = httpx.Client(transport=transport, base_url=BASE_URL)
+            started = time.perf_counter()
+            response = local.client.get(url)
+            return time.perf_counter() - started, response.status_code
+
+        fetch(None)
+        with ThreadPoolExecutor(concurrency) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(fetch, range(total)))
+            return time.perf_counter() - started, results
+
+    @staticmethod
+    async def run_asgi(app, url, total, concurrency):
+        """Метод для замера под ASGI: одновременные запросы — задачи одного event loop"""
+        transport = httpx.ASGITransport(app=app, client=(CLIENT_ADDRESS, 123))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with httpx.AsyncClient(transport=transport, base_url=BASE_URL) as client:
+            async def fetch():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    return time.perf_counter() - started, response.status_code
+
+            await fetch()
+            started = time.perf_counter()
+            results = await asyncio.gather(*[fetch() for _ in range(total)])
+            return time.perf_counter() - started, results
+
+    def report(self, endpoint, scenario, elapsed, results):
+        """Метод для вывода строки результатов; возвращает количество ошибочных ответов"""
+        durations = sorted(duration for duration, _ in results)
+        errors = sum(status != 200 for _, status in results)
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        self.stdout.write(
+            f'{endpoint:<11} {scenario:<12} {len(results) / elapsed:>9.1f} '
+            f'{statistics.median(durations) * 1000:>9.1f} {p95 * 1000:>9.1f} {errors:>7}'
+        )
+        return errors
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        total, concurrency = options['requests'], options['concurrency']
+        endpoints = self.get_endpoints()
+        wsgi_app, asgi_app = WSGIHandler(), get_asgi_application()
+
+        if settings.DEBUG:
+            # debug toolbar при DEBUG проверяет адрес клиента через DNS на каждом запросе, это искажает замеры
+            self.stdout.write(self.style.WARNING('DEBUG включён: результаты не отражают работу в продакшене.'))
+        self.stdout.write(f'{total} запросов, {concurrency} одновременно')
+        self.stdout.write(f'{"эндпоинт":<11} {"сценарий":<12} {"запрос/с":>9} {"p50, мс":>9} {"p95, мс":>9} {"ошибки":>7}')
+
+        errors = 0
+        for endpoint, (sync_url, async_url) in endpoints.items():
+            scenarios = [
+                ('DRF, WSGI', lambda: self.run_wsgi(wsgi_app, sync_url, total, concurrency)),
+                ('DRF, ASGI', lambda: asyncio.run(self.run_asgi(asgi_app, sync_url, total, concurrency))),
+                ('async, ASGI', lambda: asyncio.run(self.run_asgi(asgi_app, async_url, total, concurrency))),
+            ]
+            for scenario, run in scenarios:
+                errors += self.report(endpoint, scenario, *run())
+
+        if errors:
+            raise CommandError(f'Ответов с ошибкой: {errors}')
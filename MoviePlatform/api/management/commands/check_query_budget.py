@@ -0,0 +1,158 @@
+"""Команда для проверки бюджета SQL-запросов эндпоинтов API"""
+import datetime
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.pagination import PageNumberPagination
+
+from media.models import AbstractMedia, Country, Genre, Movie, Rating, TVShow
+
+# Имя маршрута -> максимально допустимое число запросов независимо от размера страницы
+QUERY_BUDGETS = {
+    'genre-list': 2,
+    'country-list': 2,
+    'movie-list': 4,
+    'movie-detail': 3,
+    'movie-high-rated': 2,
+    'tvshow-list': 4,
+    'tvshow-detail': 3,
+    'tvshow-high-rated': 2,
+    'complex-query-first-list': 2,
+    'rating-list': 4,
+    'complex-query-second-list': 5,
+    'catalog-list': 3,
+    'catalog-detail': 2,
+    'movie-similar': 2,
+    'tvshow-similar': 2,
+}
+
+PAGE_SIZES = (1, 100)
+
+
+class Command(BaseCommand):
+    """
+    Прогон эндпоинтов API с подсчётом SQL-запросов.
+    Общий кэш отключается, чтобы мерить холодный путь; кэши справочников в памяти процесса
+    прогреваются первым, неучитываемым вызовом. Каждый эндпоинт вызывается с разными
+    размерами страницы, и число запросов должно совпадать и укладываться в бюджет.
+    Классы пагинации читают PAGE_SIZE при импорте, поэтому размер страницы подменяется и в настройках,
+    и в атрибуте PageNumberPagination.page_size. Чтобы страницы разного размера действительно различались,
+    база наполняется синтетическими данными внутри транзакции, которая затем откатывается;
+    эндпоинт, который не удалось проверить на двух длинах страницы, считается ошибкой.
+    """
+    help = 'Проверяет, что эндпоинты API укладываются в фиксированный бюджет SQL-запросов'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument(
+            '--seed', type=int, default=20,
+            help='Количество синтетических фильмов, сериалов и пользователей с оценками '
+                 '(0 — проверять на текущих данных)',
+        )
+        parser.add_argument('--verbose-sql', action='store_true', help='Выводить выполненные запросы')
+
+    @staticmethod
+    def seed(count):
+        """Метод для наполнения базы синтетическими данными: медиа с жанрами и страной и оценки к ним"""
+        countries = list(Country.objects.all()[:2]) or [Country.objects.create(name='Страна')]
+        genres = [Genre.objects.get_or_create(name=f'Жанр запросов {i}')[0] for i in range(3)]
+        users = User.objects.bulk_create([User(username=f'query-budget-{i}') for i in range(count)])
+        start = datetime.date(2000, 1, 1)
+
+        media = []
+        for i in range(count):
+            common = {
+                'title': f'Медиа {i}', 'description': f'Описание {i}', 'poster': 'posters/seed.jpg',
+                'release_date': start + datetime.timedelta(days=i), 'country': countries[i % len(countries)],
+            }
+            media.append(Movie.objects.create(length=datetime.time(1, i % 60), **common))
+            media.append(TVShow.objects.create(seasons_count=i % 12 + 1, **common))
+        for i, item in enumerate(media):
+            item.genres.set(genres[:i % len(genres) + 1])
+
+        Rating.objects.bulk_create([
+            Rating(media=item, user=user, rating=(i + j) % 5 + 1)
+            for i, item in enumerate(media) for j, user in enumerate(users[:3])
+        ])
+
+    def get_urls(self):
+        """Метод для получения URL проверяемых эндпоинтов"""
+        movie = Movie.objects.first()
+        tvshow = TVShow.objects.first()
+        media = AbstractMedia.objects.non_polymorphic().filter(is_published=True).first()
+
+        for name in QUERY_BUDGETS:
+            if name in ('movie-detail', 'movie-similar'):
+                yield name, movie and reverse(name, args=[movie.pk])
+            elif name in ('tvshow-detail', 'tvshow-similar'):
+                yield name, tvshow and reverse(name, args=[tvshow.pk])
+            elif name == 'catalog-detail':
+                yield name, media and reverse(name, args=[media.pk])
+            else:
+                yield name, reverse(name)
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        client = Client(SERVER_NAME='localhost', REMOTE_ADDR='10.0.0.1', HTTP_ACCEPT='application/json')
+        failures = []
+
+        with (
+            override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}),
+            transaction.atomic(),
+        ):
+            if options['seed']:
+                self.seed(options['seed'])
+
+            for name, url in self.get_urls():
+                if url is None:
+                    failures.append(f'{name}: нет объекта для проверки, запустите команду с --seed')
+                    continue
+                client.get(url)
+
+                counts, lengths = [], []
+                for page_size in PAGE_SIZES:
+                    with (
+                        override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'PAGE_SIZE': page_size}),
+                        mock.patch.object(PageNumberPagination, 'page_size', page_size),
+                    ):
+                        with CaptureQueriesContext(connection) as queries:
+                            response = client.get(url)
+
+                    if response.status_code != 200:
+                        failures.append(f'{name}: статус {response.status_code}')
+                    counts.append(len(queries))
+                    data = response.json() if response.status_code == 200 else None
+                    if isinstance(data, dict) and 'results' in data:
+                        lengths.append(len(data['results']))
+
+                    if options['verbose_sql']:
+                        for query in queries.captured_queries:
+                            self.stdout.write(f'    {query["sql"][:200]}')
+
+                budget = QUERY_BUDGETS[name]
+                page_lengths = f', объектов на странице {lengths}' if lengths else ''
+                self.stdout.write(f'{name} {url}: {counts} (бюджет {budget}){page_lengths}')
+
+                if max(counts) > budget:
+                    failures.append(f'{name}: {max(counts)} запросов при бюджете {budget}')
+                if lengths and max(lengths) <= 1:
+                    failures.append(
+                        f'{name}: в ответе не больше одного объекта, зависимость от размера страницы не проверена'
+                    )
+                elif lengths and len(set(lengths)) == 1:
+                    failures.append(f'{name}: размер страницы не применился, длины ответов {lengths}')
+                if len(set(counts)) > 1:
+                    failures.append(f'{name}: число запросов зависит от размера страницы {counts}')
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError('\n'.join(failures))
+
+        self.stdout.write(self.style.SUCCESS('Все эндпоинты укладываются в бюджет запросов.'))
@@ -0,0 +1,175 @@
+"""Модуль примесей для представлений API"""
+import functools
+import hashlib
+
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from media.caching import get_table_last_modified, get_table_versions
+from media.models import Rating
+from media.serializer import RatingSerializer
+from media.similar import SIMILAR_LIMIT, SIMILAR_MAX_LIMIT, similar_index
+from media.validators import validate_rating
+
+
+def conditional_get(method):
+    """
+    Декоратор для условных GET-запросов.
+    Валидаторы считаются до сериализации, и при совпадении клиент получает 304 без тела.
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return method(self, request, *args, **kwargs)
+
+        etag = self.get_etag(request)
+        last_modified = get_table_last_modified(*self.etag_tables)
+
+        exists = not self.matches_any_etag(request) or self.resource_exists()
+        if self.is_not_modified(request, etag, last_modified, exists):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Cookie', 'Authorization'])
+        return response
+
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """
+    Примесь для поддержки ETag / Last-Modified в списках и детальных представлениях.
+    Валидатор строится из версий таблиц, от которых зависит ответ.
+    """
+    etag_tables = []
+
+    def get_etag(self, request):
+        """Метод для получения ETag запроса"""
+        renderer = getattr(request, 'accepted_renderer', None)
+        raw = ':'.join([
+            get_table_versions(*self.etag_tables),
+            str(request.user.pk),
+            request.get_full_path(),
+            renderer.format if renderer else '',
+        ])
+        return '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+    @staticmethod
+    def matches_any_etag(request):
+        """Метод для проверки, что If-None-Match содержит «*»"""
+        return '*' in parse_etags(request.headers.get('If-None-Match', ''))
+
+    @staticmethod
+    def is_not_modified(request, etag, last_modified, exists=True):
+        """
+        Метод для проверки заголовков If-None-Match и If-Modified-Since.
+        «*» совпадает с любым ETag, но только если ресурс существует (exists).
+        """
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            if '*' in etags:
+                return exists
+            return etag in etags or f'W/{etag}' in etags
+
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return bool(last_modified and if_modified_since and int(last_modified) <= if_modified_since)
+
+    def resource_exists(self):
+        """
+        Метод для проверки, что запрошенный ресурс существует.
+        Для детального маршрута объект загружается, и отсутствующий даёт 404; список существует всегда.
+        """
+        if (self.lookup_url_kwarg or self.lookup_field) in self.kwargs:
+            self.get_object()
+        return True
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        """Метод для получения списка с поддержкой условных запросов"""
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        """Метод для получения объекта с поддержкой условных запросов"""
+        return super().retrieve(request, *args, **kwargs)
+
+
+class EagerLoadingViewMixin:
+    """Примесь представления, применяющая к queryset связи, объявленные сериализатором"""
+
+    def eager_load(self, queryset):
+        """Метод для применения связей сериализатора к queryset"""
+        setup_eager_loading = getattr(self.get_serializer_class(), 'setup_eager_loading', None)
+        return setup_eager_loading(queryset) if setup_eager_loading else queryset
+
+    def filter_queryset(self, queryset):
+        """Метод для фильтрации queryset с предзагрузкой связей"""
+        return self.eager_load(super().filter_queryset(queryset))
+
+
+class RateMediaMixin:
+    """Примесь представления медиа с действием оценки; повторная оценка пользователя заменяет прежнюю"""
+
+    @action(methods=['POST'], detail=True, permission_classes=[IsAuthenticated])
+    def add_rating(self, request, pk=None):
+        """Метод для добавления или изменения оценки медиа текущим пользователем"""
+        media = self.get_object()
+        rating_value = request.data.get('rating')
+
+        if rating_value:
+            value = serializers.IntegerField(validators=[validate_rating]).run_validation(rating_value)
+            rating, created = Rating.objects.update_or_create(media=media, user=request.user, defaults={'rating': value})
+            serializer = RatingSerializer(rating, context=self.get_serializer_context())
+
+            return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+        return Response({'error': 'Rating value is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class SimilarMediaMixin:
+    """
+    Примесь представления медиа с действием похожих медиа того же типа.
+    Соседи берутся из индекса похожих (media.similar), из базы загружаются только они сами;
+    если медиа нет в индексе (например, индекс ещё не построен), в базе проверяется только его существование.
+    """
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Метод для получения медиа, похожих на данное, по убыванию сходства; ?limit= — их количество"""
+        try:
+            limit = min(int(request.query_params.get('limit', SIMILAR_LIMIT)), SIMILAR_MAX_LIMIT)
+        except ValueError:
+            limit = SIMILAR_LIMIT
+
+        try:
+            media_id = int(pk)
+        except ValueError:
+            raise Http404
+        neighbours = similar_index.neighbours(media_id, max(limit, 1))
+        if not neighbours:
+            # Медиа нет в индексе: 404, если его нет и в базе, иначе пустой список; хватает одного EXISTS
+            if not self.queryset.filter(pk=media_id).exists():
+                raise Http404
+            return Response([])
+
+        objects = self.eager_load(self.queryset.all()).in_bulk([media_id for media_id, _ in neighbours])
+
+        results = []
+        for media_id, similarity in neighbours:
+            if media_id in objects:
+                data = self.get_serializer(objects[media_id]).data
+                data['similarity'] = round(similarity, 4)
+                results.append(data)
+        return Response(results)
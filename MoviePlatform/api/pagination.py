@@ -0,0 +1,80 @@
+"""Модуль классов пагинации API"""
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from media.pagination import InvalidCursor, KeysetPaginator
+from media.search import SEARCH_ORDERING
+
+
+class MediaPagination(PageNumberPagination):
+    """
+    Пагинация медиа по номеру страницы или по курсору.
+    Режим курсора включается параметром ?pagination=cursor (или наличием ?cursor=)
+    и не выполняет COUNT(*): ответ содержит только ссылки next/previous.
+    При поиске без явного ?ordering= результаты идут по релевантности.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    ordering_query_param = 'ordering'
+    orderings = {
+        'release_date': ('release_date', 'id'),
+        '-release_date': ('-release_date', '-id'),
+        'title': ('title', 'id'),
+        '-title': ('-title', '-id'),
+        'average_rating': ('average_rating', 'id'),
+        '-average_rating': ('-average_rating', '-id'),
+    }
+    default_ordering = '-release_date'
+
+    keyset_page = None
+
+    def use_cursor(self, request):
+        """Метод для определения режима пагинации"""
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Метод для получения страницы"""
+        self.keyset_page = None
+        if not self.use_cursor(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        ordering_name = request.query_params.get(self.ordering_query_param)
+        if ordering_name is None and request.query_params.get(api_settings.SEARCH_PARAM, '').strip():
+            ordering = SEARCH_ORDERING
+        else:
+            ordering = self.orderings.get(ordering_name or self.default_ordering)
+        if ordering is None:
+            raise ValidationError({self.ordering_query_param: f'Допустимые значения: {", ".join(self.orderings)}'})
+
+        try:
+            self.keyset_page = KeysetPaginator(queryset, ordering, self.get_page_size(request)).page(
+                request.query_params.get(self.cursor_query_param)
+            )
+        except InvalidCursor as e:
+            raise NotFound(str(e))
+
+        return list(self.keyset_page)
+
+    def get_cursor_link(self, cursor):
+        """Метод для получения ссылки на страницу по курсору"""
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        """Метод для получения ответа со страницей"""
+        if self.keyset_page is None:
+            return super().get_paginated_response(data)
+
+        return Response({
+            'next': self.get_cursor_link(self.keyset_page.next_cursor),
+            'previous': self.get_cursor_link(self.keyset_page.previous_cursor),
+            'results': data,
+        })
@@ -1,7 +1,8 @@
 ﻿"""Модуль urls для приложения api"""
+from django.urls import path
 from rest_framework import routers
 
-from api import views
+from api import async_views, views
 
 router = routers.DefaultRouter()
 router.register(r'genres', views.GenreViewSet)
@@ -9,7 +10,24 @@ router.register(r'countries', views.CountryViewSet)
 router.register(r'movies', views.MovieViewSet)
 router.register(r'tvshows', views.TVShowViewSet)
 router.register(r'ratings', views.RatingViewSet)
+router.register(r'catalog', views.CatalogViewSet, basename='catalog')
+router.register(r'media-choices', views.MediaChoiceViewSet, basename='media-choices')
+router.register(r'recommendations', views.RecommendationViewSet, basename='recommendations')
+router.register(r'suggest', views.SuggestViewSet, basename='suggest')
+router.register(r'trending', views.TrendingViewSet, basename='trending')
 router.register(r'complex-query-first', views.ComplexQueryViewFirst, basename='complex-query-first')
 router.register(r'complex-query-second', views.ComplexQueryViewSecond, basename='complex-query-second')
 
-urlpatterns = router.urls
+# Асинхронные варианты чтения фильмов и сериалов для запуска под ASGI
+async_urlpatterns = [
+    path('async/movies/', async_views.AsyncMovieListView.as_view(), name='async-movie-list'),
+    path('async/movies/high_rated/', async_views.AsyncMovieHighRatedView.as_view(), name='async-movie-high-rated'),
+    path('async/movies/<int:pk>/', async_views.AsyncMovieDetailView.as_view(), name='async-movie-detail'),
+    path('async/tvshows/', async_views.AsyncTVShowListView.as_view(), name='async-tvshow-list'),
+    path(
+        'async/tvshows/high_rated/', async_views.AsyncTVShowHighRatedView.as_view(), name='async-tvshow-high-rated',
+    ),
+    path('async/tvshows/<int:pk>/', async_views.AsyncTVShowDetailView.as_view(), name='async-tvshow-detail'),
+]
+
+urlpatterns = async_urlpatterns + router.urls
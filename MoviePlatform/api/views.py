@@ -1,19 +1,39 @@
 """Модуль для работы с представлениями"""
 import django_filters
-from django.core.cache import cache
-from django.db.models import Q, Avg
+from django.db.models import Q
+from django.urls import reverse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
-from media.models import Genre, Country, Movie, TVShow, Rating
-from media.serializer import GenreSerializer, CountrySerializer, MovieSerializer, TVShowSerializer, RatingSerializer
-
-
-class GenreViewSet(viewsets.ModelViewSet):
+from api.filters import FullTextSearchFilter
+from api.mixins import (
+    ConditionalGetMixin, EagerLoadingViewMixin, RateMediaMixin, SimilarMediaMixin, conditional_get,
+)
+from api.pagination import MediaPagination
+from media.caching import country_cache, filter_by_ids, get_cached_ids, get_or_compute, get_table_versions
+from media.models import AbstractMedia, Genre, Country, Movie, TVShow, Rating, MEDIA_TYPE_CHOICES
+from media.serializer import (
+    CatalogSerializer, GenreSerializer, CountrySerializer, MovieSerializer, TVShowSerializer, RatingSerializer,
+    RatingBulkSerializer,
+)
+from media.recommendations import RECOMMENDATIONS_TOP_K, get_recommended_ids, get_recommended_media
+from media.suggest import SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, suggest_index
+from media.trending import (
+    GLOBAL_BOARD, TRENDING_LIMIT, TRENDING_MAX_LIMIT, country_board, genre_board, get_trending_backend,
+)
+
+HIGH_RATED_TIMEOUT = 60 * 15
+# В ключе — версии тех же таблиц, что и в ETag: список с новым ETag никогда не берётся из старой записи кэша
+HIGH_RATED_KEY = 'high_rated_{}:{}'
+
+
+class GenreViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Класс для работы с моделью Genre"""
+    etag_tables = ['genre']
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     sorting_fields = ['name']
@@ -21,8 +41,9 @@ class GenreViewSet(viewsets.ModelViewSet):
     search_fields = ['name']
 
 
-class CountryViewSet(viewsets.ModelViewSet):
+class CountryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Класс для работы с моделью Country"""
+    etag_tables = ['country']
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
     sorting_fields = ['name']
@@ -30,12 +51,16 @@ class CountryViewSet(viewsets.ModelViewSet):
     search_fields = ['name']
 
 
-class MovieViewSet(viewsets.ModelViewSet):
+class MovieViewSet(
+    ConditionalGetMixin, EagerLoadingViewMixin, RateMediaMixin, SimilarMediaMixin, viewsets.ModelViewSet,
+):
     """Класс для работы с моделью Movie"""
+    etag_tables = ['movie', 'rating', 'genre', 'country']
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
-    filter_backends = [SearchFilter, DjangoFilterBackend]
-    search_fields = ['title']
+    pagination_class = MediaPagination
+    filter_backends = [FullTextSearchFilter, DjangoFilterBackend]
+    search_fields = ['title', 'description']
     filterset_fields = ['country']
     sorting_fields = ['title', 'release_date', 'rating']
 
@@ -43,59 +68,35 @@ class MovieViewSet(viewsets.ModelViewSet):
         """Метод для получения списка фильмов"""
         user = self.request.user
         country_name = self.request.query_params.get('country')
-        cache_key = f'movie_queryset_{user.id}_{country_name}'
-        cached_data = cache.get(cache_key)
 
-        if not cached_data:
-            queryset = super().get_queryset()
+        def build_queryset():
+            queryset = super(MovieViewSet, self).get_queryset()
             if country_name:
-                country = Country.objects.filter(name=country_name).first()
+                country = country_cache.get_by_name(country_name)
                 if country:
                     queryset = queryset.filter(country=country)
 
             if user.is_authenticated:
                 queryset = queryset.filter(Q(rating__user=user) | Q(rating__isnull=True))
-            cached_data = list(queryset)
-            cache.set(cache_key, cached_data, timeout=60 * 10)  # Кэшируем на 10 минут
-        else:
-            # make queryset from cached data
-            cached_data = Movie.objects.filter(id__in=[movie.id for movie in cached_data])
+            return queryset.order_by('id')
 
-        return cached_data
+        ids = get_cached_ids(
+            f'movie_queryset_{user.id}_{country_name}', ['movie', 'rating', 'country'], build_queryset,
+        )
+        return filter_by_ids(Movie.objects.all(), ids).order_by('id')
 
     @action(methods=['GET'], detail=False)
+    @conditional_get
     def high_rated(self, request):
         """Метод для получения списка фильмов с высоким рейтингом"""
-        cache_key = 'high_rated_movies'
-        cached_data = cache.get(cache_key)
-
-        if not cached_data:
-            high_rated_movies = Movie.objects.annotate(
-                average_rating=Avg('abstractmedia_ptr__rating__rating')
-            ).filter(average_rating__gt=4.0)
-            serializer = self.get_serializer(high_rated_movies, many=True)
-            cached_data = serializer.data
-            cache.set(cache_key, cached_data, timeout=60 * 15)
-        else:
-            # make queryset from cached data
-            cached_data = Movie.objects.filter(id__in=[movie['id'] for movie in cached_data])
+        cached_data = get_or_compute(
+            HIGH_RATED_KEY.format('movies', get_table_versions(*self.etag_tables)),
+            lambda: self.get_serializer(self.eager_load(Movie.get_high_rated()), many=True).data,
+            timeout=HIGH_RATED_TIMEOUT,
+        )
 
         return Response(cached_data)
 
-    @action(methods=['POST'], detail=True)
-    def add_rating(self, request, pk=None):
-        """Метод для добавления рейтинга к фильму"""
-        movie = self.get_object()
-        rating_value = request.data.get('rating')
-
-        if rating_value:
-            rating = Rating.objects.create(movie=movie, rating=rating_value)
-            serializer = RatingSerializer(rating)
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        return Response({'error': 'Rating value is required'}, status=status.HTTP_400_BAD_REQUEST)
-
 
 class TVShowFilter(django_filters.FilterSet):
     """Фильтр для модели TVShow"""
@@ -107,82 +108,194 @@ class TVShowFilter(django_filters.FilterSet):
         fields = ['release_date', 'country']
 
 
-class TVShowViewSet(viewsets.ModelViewSet):
+class TVShowViewSet(
+    ConditionalGetMixin, EagerLoadingViewMixin, RateMediaMixin, SimilarMediaMixin, viewsets.ModelViewSet,
+):
     """Класс для работы с моделью TVShow"""
+    etag_tables = ['tvshow', 'rating', 'genre', 'country']
     queryset = TVShow.objects.all()
     serializer_class = TVShowSerializer
-    filter_backends = [SearchFilter, DjangoFilterBackend]
-    search_fields = ['title']
+    pagination_class = MediaPagination
+    filter_backends = [FullTextSearchFilter, DjangoFilterBackend]
+    search_fields = ['title', 'description']
     filterset_fields = ['country', 'release_date']
     filterset_class = TVShowFilter
     sorting_fields = ['title', 'release_date', 'rating']
 
     @action(methods=['GET'], detail=False)
+    @conditional_get
     def high_rated(self, request):
         """Метод для получения списка сериалов с высоким рейтингом"""
-        cache_key = 'high_rated_tvshows'
-        cached_data = cache.get(cache_key)
-
-        if not cached_data:
-            high_rated_tvshows = TVShow.objects.annotate(
-                average_rating=Avg('abstractmedia_ptr__rating__rating')
-            ).filter(average_rating__gt=4.0)
-            serializer = self.get_serializer(high_rated_tvshows, many=True)
-            cached_data = serializer.data
-            cache.set(cache_key, cached_data, timeout=60 * 15)  # Кэшируем на 15 минут
-        else:
-            # make queryset from cached data
-            cached_data = TVShow.objects.filter(id__in=[tvshow['id'] for tvshow in cached_data])
+        cached_data = get_or_compute(
+            HIGH_RATED_KEY.format('tvshows', get_table_versions(*self.etag_tables)),
+            lambda: self.get_serializer(self.eager_load(TVShow.get_high_rated()), many=True).data,
+            timeout=HIGH_RATED_TIMEOUT,  # Кэшируем на 15 минут
+        )
 
         return Response(cached_data)
 
-    @action(methods=['POST'], detail=True)
-    def add_rating(self, request, pk=None):
-        """Метод для добавления рейтинга к сериалу"""
-        tvshow = self.get_object()
-        rating_value = request.data.get('rating')
-
-        if rating_value:
-            rating = Rating.objects.create(media=tvshow, rating=rating_value)
-            serializer = RatingSerializer(rating)
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        return Response({'error': 'Rating value is required'}, status=status.HTTP_400_BAD_REQUEST)
-
     def get_queryset(self):
         """Метод для получения списка сериалов"""
         user = self.request.user
         country_name = self.request.query_params.get('country')
-        cache_key = f'tvshow_queryset_{user.id}_{country_name}'
-        cached_data = cache.get(cache_key)
 
-        if not cached_data:
-            queryset = super().get_queryset()
+        def build_queryset():
+            queryset = super(TVShowViewSet, self).get_queryset()
             if country_name:
-                country = Country.objects.filter(name=country_name).first()
+                country = country_cache.get_by_name(country_name)
                 if country:
                     queryset = queryset.filter(country=country)
 
             if user.is_authenticated:
                 queryset = queryset.filter(Q(rating__user=user) | Q(rating__isnull=True))
-            cached_data = list(queryset)
-            cache.set(cache_key, cached_data, timeout=60 * 10)
-        else:
-            # make queryset from cached data
-            cached_data = TVShow.objects.filter(id__in=[tvshow.id for tvshow in cached_data])
+            return queryset.order_by('id')
 
-        return cached_data
+        ids = get_cached_ids(
+            f'tvshow_queryset_{user.id}_{country_name}', ['tvshow', 'rating', 'country'], build_queryset,
+        )
+        return filter_by_ids(TVShow.objects.all(), ids).order_by('id')
 
 
-class RatingViewSet(viewsets.ModelViewSet):
+class RatingViewSet(ConditionalGetMixin, EagerLoadingViewMixin, viewsets.ModelViewSet):
     """Класс для работы с моделью Rating"""
+    etag_tables = ['rating', 'movie', 'tvshow', 'genre', 'country']
     queryset = Rating.objects.all()
     serializer_class = RatingSerializer
     sorting_fields = ['rating']
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     filterset_fields = ['rating', 'media', 'user']
     search_fields = ['media__title']
+    search_lookup = 'media'
+
+    @action(
+        methods=['POST'], detail=False, url_path='bulk',
+        serializer_class=RatingBulkSerializer, permission_classes=[IsAuthenticated],
+    )
+    def bulk(self, request):
+        """
+        Метод для массового добавления и изменения оценок текущего пользователя.
+        Тело запроса: {"ratings": [{"media": ID, "rating": оценка}, ...]}.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(user=request.user))
+
+
+class CatalogFilter(django_filters.FilterSet):
+    """Фильтр смешанного каталога"""
+    type = django_filters.ChoiceFilter(choices=MEDIA_TYPE_CHOICES, method='filter_type')
+    release_date = django_filters.DateFromToRangeFilter(field_name='release_date')
+    country = django_filters.NumberFilter(field_name='country_id')
+    genre = django_filters.NumberFilter(field_name='genres')
+    min_rating = django_filters.NumberFilter(field_name='average_rating', lookup_expr='gte')
+
+    class Meta:
+        model = AbstractMedia
+        fields = ['type', 'release_date', 'country', 'genre', 'min_rating']
+
+    @staticmethod
+    def filter_type(queryset, name, value):
+        """Метод для фильтрации по подтипу: строка подтипа присоединена к каталогу"""
+        return queryset.filter(**{f'{value}__isnull': False})
+
+
+class CatalogViewSet(ConditionalGetMixin, EagerLoadingViewMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Класс для смешанного каталога фильмов и сериалов.
+    Список и карточка загружаются за постоянное число запросов: базовая таблица с подтипами и жанры.
+    """
+    etag_tables = ['movie', 'tvshow', 'rating', 'genre', 'country']
+    queryset = AbstractMedia.catalog().filter(is_published=True).order_by('-release_date', '-id')
+    serializer_class = CatalogSerializer
+    pagination_class = MediaPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
+    filterset_class = CatalogFilter
+    search_fields = ['title', 'description']
+    ordering_fields = ['release_date', 'title', 'average_rating']
+
+
+class MediaChoiceViewSet(viewsets.ViewSet):
+    """Класс для подсказок при выборе медиа в форме рейтинга"""
+    limit = 20
+
+    def list(self, request):
+        """Метод для поиска медиа по началу или части названия"""
+        query = request.query_params.get('q', '').strip()
+        choices = []
+
+        for media_type, label, model in (('movie', 'Фильм', Movie), ('tvshow', 'Сериал', TVShow)):
+            queryset = model.objects.order_by('title')
+            if query:
+                queryset = queryset.filter(title__icontains=query)
+            choices += [
+                {'value': f'{media_type}-{media_id}', 'label': f'{label}: {title}'}
+                for media_id, title in queryset.values_list('id', 'title')[:self.limit]
+            ]
+
+        return Response(sorted(choices, key=lambda choice: choice['label'])[:self.limit])
+
+
+class RecommendationViewSet(viewsets.ViewSet):
+    """
+    Класс для персональных рекомендаций пользователя, рассчитанных задачей build_recommendations.
+    Пока рекомендаций нет (пользователь ничего не оценил или расчёт ещё не прошёл), отдаются медиа
+    с лучшей средней оценкой.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        """Метод для получения рекомендованных медиа в порядке убывания оценки"""
+        queryset = CatalogSerializer.setup_eager_loading(AbstractMedia.catalog())
+        media_ids = get_recommended_ids([request.user.pk]).get(request.user.pk)
+
+        if media_ids:
+            media = get_recommended_media(media_ids, queryset)
+        else:
+            media = queryset.filter(is_published=True).order_by('-average_rating', 'id')[:RECOMMENDATIONS_TOP_K]
+
+        return Response(CatalogSerializer(media, many=True, context={'request': request}).data)
+
+
+class SuggestViewSet(viewsets.ViewSet):
+    """Класс для подсказок по началу названия фильма или сериала; отвечает из индекса в памяти без запросов к БД"""
+
+    def list(self, request):
+        """Метод для получения лучших по оценке медиа, название которых начинается с ?q="""
+        try:
+            limit = min(int(request.query_params.get('limit', SUGGEST_LIMIT)), SUGGEST_MAX_LIMIT)
+        except ValueError:
+            limit = SUGGEST_LIMIT
+
+        suggestions = suggest_index.suggest(request.query_params.get('q', ''), limit)
+        for suggestion in suggestions:
+            suggestion['url'] = reverse(suggestion['type'], args=[suggestion['id']])
+
+        return Response(suggestions)
+
+
+class TrendingViewSet(viewsets.ViewSet):
+    """
+    Класс для трендов: медиа с наибольшей недавней активностью оценок, общий рейтинг или по ?genre= / ?country=.
+    Отвечает из хранилища трендов за одно обращение, без запросов к БД.
+    """
+
+    def list(self, request):
+        """Метод для получения лучших медиа рейтинга; ?limit= — их количество"""
+        genre, country = request.query_params.get('genre'), request.query_params.get('country')
+        if genre and country:
+            return Response({'detail': 'Укажите либо genre, либо country.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(int(request.query_params.get('limit', TRENDING_LIMIT)), TRENDING_MAX_LIMIT)
+            board = genre_board(int(genre)) if genre else country_board(int(country)) if country else GLOBAL_BOARD
+        except ValueError:
+            return Response({'detail': 'Параметры должны быть числами.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = get_trending_backend().top(board, max(limit, 1))
+        for item in items:
+            item['url'] = reverse(item['type'], args=[item['id']])
+
+        return Response(items)
 
 
 class ComplexQueryViewFirst(viewsets.ViewSet):
@@ -193,6 +306,7 @@ class ComplexQueryViewFirst(viewsets.ViewSet):
             Q(title__icontains="a") |
             (~Q(country__name="USA") & Q(length__lt="02:00:00"))
         )
+        queryset = MovieSerializer.setup_eager_loading(queryset)
 
         serializer = MovieSerializer(queryset, many=True)
 
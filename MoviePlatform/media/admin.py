@@ -2,6 +2,7 @@
 from io import BytesIO
 
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.contrib.admin.widgets import AutocompleteSelect
 from django.db import models
 from django.forms.widgets import CheckboxSelectMultiple, DateInput
@@ -14,25 +15,56 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 from simple_history.admin import SimpleHistoryAdmin
 
+from .caching import ReferenceCache
 from .models import Country, Genre, Movie, TVShow, Rating, Media, MediaGenre
 from .resources import MovieResource, TVShowResource
+from .search import SEARCH_ORDERING, search_media
 
 app_name = 'Медиа'
 
 
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """Фильтр по связанной справочной модели, варианты которого берутся из кэша справочников"""
+
+    def field_choices(self, field, request, model_admin):
+        """Метод для получения вариантов фильтра"""
+        reference_cache = ReferenceCache.registry.get(field.related_model._meta.label_lower)
+        if reference_cache is None:
+            return super().field_choices(field, request, model_admin)
+
+        return [(obj.pk, str(obj)) for obj in reference_cache.all()]
+
+
+REFERENCE_LIST_FILTER = (('country', CachedRelatedFieldListFilter), ('genres', CachedRelatedFieldListFilter))
+
+
+class FullTextSearchAdminMixin:
+    """Поиск в списке объектов по полнотекстовому индексу медиа; search_lookup — путь к ID медиа"""
+    search_lookup = 'pk'
+
+    def get_search_results(self, request, queryset, search_term):
+        """Метод для фильтрации списка по строке поиска; без выбранного столбца сортировки — по релевантности"""
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        queryset = search_media(queryset, search_term, self.search_lookup)
+        if ORDER_VAR not in request.GET:
+            queryset = queryset.order_by(*SEARCH_ORDERING)
+        return queryset, False
+
+
 class RatingInline(admin.TabularInline):
     model = Rating
     extra = 1
 
 
 @admin.register(Movie)
-class MovieAdmin(ExportMixin, SimpleHistoryAdmin):
+class MovieAdmin(FullTextSearchAdminMixin, ExportMixin, SimpleHistoryAdmin):
     """
     Административная панель для моделей приложения media
     """
     list_display = ('title', 'release_date', 'country', 'length', 'get_genres')
-    list_filter = ('country', 'genres')
-    search_fields = ('title', 'country')
+    list_filter = REFERENCE_LIST_FILTER
+    search_fields = ('title', 'description')
     ordering = ('title', 'release_date')
     resource_class = MovieResource
     formats = (JSON, CSV, XLSX)
@@ -46,11 +78,11 @@ class MovieAdmin(ExportMixin, SimpleHistoryAdmin):
 
 
 @admin.register(TVShow)
-class TVShowAdmin(ExportMixin, SimpleHistoryAdmin):
+class TVShowAdmin(FullTextSearchAdminMixin, ExportMixin, SimpleHistoryAdmin):
     """Административная панель для модели TVShow"""
     list_display = ('title', 'release_date', 'country', 'seasons_count')
-    list_filter = ('country', 'genres')
-    search_fields = ('title', 'country')
+    list_filter = REFERENCE_LIST_FILTER
+    search_fields = ('title', 'description')
     ordering = ('title', 'release_date')
     resource_class = TVShowResource
     formats = (JSON, CSV, XLSX)
@@ -58,11 +90,12 @@ class TVShowAdmin(ExportMixin, SimpleHistoryAdmin):
 
 
 @admin.register(Rating)
-class RatingAdmin(admin.ModelAdmin):
+class RatingAdmin(FullTextSearchAdminMixin, admin.ModelAdmin):
     """Административная панель для модели Rating"""
     list_display = ('user', 'get_media_object', 'rating')
     list_filter = ('rating',)
-    search_fields = ('user', 'media__title')
+    search_fields = ('media__title',)
+    search_lookup = 'media'
     ordering = ('user', 'rating')
 
     def get_media_object(self, obj):
@@ -92,7 +125,7 @@ class GenreAdmin(admin.ModelAdmin):
 class MediaAdmin(admin.ModelAdmin):
     """Административная панель для модели Media"""
     list_display = ('title', 'release_date', 'country', 'get_genres')
-    list_filter = ('country', 'genres')
+    list_filter = REFERENCE_LIST_FILTER
     search_fields = ('title', 'country')
     ordering = ('title', 'release_date')
 
@@ -0,0 +1,418 @@
+"""Модуль вспомогательных функций кэширования"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models.expressions import RawSQL
+
+from MoviePlatform.db_routing import use_primary
+
+from .models import Country, Genre
+
+logger = logging.getLogger(__name__)
+
+TABLE_VERSION_KEY = 'table_version:{}'
+TABLE_MODIFIED_KEY = 'table_modified:{}'
+OBJECT_VERSION_KEY = 'object_version:{}'
+CARD_KEY = 'card:{}:{}:{}'
+CARD_TIMEOUT = 60 * 60 * 24
+# Карточка объекта, прочитанного из реплики, может отставать от своей версии, пока реплика не синхронизирована
+REPLICA_CARD_TIMEOUT = 60
+ID_LIST_KEY = 'ids:{}:{}'
+# Больше ID в IN (...) не подставляем: SQLite ограничивает число параметров запроса
+ID_FILTER_LIMIT = 500
+REFERENCE_KEY = 'reference:{}'
+LOCK_KEY = 'lock:{}'
+CHANNEL_PREFIX = 'movieplatform:'
+REFERENCE_CHANNEL = f'{CHANNEL_PREFIX}reference_invalidation'
+
+_channel_handlers = {}
+_disconnect_handlers = []
+_listener_lock = threading.Lock()
+_listener_pid = None
+
+
+def _initial_version():
+    """
+    Начальное значение счётчика версии.
+    Основано на времени, чтобы после вытеснения ключа версия не повторилась.
+    """
+    return time.time_ns() // 1000
+
+
+def _get_versions(keys):
+    """Метод для получения счётчиков версий с инициализацией отсутствующих"""
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+
+    return versions
+
+
+def _bump_version(key):
+    """Метод для увеличения счётчика версии"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def get_table_versions(*tables):
+    """Метод для получения составной версии набора таблиц"""
+    keys = [TABLE_VERSION_KEY.format(table) for table in tables]
+    versions = _get_versions(keys)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def get_table_last_modified(*tables):
+    """Метод для получения времени последнего изменения набора таблиц (unix time)"""
+    timestamps = cache.get_many([TABLE_MODIFIED_KEY.format(table) for table in tables])
+    return max(timestamps.values(), default=None)
+
+
+async def aget_table_versions(*tables):
+    """Асинхронный вариант get_table_versions для асинхронных представлений"""
+    keys = [TABLE_VERSION_KEY.format(table) for table in tables]
+    versions = await cache.aget_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, _initial_version(), timeout=None)
+            versions[key] = await cache.aget(key)
+
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+async def aget_table_last_modified(*tables):
+    """Асинхронный вариант get_table_last_modified"""
+    timestamps = await cache.aget_many([TABLE_MODIFIED_KEY.format(table) for table in tables])
+    return max(timestamps.values(), default=None)
+
+
+def bump_table_version(table):
+    """Метод для увеличения версии таблицы после фиксации транзакции"""
+    def bump():
+        _bump_version(TABLE_VERSION_KEY.format(table))
+        cache.set(TABLE_MODIFIED_KEY.format(table), int(time.time()), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def bump_object_version(pk):
+    """Метод для увеличения версии отдельного медиа после фиксации транзакции"""
+    transaction.on_commit(lambda: _bump_version(OBJECT_VERSION_KEY.format(pk)))
+
+
+def bump_object_versions(pks):
+    """
+    Метод для смены версий множества медиа после фиксации транзакции одним обращением к кэшу.
+    Счётчики удаляются: при следующем чтении они создаются заново от текущего времени и не повторяют прежние.
+    """
+    keys = [OBJECT_VERSION_KEY.format(pk) for pk in pks]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_card_versions(pks):
+    """
+    Метод для получения версий карточек медиа.
+    Версия карточки складывается из версии самого медиа и версии таблицы жанров,
+    так как переименование жанра меняет все карточки с ним.
+    """
+    keys = {pk: OBJECT_VERSION_KEY.format(pk) for pk in pks}
+    versions = _get_versions(list(keys.values()))
+    genre_version = get_table_versions('genre')
+    return {pk: f'{versions[key]}.{genre_version}' for pk, key in keys.items()}
+
+
+def attach_card_versions(objects):
+    """Метод для пакетной установки версий карточек списку медиа одним обращением к кэшу"""
+    objects = list(objects)
+    versions = get_card_versions([obj.pk for obj in objects])
+    for obj in objects:
+        obj.card_version = versions[obj.pk]
+    return objects
+
+
+@contextmanager
+def cache_lock(name, timeout=30):
+    """
+    Распределённая блокировка на основе атомарного cache.add.
+    Возвращает True, если блокировка получена; снимается только владельцем.
+    """
+    lock_key = LOCK_KEY.format(name)
+    token = uuid.uuid4().hex
+    acquired = cache.add(lock_key, token, timeout=timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None, lock_timeout=30, wait=5):
+    """
+    Получение значения из кэша с защитой от одновременного пересчёта (single-flight).
+
+    Значение хранится вместе со сроком свежести и живёт в кэше ещё stale_timeout секунд после него.
+    Когда срок истёк, пересчитывает только процесс, получивший блокировку, а остальные
+    получают прежнее значение. Если значения нет совсем, остальные ждут до wait секунд.
+    Пересчёт читает из основной базы: значение из отстающей реплики осталось бы в кэше на весь timeout.
+    """
+    stale_timeout = timeout if stale_timeout is None else stale_timeout
+
+    def compute_and_store():
+        with use_primary():
+            value = compute()
+        cache.set(key, (value, time.time() + timeout), timeout=timeout + stale_timeout)
+        return value
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if fresh_until > time.time():
+            return value
+
+        with cache_lock(key, lock_timeout) as acquired:
+            if acquired:
+                return compute_and_store()
+        return value
+
+    deadline = time.monotonic() + wait
+    while True:
+        with cache_lock(key, lock_timeout) as acquired:
+            if acquired:
+                return compute_and_store()
+
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if time.monotonic() > deadline:
+            logger.warning('Не дождались пересчёта ключа %s, считаем самостоятельно', key)
+            return compute()
+
+
+def get_cached_ids(name, tables, build_queryset, timeout=60 * 10):
+    """
+    Метод для получения упорядоченного списка ID из кэша.
+    Ключ включает версии таблиц, поэтому после записи в них кэш сразу устаревает.
+    """
+    cache_key = ID_LIST_KEY.format(name, get_table_versions(*tables))
+
+    def build():
+        ids = dict.fromkeys(build_queryset().values_list('id', flat=True))
+        return array('q', ids).tobytes()
+
+    ids = array('q')
+    ids.frombytes(get_or_compute(cache_key, build, timeout, stale_timeout=0))
+    return ids.tolist()
+
+
+def filter_by_ids(queryset, ids):
+    """
+    Метод для ограничения queryset списком ID из кэша.
+    Длинный список в SQLite передаётся одним JSON-параметром, чтобы не упереться в лимит параметров запроса.
+    """
+    if len(ids) <= ID_FILTER_LIMIT or connections[queryset.db].vendor != 'sqlite':
+        return queryset.filter(id__in=ids)
+    return queryset.filter(id__in=RawSQL('SELECT value FROM json_each(%s)', [json.dumps(ids)]))
+
+
+def get_redis():
+    """Метод для получения соединения с Redis, если кэш работает через django-redis"""
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def subscribe(channel, handler, on_disconnect=None):
+    """
+    Подписка обработчика на канал уведомлений между процессами.
+    on_disconnect вызывается, когда подписка прервалась и часть уведомлений могла потеряться.
+    """
+    _channel_handlers.setdefault(channel, []).append(handler)
+    if on_disconnect is not None:
+        _disconnect_handlers.append(on_disconnect)
+
+
+def publish(channel, message):
+    """
+    Отправка уведомления всем процессам, включая текущий.
+    Без Redis уведомление обрабатывается только в текущем процессе.
+    """
+    redis = get_redis()
+    if redis is None:
+        _dispatch(channel, message)
+    else:
+        redis.publish(channel, message)
+
+
+def _dispatch(channel, message):
+    """Метод для передачи уведомления обработчикам канала"""
+    for handler in _channel_handlers.get(channel, []):
+        try:
+            handler(message)
+        except Exception:
+            logger.exception('Ошибка обработки уведомления из канала %s', channel)
+
+
+def ensure_listener():
+    """Метод для запуска подписчика на уведомления в текущем процессе"""
+    global _listener_pid
+
+    if _listener_pid == os.getpid():
+        return
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        if get_redis() is None:
+            return
+        threading.Thread(target=_listen, name='cache-invalidation-listener', daemon=True).start()
+
+
+def _listen():
+    """Цикл подписчика: передаёт уведомления всех каналов приложения их обработчикам"""
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+            for message in pubsub.listen():
+                channel, data = message['channel'], message['data']
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                if isinstance(data, bytes):
+                    data = data.decode()
+                _dispatch(channel, data)
+        except Exception as e:
+            logger.warning('Подписка на уведомления об изменениях прервана: %s', e)
+            for on_disconnect in _disconnect_handlers:
+                on_disconnect()
+            time.sleep(5)
+
+
+class ReferenceCache:
+    """
+    Двухуровневый кэш справочных таблиц: LRU с TTL в памяти процесса поверх Redis.
+    При изменении таблицы все веб- и Celery-процессы получают уведомление через Redis pub/sub
+    и сбрасывают локальную копию; TTL ограничивает устаревание, если уведомление потерялось.
+    """
+    registry = {}
+
+    def __init__(self, model, ttl=60 * 5, shared_timeout=60 * 60 * 24, maxsize=128):
+        self.model = model
+        self.name = model._meta.label_lower
+        self.ttl = ttl
+        self.shared_timeout = shared_timeout
+        self.maxsize = maxsize
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.registry[self.name] = self
+
+    def _get_local(self, key):
+        """Метод для чтения из локального уровня"""
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        """Метод для записи в локальный уровень с вытеснением старых записей"""
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def _load(self, key, loader):
+        """Метод для получения значения: память процесса, затем Redis, затем база данных"""
+        ensure_listener()
+
+        value = self._get_local(key)
+        if value is not None:
+            self.stats['local_hits'] += 1
+            return value
+
+        shared_key = REFERENCE_KEY.format(f'{self.name}:{key}')
+        value = cache.get(shared_key)
+        if value is not None:
+            self.stats['shared_hits'] += 1
+        else:
+            self.stats['misses'] += 1
+            with use_primary():
+                value = loader()
+            cache.set(shared_key, value, timeout=self.shared_timeout)
+
+        self._set_local(key, value)
+        return value
+
+    def all(self):
+        """Метод для получения всех записей таблицы"""
+        return self._load('all', lambda: list(self.model.objects.all()))
+
+    def by_pk(self):
+        """Метод для получения словаря записей по первичному ключу"""
+        return self._load('by_pk', lambda: {obj.pk: obj for obj in self.all()})
+
+    def get(self, pk):
+        """Метод для получения записи по первичному ключу"""
+        return self.by_pk().get(pk)
+
+    def get_by_name(self, name):
+        """Метод для получения записи по названию"""
+        return self._load('by_name', lambda: {obj.name: obj for obj in self.all()}).get(name)
+
+    def clear_local(self):
+        """Метод для очистки локального уровня"""
+        with self._lock:
+            self._local.clear()
+
+    def invalidate(self):
+        """Метод для инвалидации кэша во всех процессах после фиксации транзакции"""
+        def invalidate():
+            cache.delete_many([REFERENCE_KEY.format(f'{self.name}:{key}') for key in ('all', 'by_pk', 'by_name')])
+            self.clear_local()
+            publish(REFERENCE_CHANNEL, self.name)
+
+        transaction.on_commit(invalidate)
+
+    @classmethod
+    def handle_invalidation(cls, name):
+        """Метод для сброса локального уровня кэша по уведомлению из другого процесса"""
+        reference_cache = cls.registry.get(name)
+        if reference_cache is not None:
+            reference_cache.clear_local()
+
+    @classmethod
+    def clear_all_local(cls):
+        """Метод для сброса локального уровня всех справочников"""
+        for reference_cache in cls.registry.values():
+            reference_cache.clear_local()
+
+
+subscribe(REFERENCE_CHANNEL, ReferenceCache.handle_invalidation, on_disconnect=ReferenceCache.clear_all_local)
+
+genre_cache = ReferenceCache(Genre)
+country_cache = ReferenceCache(Country)
@@ -0,0 +1,166 @@
+"""Модуль еженедельной рассылки подборки: персональных рекомендаций или медиа с высоким рейтингом"""
+import logging
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from MoviePlatform.db_routing import use_primary
+
+from .caching import cache_lock, get_or_compute
+from .models import DigestDelivery, Movie, TVShow
+from .recommendations import get_recommended_ids, get_recommended_media
+
+logger = logging.getLogger(__name__)
+
+DIGEST_KEY = 'digest:{}'
+DIGEST_CHECKPOINT_KEY = 'digest_checkpoint:{}'
+DIGEST_FANOUT_LOCK = 'digest_fanout:{}'
+# Подборка и прогресс рассылки живут дольше периода, чтобы повторный запуск в том же периоде их застал
+DIGEST_TIMEOUT = 60 * 60 * 24 * 8
+DIGEST_CHUNK_SIZE = 100
+DIGEST_THRESHOLD = 4.0
+DIGEST_PERSONAL_LIMIT = 10
+DIGEST_SUBJECT = 'Ваши рекомендации на неделю'
+DIGEST_FROM_EMAIL = 'noreply@movieplatform.com'
+
+
+def get_digest_period(date=None):
+    """Метод для получения периода рассылки: ISO-неделя вида 2024-W07"""
+    year, week, _ = (date or timezone.localdate()).isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def format_digest(movies, tvshows):
+    """Метод для получения текста подборки из списков пар (название, дата выхода)"""
+    message = "Рекомендуем посмотреть:\n\n"
+    if movies:
+        message += "Фильмы:\n"
+        message += ''.join(f"- {title} ({release_date.year})\n" for title, release_date in movies)
+    if tvshows:
+        message += "\nСериалы:\n"
+        message += ''.join(f"- {title} ({release_date.year})\n" for title, release_date in tvshows)
+    return message
+
+
+def build_digest():
+    """
+    Сборка общей подборки для получателей без персональных рекомендаций. Каждый список читается из базы один раз.
+    Возвращает None, если рекомендовать нечего.
+    """
+    movies = list(Movie.get_high_rated(DIGEST_THRESHOLD).values_list('title', 'release_date'))
+    tvshows = list(TVShow.get_high_rated(DIGEST_THRESHOLD).values_list('title', 'release_date'))
+    if not movies and not tvshows:
+        return None
+
+    return {'message': format_digest(movies, tvshows), 'movie_count': len(movies), 'tvshow_count': len(tvshows)}
+
+
+def build_personal_digests(user_ids):
+    """
+    Сборка персональных подборок по рассчитанным рекомендациям: {ID пользователя: текст}.
+    Медиа всех пользователей части загружаются одним запросом; пользователи без рекомендаций в результат не входят.
+    """
+    recommended = get_recommended_ids(user_ids)
+    media = {
+        obj.pk: obj.as_subtype()
+        for obj in get_recommended_media(list({pk for ids in recommended.values() for pk in ids}))
+    }
+
+    messages = {}
+    for user_id, media_ids in recommended.items():
+        movies, tvshows = [], []
+        for media_id in media_ids[:DIGEST_PERSONAL_LIMIT]:
+            if media_id in media:
+                obj = media[media_id]
+                (movies if isinstance(obj, Movie) else tvshows).append((obj.title, obj.release_date))
+        if movies or tvshows:
+            messages[user_id] = format_digest(movies, tvshows)
+    return messages
+
+
+def get_digest(period):
+    """
+    Метод для получения подборки периода.
+    Подборка собирается один раз и кэшируется, поэтому все части рассылки, в том числе повторные,
+    получают одинаковый текст.
+    """
+    return get_or_compute(DIGEST_KEY.format(period), build_digest, timeout=DIGEST_TIMEOUT)
+
+
+def iter_recipient_chunks(period, chunk_size=DIGEST_CHUNK_SIZE):
+    """
+    Потоковая выборка получателей частями по chunk_size пар (ID, email), по ключу pk > последнего выбранного.
+    Каждая часть — отдельный короткий запрос, курсор не держится открытым, пока часть отправляется.
+    Пропускаются получатели до сохранённой точки продолжения и те, кому подборка за период уже отправлена.
+    """
+    recipients = User.objects.filter(is_active=True).exclude(email='').exclude(
+        digest_deliveries__period=period,
+    ).order_by('pk').values_list('pk', 'email')
+
+    last_pk = cache.get(DIGEST_CHECKPOINT_KEY.format(period), 0)
+    while True:
+        with use_primary():
+            chunk = list(recipients.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1][0]
+
+
+def fan_out_digest(period, dispatch, chunk_size=DIGEST_CHUNK_SIZE):
+    """
+    Распределение рассылки периода по частям; dispatch(period, chunk) отправляет одну часть
+    (ставит задачу Celery или отправляет сразу).
+    После каждой части сохраняется точка продолжения, поэтому прерванная рассылка продолжается с места остановки.
+    Возвращает количество распределённых получателей или None, если рассылку уже распределяет другой процесс.
+    """
+    with cache_lock(DIGEST_FANOUT_LOCK.format(period), timeout=60 * 60) as acquired:
+        if not acquired:
+            return None
+
+        dispatched = 0
+        for chunk in iter_recipient_chunks(period, chunk_size):
+            dispatch(period, chunk)
+            cache.set(DIGEST_CHECKPOINT_KEY.format(period), chunk[-1][0], timeout=DIGEST_TIMEOUT)
+            dispatched += len(chunk)
+        return dispatched
+
+
+def deliver_digest(period, recipients):
+    """
+    Отправка подборки части получателей через одно SMTP-соединение, каждому отдельным письмом:
+    персональной по рекомендациям или общей, если рекомендаций нет.
+    Уже получившие подборку за период пропускаются; отправленные отмечаются даже при ошибке посреди части,
+    поэтому повтор части не дублирует письма. Возвращает количество отправленных писем.
+    """
+    with use_primary():
+        delivered = set(DigestDelivery.objects.filter(
+            period=period, user__in=[pk for pk, _ in recipients],
+        ).values_list('user_id', flat=True))
+
+    pending = [(pk, email) for pk, email in recipients if pk not in delivered]
+    if not pending:
+        return 0
+
+    digest = get_digest(period)
+    messages = build_personal_digests([pk for pk, _ in pending])
+
+    sent = []
+    try:
+        with get_connection() as connection:
+            for pk, email in pending:
+                message = messages.get(pk) or (digest and digest['message'])
+                if not message:
+                    continue
+                EmailMessage(DIGEST_SUBJECT, message, DIGEST_FROM_EMAIL, [email], connection=connection).send()
+                sent.append(pk)
+    finally:
+        DigestDelivery.objects.bulk_create(
+            [DigestDelivery(period=period, user_id=pk) for pk in sent], ignore_conflicts=True,
+        )
+        if sent:
+            logger.info('Подборка %s отправлена %s получателям', period, len(sent))
+
+    return len(sent)
@@ -0,0 +1,113 @@
+"""Команда для замера памяти и скорости отдачи больших файлов медиа"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.views.static import serve
+
+from media.streaming import serve_file
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    """
+    Замер отдачи файла внутри процесса, без сети: весь файл (200), случайные перемотки (206)
+    и та же перемотка через django.views.static.serve, который Range не поддерживает.
+    Файлы создаются разреженными, поэтому многогигабайтный файл не занимает места на диске.
+    Пиковая память — прирост выделений Python за запрос (tracemalloc); для постоянной памяти
+    она не должна зависеть от размера файла.
+    """
+    help = 'Сравнивает память и скорость отдачи больших файлов с диапазонами и без'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument('--size-mb', type=int, default=4096, help='Размер самого большого файла, МБ')
+        parser.add_argument('--seeks', type=int, default=50, help='Количество перемоток')
+        parser.add_argument('--range-mb', type=int, default=1, help='Сколько мегабайт читается после перемотки')
+
+    @staticmethod
+    def consume(response, limit=None):
+        """Метод для чтения тела ответа, не больше limit байт; возвращает количество прочитанных байт"""
+        total = 0
+        for chunk in response.streaming_content if response.streaming else [response.content]:
+            total += len(chunk)
+            if limit is not None and total >= limit:
+                break
+        response.close()
+        return total
+
+    def measure(self, make_request, limit=None):
+        """Метод для замера запросов: (секунды, байт передано, пиковый прирост памяти, коды ответов)"""
+        tracemalloc.start()
+        started = time.perf_counter()
+        transferred, statuses = 0, set()
+        for response in make_request():
+            statuses.add(response.status_code)
+            transferred += self.consume(response, limit)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, transferred, peak, statuses
+
+    def report(self, scenario, size, elapsed, transferred, peak, statuses):
+        """Метод для вывода строки результатов"""
+        self.stdout.write(
+            f'{scenario:<28} {size // MB:>8} {transferred / MB:>12.1f} {transferred / MB / elapsed:>9.0f} '
+            f'{peak / 1024:>10.0f} {",".join(map(str, sorted(statuses))):>7}'
+        )
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        factory = RequestFactory()
+        range_size = options['range_mb'] * MB
+        sizes = sorted({max(options['size_mb'] // 16, options['range_mb'] * 2), options['size_mb']})
+
+        self.stdout.write(
+            f'{"сценарий":<28} {"файл, МБ":>8} {"передано, МБ":>12} {"МБ/с":>9} {"память, КБ":>10} {"коды":>7}'
+        )
+        peaks = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for size_mb in sizes:
+                size = size_mb * MB
+                path = os.path.join(directory, f'video_{size_mb}.mp4')
+                with open(path, 'wb') as file:
+                    file.truncate(size)
+                offsets = [random.randrange(0, size - range_size) for _ in range(options['seeks'])]
+
+                def full():
+                    yield serve_file(factory.get('/'), path)
+
+                def seeks():
+                    for offset in offsets:
+                        yield serve_file(factory.get('/', HTTP_RANGE=f'bytes={offset}-{offset + range_size - 1}'), path)
+
+                def static_seek():
+                    yield serve(
+                        factory.get('/', HTTP_RANGE=f'bytes={offsets[0]}-'), os.path.basename(path),
+                        document_root=directory,
+                    )
+
+                for scenario, make_request, expected in (
+                    ('serve_file, весь файл', full, {200}),
+                    (f'serve_file, {options["seeks"]} перемоток', seeks, {206}),
+                ):
+                    result = self.measure(make_request)
+                    if result[3] != expected:
+                        raise CommandError(f'{scenario}: коды ответов {result[3]}, ожидались {expected}.')
+                    peaks.setdefault(scenario, []).append(result[2])
+                    self.report(scenario, size, *result)
+
+                # static.serve игнорирует Range: чтобы перемотать, клиент качает файл с начала до нужного места
+                self.report('static.serve, 1 перемотка', size, *self.measure(static_seek, offsets[0] + range_size))
+
+        for scenario, values in peaks.items():
+            if values[-1] > 2 * values[0] + MB:
+                raise CommandError(f'{scenario}: память растёт с размером файла ({values[0]} -> {values[-1]} байт).')
+        self.stdout.write(self.style.SUCCESS(
+            f'Пиковая память отдачи не зависит от размера файла: до {max(map(max, peaks.values())) // 1024} КБ.'
+        ))
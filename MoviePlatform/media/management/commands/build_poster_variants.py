@@ -0,0 +1,25 @@
+"""Команда для построения копий постеров уже загруженных медиа"""
+from django.core.management.base import BaseCommand
+
+from media.models import AbstractMedia, Media
+from media.posters import backfill_poster_variants, get_poster_formats
+
+
+class Command(BaseCommand):
+    """
+    Построение копий постеров фильмов, сериалов и других медиа параллельно в пуле процессов:
+    например, после первого развёртывания или изменения размеров и форматов копий.
+    В работе копии строит задача Celery при загрузке постера.
+    """
+    help = 'Строит уменьшенные копии постеров в AVIF, WebP и JPEG'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument('--force', action='store_true', help='Построить копии заново, даже если они уже есть')
+        parser.add_argument('--workers', type=int, default=None, help='Количество процессов (по умолчанию — число ядер)')
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        count = backfill_poster_variants([AbstractMedia, Media], force=options['force'], workers=options['workers'])
+        formats = ', '.join(pil_format for pil_format, *_ in get_poster_formats())
+        self.stdout.write(self.style.SUCCESS(f'Построены копии постеров: {count} медиа, форматы {formats}.'))
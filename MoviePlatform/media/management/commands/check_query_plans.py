@@ -0,0 +1,147 @@
+"""Команда для проверки планов выполнения горячих запросов"""
+import datetime
+import re
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from media.models import Country, Media, Movie, Rating, TVShow
+from media.pagination import KeysetPaginator
+from media.snapshots import HOME_ORDERING, HOME_PAGE_SIZE, HOME_TOP_SIZE, get_home_paginator, get_home_queryset
+
+# build — функция, возвращающая queryset; allowed_scans — таблицы и индексы, полный просмотр которых допустим;
+# indexes — индексы, которые обязаны встретиться в плане
+HotQuery = namedtuple('HotQuery', 'build allowed_scans indexes', defaults=((), ()))
+
+SAMPLE_POSITION = ['2020-01-01', 1]
+
+# SQLite создаёт для ограничения уникальности (media, user) собственный индекс с системным именем
+RATING_MEDIA_USER_INDEX = 'sqlite_autoindex_media_rating_1'
+
+HOT_QUERIES = {
+    'home-movies': HotQuery(
+        lambda: get_home_paginator(get_home_queryset(Movie)).get_queryset(), indexes=('abstractmedia_published_idx',),
+    ),
+    'home-movies-cursor': HotQuery(
+        lambda: get_home_paginator(get_home_queryset(Movie)).get_queryset(SAMPLE_POSITION),
+        indexes=('abstractmedia_published_idx',),
+    ),
+    'home-tvshows': HotQuery(
+        lambda: get_home_paginator(get_home_queryset(TVShow)).get_queryset(), indexes=('abstractmedia_published_idx',),
+    ),
+    'home-tvshows-cursor': HotQuery(
+        lambda: get_home_paginator(get_home_queryset(TVShow)).get_queryset(SAMPLE_POSITION),
+        indexes=('abstractmedia_published_idx',),
+    ),
+    'high-rated-movies': HotQuery(lambda: Movie.get_high_rated()[:HOME_TOP_SIZE]),
+    'high-rated-tvshows': HotQuery(lambda: TVShow.get_high_rated()[:HOME_TOP_SIZE]),
+    'media-list': HotQuery(
+        lambda: KeysetPaginator(Media.objects.filter(rating__gte=1), HOME_ORDERING, HOME_PAGE_SIZE).get_queryset(),
+        indexes=('media_rating_release_idx',),
+    ),
+    'media-top-rated': HotQuery(lambda: Media.objects.top_rated(), indexes=('media_rating_release_idx',)),
+    'rating-by-media-user': HotQuery(lambda: Rating.objects.filter(media=1, user=1), indexes=(RATING_MEDIA_USER_INDEX,)),
+    'media-reviews': HotQuery(lambda: Rating.objects.filter(media=1)),
+    # Условие «оценка пользователя или оценок нет» требует обхода всех фильмов, но оценки ищутся по индексу
+    'movies-for-user': HotQuery(
+        lambda: Movie.objects.filter(Q(rating__user=1) | Q(rating__isnull=True)).order_by('id'),
+        allowed_scans=('media_movie',), indexes=(RATING_MEDIA_USER_INDEX,),
+    ),
+    'movies-by-ids': HotQuery(lambda: Movie.objects.filter(id__in=[1, 2, 3]).order_by('id')),
+    'movies-by-length': HotQuery(lambda: Movie.get_movies_by_length_and_country(), indexes=('movie_length_idx',)),
+    'tvshows-by-seasons': HotQuery(lambda: TVShow.get_tvshows_by_seasons_count_and_country()),
+    'ratings-by-media': HotQuery(lambda: Rating.get_ratings_by_media()),
+}
+
+PLAN_STEP_RE = re.compile(r'\b(SCAN|SEARCH) (\S+)(?: USING (?:COVERING )?INDEX (\S+))?')
+
+
+class Command(BaseCommand):
+    """
+    Проверка планов горячих запросов через EXPLAIN QUERY PLAN.
+    База наполняется синтетическими данными и анализируется (ANALYZE) внутри транзакции,
+    которая затем откатывается. Запрос считается деградировавшим, если план содержит полный просмотр
+    таблицы или индекса, не разрешённый для него, или не использует ожидаемый индекс.
+    """
+    help = 'Проверяет, что горячие запросы не деградировали до полного просмотра таблиц'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument(
+            '--seed', type=int, default=500,
+            help='Количество синтетических фильмов, сериалов и оценок (0 — проверять на текущих данных; '
+                 'на маленьких таблицах SQLite обоснованно выбирает полный просмотр)',
+        )
+        parser.add_argument('--verbose-plan', action='store_true', help='Выводить планы всех запросов')
+
+    @staticmethod
+    def seed(count):
+        """Метод для наполнения базы синтетическими данными"""
+        countries = list(Country.objects.all()) or [Country.objects.create(name='Страна')]
+        users = User.objects.bulk_create([User(username=f'query-plan-{i}') for i in range(max(count // 10, 1))])
+        start = datetime.date(1990, 1, 1)
+
+        media = []
+        for i in range(count):
+            common = {
+                'title': f'Медиа {i}', 'description': f'Описание {i}', 'poster': 'posters/seed.jpg',
+                'release_date': start + datetime.timedelta(days=i * 7),
+                'country': countries[i % len(countries)], 'is_published': i % 10 != 0,
+            }
+            media.append(Movie.objects.create(length=datetime.time(1, i % 60), **common))
+            media.append(TVShow.objects.create(seasons_count=i % 12, **common))
+            Media.objects.create(
+                title=f'Медиа {i}', release_date=common['release_date'], country=common['country'],
+                type='movie', rating=i % 11,
+            )
+
+        Rating.objects.bulk_create([
+            Rating(media=media[i % len(media)], user=users[i % len(users)], rating=i % 5 + 1)
+            for i in range(count * 2)
+        ])
+
+    def explain(self, name, hot_query, verbose):
+        """Метод для получения плана запроса и списка нарушений"""
+        plan = hot_query.build().explain()
+        if verbose:
+            self.stdout.write(f'{name}:\n{plan}')
+
+        problems = []
+        for operation, table, index in PLAN_STEP_RE.findall(plan):
+            if operation == 'SCAN' and not table.startswith('(') and not (
+                {table, index} & set(hot_query.allowed_scans)
+            ):
+                problems.append(f'полный просмотр {table}' + (f' по индексу {index}' if index else ''))
+
+        for index in hot_query.indexes:
+            if index not in plan:
+                problems.append(f'не используется индекс {index}')
+
+        return problems
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        if connection.vendor != 'sqlite':
+            raise CommandError('Проверка планов поддерживается только для SQLite (EXPLAIN QUERY PLAN).')
+
+        failures = []
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            for name, hot_query in HOT_QUERIES.items():
+                problems = self.explain(name, hot_query, options['verbose_plan'])
+                self.stdout.write(f'{name}: {"; ".join(problems) or "OK"}')
+                failures += [f'{name}: {problem}' for problem in problems]
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError('\n'.join(failures))
+
+        self.stdout.write(self.style.SUCCESS('Планы всех горячих запросов используют индексы.'))
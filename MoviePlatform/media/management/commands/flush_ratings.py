@@ -0,0 +1,26 @@
+"""Команда для записи очереди отложенной записи оценок в базу"""
+from django.core.management.base import BaseCommand, CommandError
+
+from media.rating_buffer import RATING_BUFFER_BATCH_SIZE, flush_ratings, get_rating_buffer
+
+
+class Command(BaseCommand):
+    """
+    Запись оценок из очереди сразу, без Celery: например, перед отключением отложенной записи
+    или остановкой обработчиков. В работе очередь записывает задача flush_rating_buffer.
+    """
+    help = 'Записывает оценки из очереди отложенной записи в базу'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument('--batch-size', type=int, default=RATING_BUFFER_BATCH_SIZE, help='Событий в пачке')
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        if get_rating_buffer() is None:
+            raise CommandError('Очередь оценок недоступна: кэш работает не через django-redis.')
+
+        processed = flush_ratings(options['batch_size'])
+        if processed is None:
+            raise CommandError('Очередь оценок уже записывает другой процесс.')
+        self.stdout.write(self.style.SUCCESS(f'Записано событий оценок: {processed}.'))
@@ -0,0 +1,48 @@
+"""Команда для пересчёта и проверки агрегатов рейтинга медиа"""
+from django.core.management.base import BaseCommand, CommandError
+
+from media.models import AbstractMedia, Rating, RATING_AGGREGATE_FIELDS
+
+
+class Command(BaseCommand):
+    """Пересчёт денормализованных агрегатов рейтинга по таблице Rating"""
+    help = 'Пересчитывает сумму, количество, среднее и распределение оценок для медиа'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только проверить агрегаты и завершиться с ошибкой при расхождениях',
+        )
+        parser.add_argument('--media', type=int, nargs='*', help='ID медиа для пересчёта')
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        media_ids = options['media']
+
+        if not options['verify']:
+            changed = AbstractMedia.rebuild_rating_aggregates(media_ids)
+            self.stdout.write(self.style.SUCCESS(f'Пересчитаны агрегаты для {changed} медиа.'))
+            return
+
+        expected = Rating.aggregate_by_media(media_ids)
+        queryset = AbstractMedia.objects.non_polymorphic().only('title', *RATING_AGGREGATE_FIELDS)
+        if media_ids is not None:
+            queryset = queryset.filter(pk__in=media_ids)
+
+        mismatches = 0
+        for media in queryset:
+            values = expected.get(media.pk, Rating.empty_aggregates())
+            diff = {
+                field: (getattr(media, field), value)
+                for field, value in values.items()
+                if getattr(media, field) != value
+            }
+            if diff:
+                mismatches += 1
+                self.stdout.write(f'{media.pk} {media.title}: {diff}')
+
+        if mismatches:
+            raise CommandError(f'Найдено расхождений: {mismatches}')
+
+        self.stdout.write(self.style.SUCCESS('Агрегаты рейтинга согласованы.'))
@@ -0,0 +1,15 @@
+"""Команда для перестройки полнотекстового индекса медиа"""
+from django.core.management.base import BaseCommand
+
+from media.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """Перестройка поискового индекса по названиям и описаниям медиа"""
+    help = 'Перестраивает поисковый индекс медиа (например, после изменения правил нормализации текста)'
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        backend = get_search_backend()
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{type(backend).__name__}: проиндексировано {indexed} медиа.'))
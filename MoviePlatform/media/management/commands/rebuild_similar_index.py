@@ -0,0 +1,20 @@
+"""Команда для перестройки индекса похожих медиа"""
+from django.core.management.base import BaseCommand, CommandError
+
+from media.similar import get_index_dir, similar_index
+
+
+class Command(BaseCommand):
+    """
+    Полная перестройка индекса похожих медиа.
+    В работе индекс обновляется по сигналам изменения медиа и перестраивается раз в сутки задачей Celery.
+    """
+    help = 'Перестраивает индекс похожих медиа (TF-IDF, жанры и страна)'
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        count = similar_index.rebuild()
+        if count is None:
+            raise CommandError('Индекс уже перестраивается другим процессом.')
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано медиа: {count}, каталог {get_index_dir()}.'))
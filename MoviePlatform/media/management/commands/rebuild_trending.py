@@ -0,0 +1,20 @@
+"""Команда для перестройки трендов"""
+from django.core.management.base import BaseCommand
+
+from media.trending import TRENDING_HALF_LIFE, TRENDING_REBUILD_WINDOW, get_trending_backend, rebuild_trending
+
+
+class Command(BaseCommand):
+    """
+    Перестройка трендов по оценкам из базы, например после потери данных Redis или первого запуска.
+    В работе тренды обновляются при каждой записи оценки.
+    """
+    help = 'Перестраивает рейтинги трендов по недавним оценкам'
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        count = rebuild_trending()
+        self.stdout.write(self.style.SUCCESS(
+            f'Учтено оценок: {count} за {TRENDING_REBUILD_WINDOW // TRENDING_HALF_LIFE} периодов полураспада, '
+            f'хранилище {type(get_trending_backend()).__name__}.'
+        ))
@@ -0,0 +1,41 @@
+"""Команда для рассылки еженедельной подборки рекомендаций"""
+from django.core.management.base import BaseCommand, CommandError
+
+from media.digest import DIGEST_CHUNK_SIZE, deliver_digest, fan_out_digest, get_digest_period
+from tasks.tasks import send_digest_chunk
+
+
+class Command(BaseCommand):
+    """
+    Запуск рассылки за период вручную, например для проверки на локальном SMTP (mailhog из docker-compose).
+    Повторный запуск за тот же период продолжает рассылку и не отправляет писем тем, кто их уже получил.
+    """
+    help = 'Рассылает подборку рекомендаций частями по одному SMTP-соединению'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument('--period', help='Период рассылки вида 2024-W07 (по умолчанию текущая неделя)')
+        parser.add_argument('--chunk-size', type=int, default=DIGEST_CHUNK_SIZE, help='Адресов в одной части')
+        parser.add_argument(
+            '--inline', action='store_true', help='Отправлять части в этом процессе, а не через задачи Celery',
+        )
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        period = options['period'] or get_digest_period()
+        sent = []
+
+        def dispatch(chunk_period, chunk):
+            if options['inline']:
+                sent.append(deliver_digest(chunk_period, chunk))
+            else:
+                send_digest_chunk.delay(chunk_period, chunk)
+
+        dispatched = fan_out_digest(period, dispatch, options['chunk_size'])
+        if dispatched is None:
+            raise CommandError(f'Рассылка {period} уже распределяется другим процессом.')
+
+        message = f'Рассылка {period}: получателей распределено {dispatched}'
+        if options['inline']:
+            message += f', писем отправлено {sum(sent)}'
+        self.stdout.write(self.style.SUCCESS(message + '.'))
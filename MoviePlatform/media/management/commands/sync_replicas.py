@@ -0,0 +1,34 @@
+"""Команда для синхронизации реплик базы данных"""
+from django.core.management.base import BaseCommand, CommandError
+
+from MoviePlatform.db_routing import get_replicas, sync_replicas
+
+
+class Command(BaseCommand):
+    """
+    Копирование основной базы SQLite в файлы реплик.
+    Реплики задаются переменной окружения DATABASE_REPLICAS; до первого запуска команды файлов реплик нет.
+    В работе синхронизацию раз в минуту выполняет задача Celery sync_replicas.
+    """
+    help = 'Копирует основную базу SQLite в файлы реплик для чтения'
+
+    def add_arguments(self, parser):
+        """Аргументы команды"""
+        parser.add_argument('aliases', nargs='*', help='Псевдонимы реплик (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        """Точка входа команды"""
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError('Реплики не настроены: задайте DATABASE_REPLICAS.')
+
+        unknown = set(options['aliases']) - set(replicas)
+        if unknown:
+            raise CommandError(f'Неизвестные реплики: {", ".join(sorted(unknown))}')
+
+        try:
+            aliases = sync_replicas(options['aliases'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(f'Синхронизировано реплик: {", ".join(aliases)}.'))
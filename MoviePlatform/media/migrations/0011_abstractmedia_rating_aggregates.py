@@ -0,0 +1,71 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:07
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    """Заполнение агрегатов рейтинга по существующим оценкам"""
+    AbstractMedia = apps.get_model('media', 'AbstractMedia')
+    Rating = apps.get_model('media', 'Rating')
+
+    rows = Rating.objects.filter(media__isnull=False).values('media').annotate(
+        rating_sum=Sum('rating'),
+        rating_count=Count('id'),
+        **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+    )
+    for row in rows:
+        media_id = row.pop('media')
+        row['average_rating'] = row['rating_sum'] / row['rating_count']
+        AbstractMedia.objects.filter(pk=media_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0010_alter_media_options_abstractmedia_is_published_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='average_rating',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «1»'),
+        ),
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «2»'),
+        ),
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «3»'),
+        ),
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «4»'),
+        ),
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «5»'),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('media', '0012_media_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='abstractmedia',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['polymorphic_ctype', '-release_date', '-id'], name='abstractmedia_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['rating', 'release_date'], name='media_rating_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['length'], name='movie_length_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['media', 'user'], name='rating_media_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tvshow',
+            index=models.Index(fields=['seasons_count'], name='tvshow_seasons_count_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def remove_duplicate_ratings(apps, schema_editor):
+    """
+    Удаление повторных оценок пользователя одного медиа перед созданием ограничения уникальности.
+    Остаётся последняя оценка, агрегаты затронутых медиа пересчитываются.
+    """
+    AbstractMedia = apps.get_model('media', 'AbstractMedia')
+    Rating = apps.get_model('media', 'Rating')
+
+    duplicates = Rating.objects.filter(media__isnull=False).values('media', 'user').annotate(
+        last_id=Max('id'), count=Count('id'),
+    ).filter(count__gt=1)
+
+    media_ids = set()
+    for row in duplicates:
+        Rating.objects.filter(media=row['media'], user=row['user']).exclude(pk=row['last_id']).delete()
+        media_ids.add(row['media'])
+
+    rows = Rating.objects.filter(media__in=media_ids).values('media').annotate(
+        rating_sum=Sum('rating'),
+        rating_count=Count('id'),
+        **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+    )
+    for row in rows:
+        media_id = row.pop('media')
+        row['average_rating'] = row['rating_sum'] / row['rating_count']
+        AbstractMedia.objects.filter(pk=media_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0013_query_plan_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='rating',
+            name='rating_media_user_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('media', 'user'), name='rating_media_user_unique'),
+        ),
+    ]
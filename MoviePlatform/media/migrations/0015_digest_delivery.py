@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0014_rating_unique_user_media'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=10, verbose_name='Период')),
+                ('sent_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата отправки')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='digest_deliveries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Отправка подборки',
+                'verbose_name_plural': 'Отправки подборки',
+                'constraints': [models.UniqueConstraint(fields=('period', 'user'), name='digest_delivery_period_user_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0015_digest_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='rated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата оценки'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0016_rating_rated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='abstractmedia',
+            name='poster_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Копии постера'),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='poster_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
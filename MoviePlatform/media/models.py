@@ -1,7 +1,10 @@
 """Модели приложения media"""
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
-from django.db.models import Avg, Q
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.dispatch import Signal
 from django.urls.base import reverse
 from django.utils import timezone
 
@@ -15,6 +18,21 @@ MEDIA_TYPE_CHOICES = [
     ('tvshow', 'TV Show'),
 ]
 
+# Обратные связи один-к-одному от AbstractMedia к таблицам подтипов
+MEDIA_SUBTYPE_RELATIONS = ('movie', 'tvshow')
+
+RATING_STARS = range(1, 6)
+
+RATING_AGGREGATE_FIELDS = [
+    'rating_sum', 'rating_count', 'average_rating',
+    *[f'stars_{star}' for star in RATING_STARS],
+]
+
+# Массовая запись оценок идёт мимо post_save, поэтому кэши сбрасываются по этому сигналу
+# (аргументы media_ids, ratings — список пар (ID медиа, оценка) изменившихся оценок
+# и previous — список (ID медиа, прежняя оценка, прежнее время оценки) для изменённых, а не созданных оценок)
+ratings_bulk_upserted = Signal()
+
 
 class MediaManager(models.Manager):
     def top_rated(self):
@@ -58,6 +76,7 @@ class Media(models.Model):
     genres = models.ManyToManyField(Genre, through='MediaGenre')
     type = models.CharField(max_length=10, choices=MEDIA_TYPE_CHOICES)
     poster = models.ImageField(upload_to='media_posters/', blank=True, null=True)
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False)
     rating = models.IntegerField(default=0, validators=[validate_rating], blank=True, null=True)
     file = models.FileField(upload_to='media_files/', blank=True, null=True)
     url = models.URLField(blank=True, null=True)
@@ -68,6 +87,9 @@ class Media(models.Model):
         ordering = ['-release_date']
         verbose_name = 'Другое медиа'
         verbose_name_plural = 'Другие медиа'
+        indexes = [
+            models.Index(fields=['rating', 'release_date'], name='media_rating_release_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -100,11 +122,21 @@ class AbstractMedia(PolymorphicModel):
     title = models.CharField(max_length=100, verbose_name='Название', validators=[validate_title])
     description = models.TextField(verbose_name='Описание')
     poster = models.ImageField(upload_to='posters/', verbose_name='Постер')
+    poster_variants = models.JSONField(verbose_name='Копии постера', default=dict, blank=True, editable=False)
     release_date = models.DateField(verbose_name='Дата выхода', validators=[release_date_validator])
     country = models.ForeignKey(Country, on_delete=models.CASCADE, verbose_name='Страна')
     genres = models.ManyToManyField(Genre, verbose_name='Жанры')
     is_published = models.BooleanField(verbose_name='Опубликовано', default=True)
 
+    rating_sum = models.PositiveIntegerField(verbose_name='Сумма оценок', default=0, editable=False)
+    rating_count = models.PositiveIntegerField(verbose_name='Количество оценок', default=0, editable=False)
+    average_rating = models.FloatField(verbose_name='Средняя оценка', default=0, editable=False, db_index=True)
+    stars_1 = models.PositiveIntegerField(verbose_name='Оценок «1»', default=0, editable=False)
+    stars_2 = models.PositiveIntegerField(verbose_name='Оценок «2»', default=0, editable=False)
+    stars_3 = models.PositiveIntegerField(verbose_name='Оценок «3»', default=0, editable=False)
+    stars_4 = models.PositiveIntegerField(verbose_name='Оценок «4»', default=0, editable=False)
+    stars_5 = models.PositiveIntegerField(verbose_name='Оценок «5»', default=0, editable=False)
+
     def __str__(self):
         """Строковое представление объекта"""
         return self.title
@@ -113,15 +145,100 @@ class AbstractMedia(PolymorphicModel):
         """Метод для получения типа медиа"""
         return ContentType.objects.get_for_model(self)
 
+    @classmethod
+    def catalog(cls):
+        """
+        Метод для получения медиа всех типов одним запросом.
+        Таблицы подтипов присоединяются через LEFT JOIN, а не загружаются отдельным запросом
+        на каждый подтип, как в полиморфном queryset; конкретный объект возвращает as_subtype().
+        """
+        return cls.objects.non_polymorphic().select_related(*MEDIA_SUBTYPE_RELATIONS)
+
+    def as_subtype(self):
+        """Метод для получения фильма или сериала из объекта, загруженного через catalog(), без запросов"""
+        if type(self) is not AbstractMedia:
+            return self
+
+        # django-polymorphic подменяет обратные связи на подтипы свойствами с запросом,
+        # поэтому присоединённый select_related объект читается из кеша поля
+        for relation in MEDIA_SUBTYPE_RELATIONS:
+            subtype = self._meta.get_field(relation).get_cached_value(self, default=None)
+            if subtype is not None:
+                if hasattr(self, '_prefetched_objects_cache'):
+                    subtype._prefetched_objects_cache = self._prefetched_objects_cache
+                return subtype
+
+        return self
+
+    def get_rating_histogram(self):
+        """Метод для получения распределения оценок по звёздам"""
+        return {star: getattr(self, f'stars_{star}') for star in RATING_STARS}
+
+    @classmethod
+    def apply_rating_delta(cls, media_id, value, sign):
+        """
+        Инкрементальное обновление агрегатов рейтинга медиа.
+        sign = 1 при добавлении оценки, -1 при её удалении.
+        """
+        value = int(value)
+        updates = {
+            'rating_sum': F('rating_sum') + sign * value,
+            'rating_count': F('rating_count') + sign,
+        }
+        if value in RATING_STARS:
+            updates[f'stars_{value}'] = F(f'stars_{value}') + sign
+
+        with transaction.atomic():
+            queryset = AbstractMedia.objects.non_polymorphic().filter(pk=media_id)
+            queryset.update(**updates)
+            queryset.update(average_rating=Case(
+                When(rating_count=0, then=Value(0.0)),
+                default=Cast('rating_sum', FloatField()) / F('rating_count'),
+                output_field=FloatField(),
+            ))
+
+    @classmethod
+    def rebuild_rating_aggregates(cls, media_ids=None):
+        """
+        Полный пересчёт агрегатов рейтинга по таблице Rating.
+        Возвращает количество медиа, у которых агрегаты изменились.
+        """
+        expected = Rating.aggregate_by_media(media_ids)
+        queryset = AbstractMedia.objects.non_polymorphic().only(*RATING_AGGREGATE_FIELDS)
+        if media_ids is not None:
+            queryset = queryset.filter(pk__in=media_ids)
+
+        changed = []
+        with transaction.atomic():
+            for media in queryset.select_for_update():
+                values = expected.get(media.pk, Rating.empty_aggregates())
+                if all(getattr(media, field) == value for field, value in values.items()):
+                    continue
+                for field, value in values.items():
+                    setattr(media, field, value)
+                changed.append(media)
+
+            AbstractMedia.objects.non_polymorphic().bulk_update(changed, RATING_AGGREGATE_FIELDS, batch_size=500)
+
+        return len(changed)
+
     class Meta:
         """Метаданные модели"""
         verbose_name = 'Медиа'
         verbose_name_plural = 'Медиа'
+        indexes = [
+            # Главная страница: опубликованные медиа одного типа, новые первыми (keyset по release_date, id).
+            # Частичный индекс, так как фильтр is_published=True в SQLite компилируется в WHERE без сравнения
+            models.Index(
+                fields=['polymorphic_ctype', '-release_date', '-id'], condition=Q(is_published=True),
+                name='abstractmedia_published_idx',
+            ),
+        ]
 
 
 class Movie(AbstractMedia):
     """Модель для фильма"""
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=[*RATING_AGGREGATE_FIELDS, 'poster_variants'])
     length = models.TimeField(verbose_name='Продолжительность')
 
     def get_media_type(self):
@@ -133,23 +250,21 @@ class Movie(AbstractMedia):
         """
         Получение фильмов с высоким средним рейтингом.
         """
-        return cls.objects.annotate(
-            average_rating=Avg('abstractmedia_ptr__rating__rating')
-        ).filter(average_rating__gt=threshold)
+        return cls.objects.filter(average_rating__gt=threshold).order_by('-average_rating', 'id')
 
     @classmethod
     def get_movies_by_length_and_country(cls, max_length="02:00:00", exclude_country="USA"):
         """
-        Получение фильмов, длина которых меньше указанной и страна не указана.
+        Получение фильмов, длина которых меньше указанной, кроме фильмов указанной страны.
         """
         return cls.objects.select_related('country').filter(
             Q(length__lt=max_length) &
-            ~Q(country__name=exclude_country) | Q(country=None)
+            ~Q(country__name=exclude_country)
         )
 
     def get_average_rating(self):
         """Метод для получения среднего рейтинга"""
-        return self.rating_set.aggregate(Avg('rating'))['rating__avg']
+        return self.average_rating if self.rating_count else None
 
     def reviews(self):
         """Метод для получения отзывов"""
@@ -163,11 +278,14 @@ class Movie(AbstractMedia):
         """Метаданные модели"""
         verbose_name = 'Фильм'
         verbose_name_plural = 'Фильмы'
+        indexes = [
+            models.Index(fields=['length'], name='movie_length_idx'),
+        ]
 
 
 class TVShow(AbstractMedia):
     """Модель для сериала"""
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=[*RATING_AGGREGATE_FIELDS, 'poster_variants'])
     seasons_count = models.PositiveIntegerField(verbose_name='Количество сезонов')
 
     @classmethod
@@ -175,9 +293,7 @@ class TVShow(AbstractMedia):
         """
         Получение сериалов с высоким средним рейтингом.
         """
-        return cls.objects.annotate(
-            average_rating=Avg('abstractmedia_ptr__rating__rating')
-        ).filter(average_rating__gt=threshold)
+        return cls.objects.filter(average_rating__gt=threshold).order_by('-average_rating', 'id')
 
     @classmethod
     def get_tvshows_by_seasons_count_and_country(cls, min_seasons_count=5, country='США'):
@@ -191,7 +307,7 @@ class TVShow(AbstractMedia):
 
     def get_average_rating(self):
         """Метод для получения среднего рейтинга"""
-        return self.rating_set.aggregate(Avg('rating'))['rating__avg']
+        return self.average_rating if self.rating_count else None
 
     def get_media_type(self):
         """Метод для получения типа медиа"""
@@ -209,6 +325,9 @@ class TVShow(AbstractMedia):
         """Метаданные модели"""
         verbose_name = 'Сериал'
         verbose_name_plural = 'Сериалы'
+        indexes = [
+            models.Index(fields=['seasons_count'], name='tvshow_seasons_count_idx'),
+        ]
 
 
 class Rating(models.Model):
@@ -224,6 +343,7 @@ class Rating(models.Model):
         verbose_name='Медиа',
         blank=True, null=True
     )
+    rated_at = models.DateTimeField(verbose_name='Дата оценки', auto_now=True, db_index=True)
 
     @classmethod
     def get_ratings_by_media(cls, rating_range=(1, 2), country='США', title_contains='а'):
@@ -236,6 +356,120 @@ class Rating(models.Model):
             Q(media__title__icontains=title_contains)
         )
 
+    @staticmethod
+    def empty_aggregates():
+        """Агрегаты рейтинга для медиа без оценок"""
+        return {field: 0 for field in RATING_AGGREGATE_FIELDS}
+
+    @classmethod
+    def aggregate_by_media(cls, media_ids=None):
+        """
+        Подсчёт суммы, количества, среднего и распределения оценок по медиа.
+        """
+        queryset = cls.objects.filter(media__isnull=False)
+        if media_ids is not None:
+            queryset = queryset.filter(media__in=media_ids)
+
+        rows = queryset.values('media').annotate(
+            rating_sum=Sum('rating'),
+            rating_count=Count('id'),
+            **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in RATING_STARS},
+        )
+
+        aggregates = {}
+        for row in rows:
+            media_id = row.pop('media')
+            row['average_rating'] = row['rating_sum'] / row['rating_count']
+            aggregates[media_id] = row
+
+        return aggregates
+
+    def _lock_stored(self):
+        """
+        Метод для чтения сохранённых медиа, оценки и времени оценки с блокировкой строки до конца транзакции;
+        None для несохранённой оценки. В SQLite блокировку даёт транзакция IMMEDIATE, select_for_update там пуст.
+        """
+        if not self.pk:
+            return None
+        return Rating.objects.select_for_update().filter(pk=self.pk).values_list(
+            'media_id', 'rating', 'rated_at',
+        ).first()
+
+    def save(self, *args, **kwargs):
+        """
+        Сохранение оценки в одной транзакции с агрегатами медиа.
+        Прежние медиа и оценка читаются в той же транзакции до записи, поэтому параллельное изменение
+        той же оценки не может вклиниться между чтением и записью и сбить агрегаты.
+        """
+        with transaction.atomic():
+            stored = self._lock_stored()
+            self._previous_rating = stored[:2] if stored else None
+            self._previous_rated_at = stored[2] if stored else None
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """
+        Удаление оценки в одной транзакции с агрегатами медиа.
+        Агрегаты уменьшаются на сохранённую в базе оценку, а не на значение из, возможно, устаревшего объекта.
+        """
+        with transaction.atomic():
+            stored = self._lock_stored()
+            if stored:
+                self.media_id, self.rating = stored[:2]
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def bulk_upsert(cls, user, ratings, batch_size=500):
+        """
+        Массовое добавление и изменение оценок пользователя; ratings — словарь {ID медиа: оценка}.
+        Возвращает количество созданных и изменённых оценок.
+        """
+        return cls.upsert_votes(
+            {(user.pk, media_id): rating for media_id, rating in ratings.items()}, batch_size=batch_size,
+        )
+
+    @classmethod
+    def upsert_votes(cls, votes, batch_size=500):
+        """
+        Массовое добавление и изменение оценок нескольких пользователей; votes — словарь
+        {(ID пользователя, ID медиа): оценка}.
+        Изменившиеся оценки записываются через INSERT ... ON CONFLICT DO UPDATE по ограничению уникальности,
+        агрегаты пересчитываются один раз на каждое затронутое медиа.
+        Возвращает количество созданных и изменённых оценок.
+        """
+        with transaction.atomic():
+            existing = {
+                (user_id, media_id): (rating, rated_at)
+                for user_id, media_id, rating, rated_at in cls.objects.filter(
+                    user__in={user_id for user_id, _ in votes}, media__in={media_id for _, media_id in votes},
+                ).values_list('user_id', 'media_id', 'rating', 'rated_at')
+            }
+            changed = {key: rating for key, rating in votes.items() if existing.get(key, (None,))[0] != rating}
+            if not changed:
+                return 0, 0
+
+            cls.objects.bulk_create(
+                [
+                    cls(user_id=user_id, media_id=media_id, rating=rating)
+                    for (user_id, media_id), rating in changed.items()
+                ],
+                update_conflicts=True, unique_fields=['media', 'user'], update_fields=['rating', 'rated_at'],
+                batch_size=batch_size,
+            )
+            media_ids = list({media_id for _, media_id in changed})
+            AbstractMedia.rebuild_rating_aggregates(media_ids)
+            ratings_bulk_upserted.send(
+                sender=cls, media_ids=media_ids,
+                ratings=[(media_id, rating) for (_, media_id), rating in changed.items()],
+                previous=[
+                    (media_id, *existing[user_id, media_id]) for user_id, media_id in changed
+                    if (user_id, media_id) in existing
+                ],
+            )
+
+        created = len(changed.keys() - existing.keys())
+        return created, len(changed) - created
+
     def __str__(self):
         """Строковое представление объекта"""
         return f"{self.user} - {self.media} - {self.rating}"
@@ -244,3 +478,31 @@ class Rating(models.Model):
         """Метаданные модели"""
         verbose_name = 'Рейтинг'
         verbose_name_plural = 'Рейтинги'
+        constraints = [
+            # Одна оценка пользователя на медиа; индекс ограничения обслуживает и выборку оценок медиа
+            models.UniqueConstraint(fields=['media', 'user'], name='rating_media_user_unique'),
+        ]
+
+
+class DigestDelivery(models.Model):
+    """Модель отметки об отправке подборки рекомендаций пользователю за период"""
+    period = models.CharField(max_length=10, verbose_name='Период')
+    user = models.ForeignKey(
+        'auth.User', on_delete=models.CASCADE,
+        related_name='digest_deliveries',
+        verbose_name='Пользователь'
+    )
+    sent_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата отправки')
+
+    def __str__(self):
+        """Строковое представление объекта"""
+        return f"{self.user} - {self.period}"
+
+    class Meta:
+        """Метаданные модели"""
+        verbose_name = 'Отправка подборки'
+        verbose_name_plural = 'Отправки подборки'
+        constraints = [
+            # Повторная отправка за тот же период невозможна; индекс обслуживает и исключение получателей
+            models.UniqueConstraint(fields=['period', 'user'], name='digest_delivery_period_user_unique'),
+        ]
@@ -0,0 +1,149 @@
+"""Модуль keyset-пагинации (пагинации по курсору)"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    """Исключение для повреждённого или чужого курсора"""
+
+
+def encode_cursor(position, reverse=False):
+    """Метод для кодирования позиции в непрозрачный курсор"""
+    payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Метод для декодирования курсора в позицию и направление"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()))
+        return list(payload['p']), bool(payload['r'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Неверный курсор.')
+
+
+class KeysetPage:
+    """Страница keyset-пагинации"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        """Есть ли следующая страница"""
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        """Есть ли предыдущая страница"""
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу сортировки вместо OFFSET.
+    Последнее поле сортировки должно быть уникальным (обычно id), тогда порядок стабилен
+    при вставках, а каждая страница — это индексируемый диапазон без COUNT(*).
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+
+    @staticmethod
+    def _reverse_ordering(ordering):
+        """Метод для разворота направления сортировки"""
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    def _get_position(self, obj):
+        """Метод для получения позиции объекта в сортировке"""
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def _parse_position(self, position):
+        """Метод для приведения значений позиции из курсора к типам полей модели"""
+        if len(position) != len(self.ordering):
+            raise InvalidCursor('Неверный курсор.')
+
+        opts = self.queryset.model._meta
+        values = []
+        for field, value in zip(self.ordering, position):
+            try:
+                values.append(opts.get_field(field.lstrip('-')).to_python(value))
+            except FieldDoesNotExist:
+                # Аннотации (например, место в поисковой выдаче) хранятся в курсоре как есть
+                values.append(value)
+            except ValidationError:
+                raise InvalidCursor('Неверный курсор.')
+        return values
+
+    @staticmethod
+    def _after(position, ordering):
+        """
+        Метод для построения условия «строго после позиции» в заданной сортировке.
+        Нестрогая граница по первому полю дублирует условие, но без неё SQLite не может
+        начать чтение индекса с позиции курсора из-за OR и просматривает его с начала.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+
+        if len(ordering) > 1:
+            first = ordering[0]
+            condition &= Q(**{f'{first.lstrip("-")}__{"lte" if first.startswith("-") else "gte"}': position[0]})
+        return condition
+
+    def get_queryset(self, position=None, reverse=False):
+        """Метод для получения запроса страницы: на одну строку больше размера страницы после позиции"""
+        ordering = self._reverse_ordering(self.ordering) if reverse else self.ordering
+
+        queryset = self.queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(self._parse_position(position), ordering))
+
+        return queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        """Метод для получения страницы по курсору; без курсора возвращается первая страница"""
+        position, reverse = decode_cursor(cursor) if cursor else (None, False)
+        return self._make_page(list(self.get_queryset(position, reverse)), position, reverse)
+
+    async def apage(self, cursor=None):
+        """Асинхронный вариант page() для асинхронных представлений"""
+        position, reverse = decode_cursor(cursor) if cursor else (None, False)
+        return self._make_page([obj async for obj in self.get_queryset(position, reverse)], position, reverse)
+
+    def _make_page(self, objects, position, reverse):
+        """Метод для сборки страницы и курсоров соседних страниц из строк, прочитанных после позиции"""
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if reverse:
+            objects.reverse()
+
+        next_cursor = previous_cursor = None
+        if objects:
+            first, last = self._get_position(objects[0]), self._get_position(objects[-1])
+            if reverse:
+                next_cursor = encode_cursor(last)
+                previous_cursor = encode_cursor(first, reverse=True) if has_more else None
+            else:
+                next_cursor = encode_cursor(last) if has_more else None
+                previous_cursor = encode_cursor(first, reverse=True) if position is not None else None
+
+        return KeysetPage(objects, next_cursor, previous_cursor)
@@ -0,0 +1,218 @@
+"""
+Модуль производных постеров: уменьшенные копии фиксированной ширины в AVIF (если Pillow его поддерживает),
+WebP и JPEG для старых браузеров.
+Имя файла копии — хеш её содержимого, поэтому файл никогда не меняется и может отдаваться с
+Cache-Control: public, max-age=31536000, immutable. Ширина, высота и имена копий хранятся в поле
+poster_variants медиа, и карточки строят srcset без обращения к хранилищу.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .caching import bump_object_version
+from .models import AbstractMedia
+
+logger = logging.getLogger(__name__)
+
+POSTER_VARIANTS_DIR = 'poster_variants/'
+# Карточки занимают 150–420 CSS-пикселей, страница медиа — до 500 по высоте; с запасом на экраны 2x и 3x
+POSTER_WIDTHS = (160, 320, 640, 960)
+POSTER_HASH_LENGTH = 20
+# Форматы в порядке предпочтения: (формат Pillow, MIME-тип, расширение, параметры сохранения)
+POSTER_FORMATS = [
+    ('AVIF', 'image/avif', 'avif', {'quality': 55}),
+    ('WEBP', 'image/webp', 'webp', {'quality': 75}),
+    ('JPEG', 'image/jpeg', 'jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+]
+# Формат для <img>, его понимают все браузеры
+POSTER_FALLBACK_FORMAT = 'JPEG'
+
+
+def get_poster_formats():
+    """Метод для получения форматов, которые умеет сохранять установленный Pillow"""
+    Image.init()
+    return [poster_format for poster_format in POSTER_FORMATS if poster_format[0] in Image.SAVE]
+
+
+def get_storage_url(name):
+    """
+    Метод для получения адреса файла хранилища.
+    MEDIA_ROOT лежит внутри каталога статики, поэтому файлы отдаются под STATIC_URL, как и оригиналы постеров.
+    """
+    return settings.STATIC_URL.rstrip('/') + default_storage.url(name)
+
+
+def save_variant(image, poster_format, options):
+    """Метод для сохранения копии под именем из хеша содержимого; повторное сохранение той же копии не пишет файл"""
+    pil_format, _, extension, save_options = poster_format
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **save_options, **options)
+    content = buffer.getvalue()
+
+    name = f'{POSTER_VARIANTS_DIR}{hashlib.sha256(content).hexdigest()[:POSTER_HASH_LENGTH]}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def render_poster_variants(name, widths=POSTER_WIDTHS):
+    """
+    Построение копий постера name из хранилища.
+    Копии шире оригинала не создаются; каждая следующая уменьшается из предыдущей, а не из оригинала.
+    Возвращает словарь {source, width, height, variants: {формат: [[ширина, высота, имя], ...]}},
+    где width и height — размеры самой большой копии, или None, если файла нет или это не изображение.
+    """
+    try:
+        with default_storage.open(name, 'rb') as file:
+            image = Image.open(file)
+            # Декодер JPEG сразу уменьшает изображение кратно двум, не меньше самой большой копии
+            image.draft('RGB', (max(widths), max(widths)))
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning('Не удалось открыть постер %s: %s', name, exc)
+        return None
+
+    icc_profile = image.info.get('icc_profile') if image.mode in ('RGB', 'RGBA') else None
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    image = image.convert('RGB')
+    source_width, source_height = image.size
+
+    variants = {}
+    formats = get_poster_formats()
+    for width in sorted({min(width, source_width) for width in widths}, reverse=True):
+        height = max(1, round(source_height * width / source_width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for poster_format in formats:
+            variants.setdefault(poster_format[0], []).insert(
+                0, [width, height, save_variant(image, poster_format, options)],
+            )
+
+    largest_width, largest_height, _ = next(iter(variants.values()))[-1]
+    return {'source': name, 'width': largest_width, 'height': largest_height, 'variants': variants}
+
+
+def store_poster_variants(model, pk, variants):
+    """
+    Сохранение копий в медиа, если его постер не сменился, пока копии строились.
+    Запись идёт через update(), без сигналов сохранения; карточка медиа перерисовывается по новой версии объекта.
+    """
+    updated = model._base_manager.filter(pk=pk, poster=variants['source']).update(poster_variants=variants)
+    if updated and issubclass(model, AbstractMedia):
+        bump_object_version(pk)
+    return bool(updated)
+
+
+def build_poster_variants(model_label, pk):
+    """Метод для построения и сохранения копий постера медиа; возвращает True, если копии сохранены"""
+    model = apps.get_model(model_label)
+    name = model._base_manager.filter(pk=pk).values_list('poster', flat=True).first()
+    if not name:
+        return False
+
+    variants = render_poster_variants(name)
+    return variants is not None and store_poster_variants(model, pk, variants)
+
+
+def schedule_poster_variants(instance):
+    """
+    Метод для построения копий постера после фиксации транзакции, если постер загружен или заменён.
+    Снятый постер сразу убирает копии из медиа.
+    """
+    name = instance.poster.name if instance.poster else ''
+    if name == (instance.poster_variants or {}).get('source', ''):
+        return
+
+    model = type(instance)
+    if not name:
+        model._base_manager.filter(pk=instance.pk).update(poster_variants={})
+        return
+
+    model_label = model._meta.label_lower
+
+    def schedule():
+        from tasks.tasks import build_poster_variants as build_poster_variants_task
+
+        build_poster_variants_task.delay(model_label, instance.pk)
+
+    transaction.on_commit(schedule, robust=True)
+
+
+def _render_job(job):
+    """Построение копий одного постера в процессе пула"""
+    model_label, pk, name = job
+    return model_label, pk, render_poster_variants(name)
+
+
+def backfill_poster_variants(models, force=False, workers=None):
+    """
+    Построение копий постеров уже загруженных медиа параллельно в пуле процессов.
+    По умолчанию пропускаются медиа, у которых копии текущего постера уже есть; force строит их заново.
+    Возвращает количество медиа с сохранёнными копиями.
+    """
+    jobs = []
+    for model in models:
+        rows = model._base_manager.exclude(poster='').exclude(poster__isnull=True).values_list(
+            'pk', 'poster', 'poster_variants',
+        )
+        jobs += [
+            (model._meta.label_lower, pk, name) for pk, name, variants in rows
+            if force or (variants or {}).get('source') != name
+        ]
+    if not jobs:
+        return 0
+
+    def store(results):
+        return sum(
+            store_poster_variants(apps.get_model(label), pk, variants) for label, pk, variants in results if variants
+        )
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers == 1:
+        return store(map(_render_job, jobs))
+
+    # Процессы пула настраивают Django сами: при запуске через spawn или forkserver настройки не наследуются
+    with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+        return store(pool.map(_render_job, jobs))
+
+
+def get_poster_context(media):
+    """
+    Метод для получения данных постера для шаблона: адрес оригинала, размеры и srcset каждого формата.
+    Пока копий нет, возвращается только адрес оригинала.
+    """
+    if not media.poster:
+        return None
+
+    variants = getattr(media, 'poster_variants', None) or {}
+    if variants.get('source') != media.poster.name:
+        return {'src': get_storage_url(media.poster.name), 'sources': [], 'srcset': '', 'width': None, 'height': None}
+
+    formats = {pil_format: mime_type for pil_format, mime_type, _, _ in POSTER_FORMATS}
+    srcsets = {
+        pil_format: ', '.join(f'{get_storage_url(name)} {width}w' for width, _, name in items)
+        for pil_format, items in variants['variants'].items()
+    }
+    fallback = variants['variants'].get(POSTER_FALLBACK_FORMAT) or next(iter(variants['variants'].values()))
+    # Запасной src — копия средней ширины, её выбирают браузеры без поддержки srcset
+    _, _, fallback_name = fallback[len(fallback) // 2]
+    return {
+        'src': get_storage_url(fallback_name),
+        'srcset': srcsets.get(POSTER_FALLBACK_FORMAT, ''),
+        'sources': [
+            (formats[pil_format], srcset) for pil_format, srcset in srcsets.items()
+            if pil_format != POSTER_FALLBACK_FORMAT
+        ],
+        'width': variants['width'],
+        'height': variants['height'],
+    }
@@ -0,0 +1,281 @@
+"""
+Модуль отложенной записи оценок (write-behind).
+
+При включённой настройке RATING_WRITE_BEHIND оценка из формы фильма или сериала не пишется в базу в запросе:
+событие добавляется в поток Redis, и запрос сразу отвечает. Задача Celery flush_rating_buffer читает события
+пачками через группу потребителей, схлопывает повторные оценки пользователя одному медиа до последней
+и записывает пачку одной транзакцией через Rating.upsert_votes — агрегаты пересчитываются один раз на пачку.
+
+Событие подтверждается в потоке только после фиксации транзакции, поэтому оценки переживают падение обработчика:
+неподтверждённые события забирает следующий запуск. Поток хранится на диске вместе с остальными данными Redis (AOF).
+
+Пока оценка в очереди, она лежит в хеше ожидающих оценок пользователя, и страница медиа показывает её автору.
+Событие, забранное повторно после падения обработчика, может оказаться старше уже записанной оценки.
+Поэтому ID последнего записанного события пары хранится в хеше записанных оценок пользователя, и событие
+старше ожидающего или записанного для той же пары отбрасывается, не затирая более новый голос.
+"""
+import functools
+import logging
+import os
+import socket
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from redis.exceptions import ResponseError
+
+from .caching import CHANNEL_PREFIX, cache_lock, get_redis
+from .models import AbstractMedia, Rating
+
+logger = logging.getLogger(__name__)
+
+RATING_BUFFER_STREAM = f'{CHANNEL_PREFIX}ratings:stream'
+RATING_BUFFER_GROUP = 'rating_flush'
+RATING_PENDING_PREFIX = f'{CHANNEL_PREFIX}ratings:pending:'
+RATING_APPLIED_PREFIX = f'{CHANNEL_PREFIX}ratings:applied:'
+RATING_FLUSH_LOCK = 'rating_flush'
+RATING_FLUSH_SCHEDULED_KEY = 'rating_flush_scheduled'
+RATING_BUFFER_BATCH_SIZE = 1000
+# Оценки, поставленные за это время, записываются одной пачкой
+RATING_FLUSH_DELAY = 2
+# Через сколько миллисекунд событие, прочитанное упавшим обработчиком, забирается повторно
+RATING_CLAIM_IDLE = 60 * 1000
+# Ожидающие и записанные оценки пользователя хранятся с запасом на случай, если обработчик долго не запускался
+RATING_PENDING_TIMEOUT = 60 * 60
+
+
+def parse_event_id(event_id):
+    """Метод для разбора ID события потока в пару (миллисекунды, номер) для сравнения"""
+    return tuple(map(int, event_id.split('-')))
+
+
+class RatingBuffer:
+    """
+    Очередь оценок в потоке Redis.
+    Добавление события и отметка ожидающей оценки пользователя выполняются одним Lua-скриптом,
+    как и подтверждение записанных событий со снятием отметок и запоминанием ID записанных событий.
+    """
+    PUSH_SCRIPT = """
+        local id = redis.call('XADD', KEYS[1], '*', 'user', ARGV[1], 'media', ARGV[2], 'rating', ARGV[3])
+        redis.call('HSET', KEYS[2], ARGV[2], id .. ' ' .. ARGV[3])
+        redis.call('EXPIRE', KEYS[2], ARGV[4])
+        return id
+    """
+    ACKNOWLEDGE_SCRIPT = """
+        local count = tonumber(ARGV[2])
+        for index = 3, count + 2 do
+            redis.call('XACK', KEYS[1], ARGV[1], ARGV[index])
+            redis.call('XDEL', KEYS[1], ARGV[index])
+        end
+        local position = count + 4
+        while position <= #ARGV do
+            local key = KEYS[2] .. ARGV[position]
+            local value = redis.call('HGET', key, ARGV[position + 1])
+            -- Отметка снимается, только если после записанного события пользователь не поставил новую оценку
+            if value and string.sub(value, 1, #ARGV[position + 2] + 1) == ARGV[position + 2] .. ' ' then
+                redis.call('HDEL', key, ARGV[position + 1])
+            end
+            local applied = KEYS[3] .. ARGV[position]
+            redis.call('HSET', applied, ARGV[position + 1], ARGV[position + 2])
+            redis.call('EXPIRE', applied, ARGV[3 + count])
+            position = position + 3
+        end
+        return count
+    """
+
+    def __init__(self, redis=None):
+        self.redis = redis or get_redis()
+        self.consumer = f'{socket.gethostname()}:{os.getpid()}'
+        self._push = self.redis.register_script(self.PUSH_SCRIPT)
+        self._acknowledge = self.redis.register_script(self.ACKNOWLEDGE_SCRIPT)
+        self._group_created = False
+
+    def push(self, user_id, media_id, rating):
+        """Метод для добавления оценки в очередь; возвращает ID события"""
+        return self._push(
+            keys=[RATING_BUFFER_STREAM, f'{RATING_PENDING_PREFIX}{user_id}'],
+            args=[user_id, media_id, rating, RATING_PENDING_TIMEOUT],
+        ).decode()
+
+    def get_pending(self, user_id, media_id):
+        """Метод для получения оценки пользователя, ещё не записанной в базу, или None"""
+        value = self.redis.hget(f'{RATING_PENDING_PREFIX}{user_id}', media_id)
+        return int(value.split()[1]) if value else None
+
+    def get_latest_ids(self, pairs):
+        """
+        Метод для получения ID самых новых известных событий по парам (ID пользователя, ID медиа):
+        ожидающего в очереди или последнего записанного в базу. Пары без таких событий в словарь не попадают.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for user_id, media_id in pairs:
+            pipeline.hget(f'{RATING_PENDING_PREFIX}{user_id}', media_id)
+            pipeline.hget(f'{RATING_APPLIED_PREFIX}{user_id}', media_id)
+        values = pipeline.execute()
+
+        latest_ids = {}
+        for pair, pending, applied in zip(pairs, values[::2], values[1::2]):
+            event_ids = [value.split()[0].decode() for value in (pending, applied) if value]
+            if event_ids:
+                latest_ids[pair] = max(event_ids, key=parse_event_id)
+        return latest_ids
+
+    def ensure_group(self):
+        """Метод для создания группы потребителей потока, если её ещё нет"""
+        if self._group_created:
+            return
+        try:
+            self.redis.xgroup_create(RATING_BUFFER_STREAM, RATING_BUFFER_GROUP, id='0', mkstream=True)
+        except ResponseError as exc:
+            if 'BUSYGROUP' not in str(exc):
+                raise
+        self._group_created = True
+
+    def read(self, count=RATING_BUFFER_BATCH_SIZE):
+        """
+        Метод для чтения до count событий: сначала давно не подтверждённые события упавших обработчиков,
+        затем новые. Возвращает список (ID события, ID пользователя, ID медиа, оценка) в порядке добавления.
+        """
+        self.ensure_group()
+        _, messages, *_ = self.redis.xautoclaim(
+            RATING_BUFFER_STREAM, RATING_BUFFER_GROUP, self.consumer,
+            min_idle_time=RATING_CLAIM_IDLE, start_id='0-0', count=count,
+        )
+        if len(messages) < count:
+            for _, entries in self.redis.xreadgroup(
+                RATING_BUFFER_GROUP, self.consumer, {RATING_BUFFER_STREAM: '>'}, count=count - len(messages),
+            ):
+                messages += entries
+
+        events = [
+            (event_id.decode(), int(fields[b'user']), int(fields[b'media']), int(fields[b'rating']))
+            for event_id, fields in messages if fields
+        ]
+        return sorted(events, key=lambda event: parse_event_id(event[0]))
+
+    def acknowledge(self, event_ids, latest):
+        """
+        Метод для подтверждения записанных событий и удаления их из потока.
+        latest — список (ID пользователя, ID медиа, ID события) последних записанных оценок:
+        их отметки снимаются, а ID событий запоминаются как записанные.
+        """
+        args = [RATING_BUFFER_GROUP, len(event_ids), *event_ids, RATING_PENDING_TIMEOUT]
+        for user_id, media_id, event_id in latest:
+            args += [user_id, media_id, event_id]
+        self._acknowledge(keys=[RATING_BUFFER_STREAM, RATING_PENDING_PREFIX, RATING_APPLIED_PREFIX], args=args)
+
+
+@functools.cache
+def get_rating_buffer():
+    """Метод для получения очереди оценок; None, если кэш работает не через django-redis и очереди нет"""
+    redis = get_redis()
+    return RatingBuffer(redis) if redis is not None else None
+
+
+def is_write_behind():
+    """Метод для проверки, включена ли отложенная запись оценок и доступна ли очередь"""
+    return getattr(settings, 'RATING_WRITE_BEHIND', False) and get_rating_buffer() is not None
+
+
+def schedule_rating_flush():
+    """
+    Метод для запуска записи очереди через RATING_FLUSH_DELAY секунд.
+    Пока запуск запланирован, новые оценки новых запусков не ставят и попадают в ту же пачку;
+    если запуск всё же пропущен, очередь запишет ежеминутный запуск по расписанию.
+    """
+    if cache.add(RATING_FLUSH_SCHEDULED_KEY, 1, timeout=RATING_FLUSH_DELAY):
+        from tasks.tasks import flush_rating_buffer
+
+        flush_rating_buffer.apply_async(countdown=RATING_FLUSH_DELAY)
+
+
+def submit_rating(user, media, rating):
+    """Метод для сохранения оценки из формы: в очередь при отложенной записи, иначе сразу в базу"""
+    if not is_write_behind():
+        Rating.objects.update_or_create(media=media, user=user, defaults={'rating': rating})
+        return
+
+    get_rating_buffer().push(user.pk, media.pk, rating)
+    schedule_rating_flush()
+
+
+def apply_pending_rating(reviews, user, media):
+    """
+    Метод для подстановки в отзывы медиа оценки пользователя, ещё не записанной в базу,
+    чтобы автор сразу видел свою оценку. Возвращает список отзывов.
+    """
+    reviews = list(reviews)
+    if not user.is_authenticated or not is_write_behind():
+        return reviews
+
+    pending = get_rating_buffer().get_pending(user.pk, media.pk)
+    if pending is None:
+        return reviews
+
+    for review in reviews:
+        if review.user_id == user.pk:
+            review.rating = pending
+            return reviews
+    return reviews + [Rating(user=user, media=media, rating=pending)]
+
+
+def drop_stale_events(buffer, latest):
+    """
+    Метод для отбрасывания устаревших событий пачки;
+    latest — словарь {(ID пользователя, ID медиа): (ID события, оценка)}.
+    Событие устарело, если для той же пары в очереди ждёт или уже записано более новое событие.
+    """
+    latest_ids = buffer.get_latest_ids(list(latest))
+    return {
+        pair: (event_id, rating) for pair, (event_id, rating) in latest.items()
+        if pair not in latest_ids or parse_event_id(latest_ids[pair]) <= parse_event_id(event_id)
+    }
+
+
+def flush_ratings(batch_size=RATING_BUFFER_BATCH_SIZE):
+    """
+    Метод для записи очереди оценок в базу пачками по batch_size событий.
+    Каждая пачка — одна транзакция: повторные оценки пользователя одному медиа схлопываются до последней,
+    оценки удалённых медиа и пользователей и устаревшие события отбрасываются.
+    Возвращает количество обработанных событий или None, если очередь уже записывает другой процесс.
+    """
+    buffer = get_rating_buffer()
+    if buffer is None:
+        return 0
+
+    with cache_lock(RATING_FLUSH_LOCK, timeout=60 * 5) as acquired:
+        if not acquired:
+            return None
+
+        processed = 0
+        while True:
+            events = buffer.read(batch_size)
+            if not events:
+                return processed
+
+            latest = {}
+            for event_id, user_id, media_id, rating in events:
+                latest[user_id, media_id] = (event_id, rating)
+            latest = drop_stale_events(buffer, latest)
+
+            media_ids = set(AbstractMedia.objects.filter(
+                pk__in={media_id for _, media_id in latest},
+            ).values_list('pk', flat=True))
+            user_ids = set(User.objects.filter(
+                pk__in={user_id for user_id, _ in latest},
+            ).values_list('pk', flat=True))
+            created, updated = Rating.upsert_votes({
+                (user_id, media_id): rating for (user_id, media_id), (_, rating) in latest.items()
+                if user_id in user_ids and media_id in media_ids
+            })
+            buffer.acknowledge(
+                [event_id for event_id, *_ in events],
+                [(user_id, media_id, event_id) for (user_id, media_id), (event_id, _) in latest.items()],
+            )
+            logger.info(
+                'Записано оценок из очереди: %s событий, %s новых, %s изменённых', len(events), created, updated,
+            )
+
+            processed += len(events)
+            if len(events) < batch_size:
+                return processed
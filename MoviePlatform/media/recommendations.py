@@ -0,0 +1,166 @@
+"""
+Модуль персональных рекомендаций: item-item коллаборативная фильтрация по таблице оценок.
+Расчёт выполняется офлайн задачей Celery; для каждого пользователя в кэше хранится массив
+ID лучших K медиа, который читают API и персональная рассылка.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+from django.core.cache import cache
+from scipy import sparse
+
+from .models import AbstractMedia, Rating
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATIONS_KEY = 'recommendations:{}'
+# Пересчёт еженедельный, значения живут чуть дольше, чтобы не пропадать до следующего расчёта
+RECOMMENDATIONS_TIMEOUT = 60 * 60 * 24 * 8
+RECOMMENDATIONS_TOP_K = 20
+# Сколько самых похожих медиа хранится для каждого медиа: матрица сходства остаётся разреженной
+SIMILAR_ITEMS_LIMIT = 50
+USERS_CHUNK_SIZE = 1000
+
+# Матрицы, переданные в процесс пула один раз при его запуске
+_worker_state = {}
+
+
+def load_rating_matrix():
+    """
+    Загрузка оценок в разреженную матрицу пользователи x медиа.
+    Строки читаются потоком и складываются прямо в массив NumPy, без списка кортежей.
+    Возвращает массивы ID пользователей и медиа (индексы строк и столбцов) и матрицу CSR.
+    """
+    rows = Rating.objects.filter(
+        media__isnull=False, media__is_published=True,
+    ).values_list('user_id', 'media_id', 'rating').iterator(chunk_size=10000)
+    data = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 3)
+
+    user_ids, user_index = np.unique(data[:, 0], return_inverse=True)
+    media_ids, media_index = np.unique(data[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (data[:, 2].astype(np.float32), (user_index, media_index)), shape=(len(user_ids), len(media_ids)),
+    )
+    return user_ids, media_ids, matrix
+
+
+def center_ratings(matrix):
+    """
+    Вычитание средней оценки пользователя из его оценок: понравившееся становится положительным,
+    не понравившееся — отрицательным, независимо от того, насколько щедро пользователь ставит оценки.
+    """
+    counts = np.diff(matrix.indptr)
+    means = np.asarray(matrix.sum(axis=1)).ravel() / np.maximum(counts, 1)
+    centered = matrix.copy()
+    centered.data -= np.repeat(means, counts).astype(np.float32)
+    return centered
+
+
+def item_similarity(centered, limit=SIMILAR_ITEMS_LIMIT):
+    """
+    Косинусное сходство медиа по центрированным оценкам.
+    Отрицательные сходства и диагональ отбрасываются, у каждого медиа остаются limit самых похожих.
+    """
+    norms = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=0)).ravel())
+    normalized = centered @ sparse.diags(1 / np.where(norms > 0, norms, 1), format='csr')
+    similarity = (normalized.T @ normalized).tocsr()
+    similarity.setdiag(0)
+    similarity.data[similarity.data < 0] = 0
+    similarity.eliminate_zeros()
+
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if end - start > limit:
+            values = similarity.data[start:end]
+            values[np.argpartition(values, end - start - limit)[:end - start - limit]] = 0
+    similarity.eliminate_zeros()
+    return similarity.astype(np.float32)
+
+
+def top_k(scores, rated, k):
+    """
+    Выбор k лучших столбцов каждой строки плотной матрицы оценок без полной сортировки.
+    Оценённые пользователем медиа и медиа с неположительной оценкой не рекомендуются; недостающие места — -1.
+    """
+    # По структуре, а не по значениям: оценка, равная средней пользователя, после центрирования равна нулю
+    scores[np.repeat(np.arange(rated.shape[0]), np.diff(rated.indptr)), rated.indices] = 0
+    k = min(k, scores.shape[1])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    best = np.take_along_axis(best, order, axis=1)
+    best[np.take_along_axis(best_scores, order, axis=1) <= 0] = -1
+    return best
+
+
+def _init_worker(centered, similarity, k):
+    """Инициализация процесса пула: матрицы передаются один раз, а не с каждой частью"""
+    _worker_state.update(centered=centered, similarity=similarity, k=k)
+
+
+def _score_chunk(start, stop):
+    """Расчёт лучших медиа для пользователей с индексами [start, stop) в процессе пула"""
+    centered = _worker_state['centered'][start:stop]
+    scores = (centered @ _worker_state['similarity']).toarray()
+    return start, top_k(scores, centered, _worker_state['k']).astype(np.int32)
+
+
+def compute_recommendations(k=RECOMMENDATIONS_TOP_K, chunk_size=USERS_CHUNK_SIZE, workers=None):
+    """
+    Расчёт рекомендаций всех пользователей с оценками.
+    Пользователи делятся на части по chunk_size, части считаются параллельно в пуле процессов.
+    Возвращает словарь {ID пользователя: массив int32 ID медиа по убыванию оценки}.
+    """
+    user_ids, media_ids, matrix = load_rating_matrix()
+    if not matrix.nnz:
+        return {}
+
+    centered = center_ratings(matrix)
+    similarity = item_similarity(centered)
+    chunks = [(start, min(start + chunk_size, len(user_ids))) for start in range(0, len(user_ids), chunk_size)]
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+
+    if workers == 1:
+        _init_worker(centered, similarity, k)
+        results = [_score_chunk(*chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(centered, similarity, k)) as pool:
+            results = list(pool.map(_score_chunk, *zip(*chunks)))
+
+    recommendations = {}
+    for start, best in results:
+        for offset, row in enumerate(best):
+            row = row[row >= 0]
+            if len(row):
+                recommendations[int(user_ids[start + offset])] = media_ids[row].astype(np.int32)
+    return recommendations
+
+
+def store_recommendations(recommendations):
+    """Сохранение рекомендаций в кэш: для каждого пользователя — байты массива int32, K * 4 байта"""
+    cache.set_many(
+        {RECOMMENDATIONS_KEY.format(user_id): ids.tobytes() for user_id, ids in recommendations.items()},
+        timeout=RECOMMENDATIONS_TIMEOUT,
+    )
+
+
+def get_recommended_ids(user_ids):
+    """Метод для получения рекомендаций нескольких пользователей одним обращением к кэшу: {ID: [ID медиа]}"""
+    keys = {RECOMMENDATIONS_KEY.format(user_id): user_id for user_id in user_ids}
+    return {
+        keys[key]: np.frombuffer(value, dtype=np.int32).tolist()
+        for key, value in cache.get_many(list(keys)).items()
+    }
+
+
+def get_recommended_media(media_ids, queryset=None):
+    """
+    Метод для загрузки рекомендованных медиа одним запросом в порядке рекомендаций.
+    Снятые с публикации и удалённые после расчёта медиа пропускаются.
+    """
+    queryset = AbstractMedia.catalog() if queryset is None else queryset
+    media = queryset.filter(is_published=True).in_bulk(media_ids)
+    return [media[media_id] for media_id in media_ids if media_id in media]
@@ -0,0 +1,182 @@
+"""Модуль полнотекстового поиска по названиям и описаниям медиа"""
+import functools
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, FloatField, Func, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import AbstractMedia
+from .stemmer import normalize, tokenize
+
+SEARCH_ORDERING = ('search_rank', 'id')
+
+
+class BM25Rank(Func):
+    """
+    Релевантность медиа по BM25 коррелированным подзапросом к таблице FTS5: чем меньше, тем релевантнее.
+    Выражение — путь к ID медиа в модели запроса.
+    """
+    output_field = FloatField()
+
+    def __init__(self, expression, table, match, weights):
+        super().__init__(expression)
+        self.table = table
+        self.match = match
+        self.weights = tuple(weights)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        weights = ', '.join(['%s'] * len(self.weights))
+        return (
+            f'(SELECT bm25({self.table}, {weights}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {sql})',
+            [*self.weights, self.match, *params],
+        )
+
+
+class SearchBackend:
+    """
+    Интерфейс поискового бэкенда.
+    Бэкенд хранит индекс по названию и описанию AbstractMedia и строит условие поиска прямо в запросе,
+    чтобы фильтры и пагинация применялись ко всей выдаче, а не к её усечённому началу.
+    """
+
+    def index(self, media):
+        """Метод для добавления или обновления медиа в индексе"""
+        raise NotImplementedError
+
+    def remove(self, pk):
+        """Метод для удаления медиа из индекса"""
+        raise NotImplementedError
+
+    def match(self, query, lookup='pk'):
+        """
+        Метод для получения условия поиска и выражения релевантности (меньше — релевантнее)
+        для модели, где lookup — путь к ID медиа; None, если в запросе нет слов
+        """
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Метод для полной перестройки индекса; возвращает количество проиндексированных медиа"""
+        raise NotImplementedError
+
+
+class FTS5SearchBackend(SearchBackend):
+    """
+    Поиск через виртуальную таблицу SQLite FTS5 (создаётся миграцией).
+    В индекс кладутся основы слов, поэтому «драконы» находит «дракона»; rowid совпадает с ID медиа.
+    Ранжирование по BM25, совпадение в названии весит больше, чем в описании.
+    """
+    table = 'media_search'
+    title_weight = 10.0
+    description_weight = 1.0
+
+    def index(self, media):
+        """Метод для добавления или обновления медиа в индексе"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [media.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)',
+                [media.pk, normalize(media.title), normalize(media.description)],
+            )
+
+    def remove(self, pk):
+        """Метод для удаления медиа из индекса"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [pk])
+
+    @staticmethod
+    def build_match(query):
+        """
+        Метод для построения выражения MATCH: все слова запроса обязательны,
+        последнее ищется по префиксу, чтобы недописанное слово тоже находилось.
+        """
+        terms = [f'"{term}"' for term in tokenize(query)]
+        if terms:
+            terms[-1] += '*'
+        return ' '.join(terms)
+
+    def match(self, query, lookup='pk'):
+        """
+        Метод для получения условия поиска и выражения релевантности.
+        Подходящие ID выбирает подзапрос к FTS5, а BM25 считается только для строк, прошедших остальные фильтры.
+        """
+        match = self.build_match(query)
+        if not match:
+            return None
+
+        matched = RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match])
+        rank = BM25Rank(F(lookup), self.table, match, (self.title_weight, self.description_weight))
+        return Q(**{f'{lookup}__in': matched}), rank
+
+    def rebuild(self):
+        """Метод для полной перестройки индекса; возвращает количество проиндексированных медиа"""
+        rows = [
+            (pk, normalize(title), normalize(description))
+            for pk, title, description in AbstractMedia.objects.non_polymorphic().values_list(
+                'id', 'title', 'description'
+            ).iterator()
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.executemany(f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)', rows)
+        return len(rows)
+
+
+class SimpleSearchBackend(SearchBackend):
+    """
+    Запасной бэкенд без индекса для баз без FTS5: все слова запроса ищутся через icontains,
+    совпадения в названии идут первыми.
+    """
+
+    def index(self, media):
+        """Индекс не ведётся"""
+
+    def remove(self, pk):
+        """Индекс не ведётся"""
+
+    def match(self, query, lookup='pk'):
+        """Метод для получения условия поиска и выражения релевантности"""
+        words = query.split()
+        if not words:
+            return None
+
+        prefix = '' if lookup == 'pk' else f'{lookup}__'
+        in_title = Q()
+        matches = Q()
+        for word in words:
+            in_title &= Q(**{f'{prefix}title__icontains': word})
+            matches &= Q(**{f'{prefix}title__icontains': word}) | Q(**{f'{prefix}description__icontains': word})
+
+        return matches, Case(When(in_title, then=Value(0)), default=Value(1), output_field=IntegerField())
+
+    def rebuild(self):
+        """Индекс не ведётся"""
+        return 0
+
+
+@functools.cache
+def get_search_backend():
+    """
+    Метод для получения поискового бэкенда из настройки MEDIA_SEARCH_BACKEND.
+    По умолчанию для SQLite используется FTS5, для остальных баз — поиск без индекса.
+    """
+    default = 'media.search.FTS5SearchBackend' if connection.vendor == 'sqlite' else 'media.search.SimpleSearchBackend'
+    return import_string(getattr(settings, 'MEDIA_SEARCH_BACKEND', default))()
+
+
+def search_media(queryset, query, lookup='pk'):
+    """
+    Метод для фильтрации queryset по поисковому запросу.
+    lookup — путь к ID медиа в модели queryset ('pk' для медиа, 'media' для оценок).
+    Каждая строка получает аннотацию search_rank — релевантность медиа (меньше — выше в выдаче), по ней можно
+    сортировать. Условие поиска входит в тот же SQL-запрос, что и остальные фильтры, поэтому выдача не обрезается.
+    """
+    match = get_search_backend().match(query, lookup)
+    if match is None:
+        return queryset.none().annotate(search_rank=Value(0, output_field=IntegerField()))
+
+    condition, rank = match
+    return queryset.filter(condition).annotate(search_rank=rank)
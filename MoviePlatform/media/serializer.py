@@ -1,8 +1,28 @@
-﻿from django.contrib.contenttypes.models import ContentType
-from rest_framework import serializers
+﻿from rest_framework import serializers
 
-from .models import Genre, Country, Movie, TVShow, Rating
-from .validators import validate_title
+from .caching import country_cache
+from .models import AbstractMedia, Genre, Country, Movie, TVShow, Rating, MEDIA_SUBTYPE_RELATIONS
+from .validators import validate_rating, validate_title
+
+RATING_BULK_LIMIT = 5000
+
+
+class EagerLoadingMixin:
+    """
+    Примесь сериализатора, объявляющая связи, которые нужно загрузить заранее.
+    Представления применяют их к queryset, чтобы число запросов не зависело от размера страницы.
+    """
+    select_related_fields = []
+    prefetch_related_fields = []
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Метод для применения select_related/prefetch_related к queryset"""
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
 
 
 class GenreSerializer(serializers.ModelSerializer):
@@ -19,33 +39,120 @@ class CountrySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class CachedCountrySerializer(CountrySerializer):
+    """Сериализатор страны медиа, берущий страну из кэша справочников вместо запроса к базе"""
+
+    def get_attribute(self, instance):
+        """Метод для получения страны по country_id из кэша"""
+        return country_cache.get(instance.country_id) or super().get_attribute(instance)
+
+
+class MovieSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Сериализатор для модели Movie"""
+    select_related_fields = ['country']
+    prefetch_related_fields = ['genres']
+
     title = serializers.CharField(validators=[validate_title])
     genres = GenreSerializer(many=True)
-    country = CountrySerializer()
+    country = CachedCountrySerializer()
 
     class Meta:
         model = Movie
         fields = '__all__'
 
 
-class TVShowSerializer(serializers.ModelSerializer):
+class TVShowSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Сериализатор для модели TVShow"""
+    select_related_fields = ['country']
+    prefetch_related_fields = ['genres']
+
     title = serializers.CharField(validators=[validate_title])
     genres = GenreSerializer(many=True)
-    country = CountrySerializer()
+    country = CachedCountrySerializer()
 
     class Meta:
         model = TVShow
         fields = '__all__'
 
 
+class CatalogSerializer(EagerLoadingMixin, serializers.Serializer):
+    """
+    Сериализатор смешанного каталога.
+    Медиа, загруженное через AbstractMedia.catalog(), сериализуется сериализатором своего подтипа
+    и получает поле type.
+    """
+    select_related_fields = list(MEDIA_SUBTYPE_RELATIONS)
+    prefetch_related_fields = ['genres']
+    subtype_serializers = {
+        Movie: MovieSerializer,
+        TVShow: TVShowSerializer,
+    }
+
+    def to_representation(self, instance):
+        """Метод для получения данных медиа с его типом"""
+        media = instance.as_subtype()
+        data = self.subtype_serializers[type(media)](media, context=self.context).data
+        data['type'] = media.get_media_type()
+        return data
+
+
+class MediaChoiceField(serializers.CharField):
+    """
+    Поле выбора медиа в формате movie-<id> / tvshow-<id>.
+    Варианты не загружаются заранее: проверяется только переданное значение,
+    а подсказки для интерфейса отдаёт эндпоинт /api/media-choices/?q=.
+    """
+    media_models = {
+        'movie': (Movie, "Выбранный фильм не найден."),
+        'tvshow': (TVShow, "Выбранный сериал не найден."),
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('help_text', 'Формат: movie-<id> или tvshow-<id>; поиск: /api/media-choices/?q=')
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        """Метод для получения медиа по переданному значению"""
+        value = super().to_internal_value(data)
+        try:
+            media_type, media_id = value.split('-')
+            media_id = int(media_id)
+        except ValueError:
+            raise serializers.ValidationError("Неверный формат выбора медиа.")
+
+        if media_type not in self.media_models:
+            raise serializers.ValidationError("Неизвестный тип медиа.")
+
+        model, not_found_message = self.media_models[media_type]
+        media = model.objects.filter(id=media_id).first()
+        if media is None:
+            raise serializers.ValidationError(not_found_message)
+
+        return media
+
+
+class RatingListSerializer(serializers.ListSerializer):
+    """
+    Сериализатор списка рейтингов.
+    Все медиа страницы загружаются заранее как конкретные подклассы за фиксированное число запросов.
+    """
+
+    def to_representation(self, data):
+        """Метод для сериализации списка рейтингов с предзагрузкой медиа"""
+        ratings = list(data.all() if hasattr(data, 'all') else data)
+        self.child.media_map = RatingSerializer.load_media({rating.media_id for rating in ratings})
+        return super().to_representation(ratings)
+
+
 class RatingSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Rating"""
+    media_serializers = {
+        Movie: MovieSerializer,
+        TVShow: TVShowSerializer,
+    }
+
     media = serializers.SerializerMethodField(read_only=True)
-    media_choice = serializers.ChoiceField(
-        choices=[],
+    media_choice = MediaChoiceField(
         write_only=True,
         label="Выберите медиа"
     )
@@ -54,60 +161,75 @@ class RatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rating
         fields = ['id', 'rating', 'media_choice', 'media', 'user']
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        media_choices = [
-            *[(f'movie-{movie.id}', f'Фильм: {movie.title}') for movie in Movie.objects.all()],
-            *[(f'tvshow-{tvshow.id}', f'Сериал: {tvshow.title}') for tvshow in TVShow.objects.all()]
-        ]
-        self.fields['media_choice'].choices = media_choices
+        list_serializer_class = RatingListSerializer
+
+    @staticmethod
+    def load_media(media_ids):
+        """
+        Метод для загрузки медиа как конкретных подклассов.
+        Один запрос к базовой таблице с подтипами и один на жанры.
+        """
+        media_map = AbstractMedia.catalog().prefetch_related('genres').in_bulk(
+            [media_id for media_id in media_ids if media_id]
+        )
+        return {media_id: media.as_subtype() for media_id, media in media_map.items()}
 
     def get_media(self, obj):
         """Метод для получения сериализованных данных медиа"""
-        try:
-            if obj.media.get_media_type() == ContentType.objects.get_for_model(Movie):
-                print(MovieSerializer(obj.media).data)
+        if not obj.media_id:
+            return None
 
-                return MovieSerializer(obj.media).data
+        media_map = getattr(self, 'media_map', None)
+        if media_map is None or obj.media_id not in media_map:
+            media_map = self.load_media([obj.media_id])
 
-            elif obj.media.get_media_type() == ContentType.objects.get_for_model(TVShow):
-                print(TVShowSerializer(obj.media).data)
+        media = media_map.get(obj.media_id)
+        serializer_class = self.media_serializers.get(type(media))
+        if serializer_class is None:
+            return None
 
-                return TVShowSerializer(obj.media).data
+        return serializer_class(media, context=self.context).data
 
-        except Exception as e:
-            print(e)
-            return None
+    def create(self, validated_data):
+        """Метод для создания рейтинга; повторная оценка того же медиа заменяет прежнюю"""
+        media = validated_data.pop('media_choice')
+        rating, _ = Rating.objects.update_or_create(
+            media=media, user=validated_data.pop('user'), defaults=validated_data,
+        )
+        return rating
 
-    def validate_media_choice(self, value):
-        """Метод для валидации выбора медиа"""
-        try:
-            media_type, media_id = value.split('-')
-            media_id = int(media_id)
-        except ValueError:
-            raise serializers.ValidationError("Неверный формат выбора медиа.")
 
-        if media_type == "movie":
-            if not Movie.objects.filter(id=media_id).exists():
-                raise serializers.ValidationError("Выбранный фильм не найден.")
-        elif media_type == "tvshow":
-            if not TVShow.objects.filter(id=media_id).exists():
-                raise serializers.ValidationError("Выбранный сериал не найден.")
-        else:
-            raise serializers.ValidationError("Неизвестный тип медиа.")
+class RatingBulkItemSerializer(serializers.Serializer):
+    """Сериализатор одной оценки в массовой загрузке"""
+    media = serializers.IntegerField(min_value=1, label="ID медиа")
+    rating = serializers.IntegerField(validators=[validate_rating], label="Оценка")
+
+
+class RatingBulkSerializer(serializers.Serializer):
+    """
+    Сериализатор массовой загрузки оценок текущего пользователя.
+    Поля оценок проверяются по отдельности, существование медиа — одним запросом на всю пачку.
+    Если медиа повторяется в пачке, действует последняя оценка.
+    """
+    ratings = RatingBulkItemSerializer(many=True, allow_empty=False, max_length=RATING_BULK_LIMIT)
 
-        return value
+    def validate_ratings(self, ratings):
+        """Метод для проверки, что все медиа пачки существуют"""
+        existing = set(AbstractMedia.objects.non_polymorphic().filter(
+            pk__in={item['media'] for item in ratings}
+        ).values_list('id', flat=True))
+
+        errors = {
+            index: {'media': [f'Медиа с ID {item["media"]} не существует.']}
+            for index, item in enumerate(ratings) if item['media'] not in existing
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        return ratings
 
     def create(self, validated_data):
-        """Метод для создания рейтинга"""
-        media_type, media_id = validated_data.pop('media_choice').split('-')
-        media = None
-        if media_type == "movie":
-            media = Movie.objects.get(id=media_id)
-        elif media_type == "tvshow":
-            media = TVShow.objects.get(id=media_id)
-
-        rating = Rating.objects.create(media=media, **validated_data)
-        return rating
+        """Метод для записи пачки оценок; возвращает количество полученных, созданных и изменённых оценок"""
+        created, updated = Rating.bulk_upsert(
+            validated_data['user'], {item['media']: item['rating'] for item in validated_data['ratings']},
+        )
+        return {'received': len(validated_data['ratings']), 'created': created, 'updated': updated}
@@ -1,7 +1,16 @@
-﻿"""Модуль для сигналов модели Country"""
-from django.db.models.signals import post_migrate
+﻿"""Модуль для сигналов приложения media"""
+import time
+
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 from django.dispatch import receiver
-from .models import Country
+from .caching import bump_object_version, bump_object_versions, bump_table_version, country_cache, genre_cache
+from .models import AbstractMedia, Country, Genre, Media, Movie, Rating, TVShow, ratings_bulk_upserted
+from .posters import schedule_poster_variants
+from .search import get_search_backend
+from .similar import schedule_similar_update
+from .snapshots import schedule_home_snapshot
+from .suggest import publish_media_changed, publish_media_removed, publish_rating_changed, publish_ratings_changed
+from .trending import record_ratings_after_commit, update_trending_media
 
 
 @receiver(post_migrate)
@@ -21,3 +30,188 @@ def populate_countries(sender, **kwargs):
             Country.objects.get_or_create(name=country)
 
         print('Модель Country заполнена')
+
+
+@receiver(post_save, sender=Rating)
+def update_rating_aggregates_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Обновление агрегатов рейтинга медиа при создании или изменении оценки.
+    Прежние медиа и оценку Rating.save читает в транзакции записи.
+    """
+    if raw:
+        return
+
+    previous = instance._previous_rating
+    current = (instance.media_id, int(instance.rating))
+    if previous == current:
+        return
+
+    if previous and previous[0]:
+        AbstractMedia.apply_rating_delta(previous[0], previous[1], -1)
+    if instance.media_id:
+        AbstractMedia.apply_rating_delta(instance.media_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Rating)
+def update_rating_aggregates_on_delete(sender, instance, **kwargs):
+    """Обновление агрегатов рейтинга медиа при удалении оценки"""
+    if instance.media_id:
+        AbstractMedia.apply_rating_delta(instance.media_id, instance.rating, -1)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def bump_movie_version(sender, instance, **kwargs):
+    """Инвалидация кэшей, зависящих от таблицы фильмов"""
+    bump_table_version('movie')
+    bump_object_version(instance.pk)
+    schedule_home_snapshot()
+
+
+@receiver(post_save, sender=TVShow)
+@receiver(post_delete, sender=TVShow)
+def bump_tvshow_version(sender, instance, **kwargs):
+    """Инвалидация кэшей, зависящих от таблицы сериалов"""
+    bump_table_version('tvshow')
+    bump_object_version(instance.pk)
+    schedule_home_snapshot()
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=TVShow)
+@receiver(post_save, sender=Media)
+def update_poster_variants(sender, instance, raw=False, **kwargs):
+    """Построение копий загруженного или заменённого постера"""
+    if not raw:
+        schedule_poster_variants(instance)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=TVShow)
+def update_search_index(sender, instance, **kwargs):
+    """Обновление медиа в поисковом индексе"""
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=TVShow)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Удаление медиа из поискового индекса"""
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=TVShow)
+def update_suggest_index(sender, instance, **kwargs):
+    """Уведомление индексов подсказок об изменении медиа"""
+    publish_media_changed(instance.pk, sender._meta.model_name)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=TVShow)
+def remove_from_suggest_index(sender, instance, **kwargs):
+    """Уведомление индексов подсказок об удалении медиа"""
+    publish_media_removed(instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=TVShow)
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=TVShow)
+def update_similar_index(sender, instance, **kwargs):
+    """Обновление строки медиа в индексе похожих"""
+    schedule_similar_update(instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=TVShow)
+def update_trending_title(sender, instance, raw=False, **kwargs):
+    """Обновление названия медиа в выдаче трендов"""
+    if not raw:
+        update_trending_media(instance.pk, sender._meta.model_name, instance.title, instance.is_published)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=TVShow)
+def remove_from_trending(sender, instance, **kwargs):
+    """Удаление медиа из выдачи трендов"""
+    update_trending_media(instance.pk, sender._meta.model_name, instance.title, False)
+
+
+@receiver(post_save, sender=Rating)
+def record_trending_rating(sender, instance, raw=False, **kwargs):
+    """Учёт новой или изменённой оценки в трендах; вклад прежнего значения изменённой оценки вычитается"""
+    if raw:
+        return
+    previous = instance._previous_rating
+    if not instance.media_id or previous == (instance.media_id, int(instance.rating)):
+        return
+    record_ratings_after_commit(
+        [(instance.media_id, instance.rating, instance.rated_at.timestamp())],
+        [(*previous, instance._previous_rated_at.timestamp())] if previous and previous[0] else [],
+    )
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def bump_rating_version(sender, instance, **kwargs):
+    """Инвалидация кэшей, зависящих от таблицы оценок"""
+    bump_table_version('rating')
+    schedule_home_snapshot()
+
+    previous = getattr(instance, '_previous_rating', None)
+    for media_id in {instance.media_id, previous[0] if previous else None}:
+        if media_id:
+            bump_object_version(media_id)
+            publish_rating_changed(media_id)
+
+
+@receiver(ratings_bulk_upserted)
+def bump_bulk_rating_versions(sender, media_ids, ratings, previous=(), **kwargs):
+    """Инвалидация кэшей и учёт в трендах после массовой записи оценок: один раз на всю пачку"""
+    bump_table_version('rating')
+    schedule_home_snapshot()
+    bump_object_versions(media_ids)
+    publish_ratings_changed(media_ids)
+
+    now = time.time()
+    record_ratings_after_commit(
+        [(media_id, rating, now) for media_id, rating in ratings],
+        [(media_id, rating, rated_at.timestamp()) for media_id, rating, rated_at in previous],
+    )
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_genre_cache(sender, **kwargs):
+    """Инвалидация кэша жанров во всех процессах"""
+    genre_cache.invalidate()
+    bump_table_version('genre')
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_country_cache(sender, **kwargs):
+    """Инвалидация кэша стран во всех процессах"""
+    country_cache.invalidate()
+    bump_table_version('country')
+
+
+@receiver(m2m_changed, sender=AbstractMedia.genres.through)
+def bump_media_genres_version(sender, instance, action, reverse, pk_set, **kwargs):
+    """Инвалидация кэшей медиа при изменении их жанров"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    bump_table_version('movie')
+    bump_table_version('tvshow')
+
+    if not reverse:
+        bump_object_version(instance.pk)
+        schedule_similar_update(instance.pk)
+    elif pk_set:
+        for media_id in pk_set:
+            bump_object_version(media_id)
+            schedule_similar_update(media_id)
+    else:
+        bump_table_version('genre')
@@ -0,0 +1,339 @@
+"""
+Модуль похожих медиа: ближайшие соседи по косинусному сходству векторов содержания.
+Вектор медиа — TF-IDF по названию и описанию и признаки жанров и страны. Матрица векторов хранится
+в файле .npy и открывается через memmap, поэтому все процессы веб-сервера читают одну копию
+из страничного кэша ОС, а не строят свою.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .caching import cache_lock
+from .models import AbstractMedia, Country, Genre, Movie, TVShow
+from .stemmer import tokenize
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_LIMIT = 10
+SIMILAR_MAX_LIMIT = 50
+SIMILAR_LOCK = 'similar_index'
+SIMILAR_LOCK_TIMEOUT = 60 * 30
+# Термины словаря: встречаются хотя бы в двух медиа и не больше чем в половине, самые частые из них
+MAX_TERMS = 2048
+MIN_DOCUMENT_FREQUENCY = 2
+MAX_DOCUMENT_RATIO = 0.5
+# Слова названия весят больше слов описания
+TITLE_WEIGHT = 2
+# Доли блоков признаков в итоговом сходстве: каждый блок нормирован, поэтому сходство векторов —
+# взвешенная сумма сходств текста, жанров и страны
+TEXT_WEIGHT = 0.6
+GENRES_WEIGHT = 0.3
+COUNTRY_WEIGHT = 0.1
+# Запас пустых строк под новые медиа, чтобы их можно было добавить без перестройки
+CAPACITY_RESERVE = 0.25
+MEDIA_TYPES = {Movie: 1, TVShow: 2}
+CURRENT_FILE = 'CURRENT'
+
+
+class SimilarIndexFull(Exception):
+    """Исключение, когда в индексе не осталось пустых строк и нужна полная перестройка"""
+
+
+def get_index_dir():
+    """Метод для получения каталога индекса из настройки SIMILAR_INDEX_DIR"""
+    return settings.SIMILAR_INDEX_DIR
+
+
+def iter_documents(queryset):
+    """Метод для получения строк (ID, тип, название, описание, ID страны, ID жанров) опубликованных медиа"""
+    genres = {}
+    for media_id, genre_id in AbstractMedia.genres.through.objects.filter(
+        abstractmedia__in=queryset.values('pk'),
+    ).values_list('abstractmedia_id', 'genre_id'):
+        genres.setdefault(media_id, []).append(genre_id)
+
+    for model, media_type in MEDIA_TYPES.items():
+        for pk, title, description, country_id in queryset.instance_of(model).values_list(
+            'id', 'title', 'description', 'country_id',
+        ):
+            yield pk, media_type, title, description, country_id, genres.get(pk, [])
+
+
+def count_terms(title, description):
+    """Метод для подсчёта терминов медиа; слова названия учитываются с весом TITLE_WEIGHT"""
+    counts = Counter(tokenize(description))
+    for term in tokenize(title):
+        counts[term] += TITLE_WEIGHT
+    return counts
+
+
+class SimilarModel:
+    """
+    Словарь, IDF и столбцы жанров и стран, зафиксированные при полной перестройке.
+    Изменённое медиа векторизуется по ним же, поэтому его строка сопоставима с остальными;
+    новые слова, жанры и страны учитываются со следующей полной перестройки.
+    """
+
+    def __init__(self, terms, idf, genre_ids, country_ids):
+        self.terms = terms
+        self.idf = idf
+        self.genre_ids = genre_ids
+        self.country_ids = country_ids
+        self.term_columns = {term: column for column, term in enumerate(terms)}
+        self.genre_columns = {pk: len(terms) + column for column, pk in enumerate(genre_ids)}
+        self.country_columns = {pk: len(terms) + len(genre_ids) + column for column, pk in enumerate(country_ids)}
+        self.dimension = len(terms) + len(genre_ids) + len(country_ids)
+
+    @classmethod
+    def fit(cls, documents):
+        """Метод для построения словаря и IDF по всем медиа"""
+        document_frequency = Counter()
+        for _, _, title, description, _, _ in documents:
+            document_frequency.update(count_terms(title, description).keys())
+
+        max_frequency = max(MIN_DOCUMENT_FREQUENCY, int(len(documents) * MAX_DOCUMENT_RATIO))
+        candidates = [
+            (frequency, term) for term, frequency in document_frequency.items()
+            if MIN_DOCUMENT_FREQUENCY <= frequency <= max_frequency
+        ]
+        terms = sorted(term for _, term in sorted(candidates, reverse=True)[:MAX_TERMS])
+        idf = np.array(
+            [np.log((1 + len(documents)) / (1 + document_frequency[term])) + 1 for term in terms], dtype=np.float32,
+        )
+        genre_ids = np.array(sorted(Genre.objects.values_list('id', flat=True)), dtype=np.int64)
+        country_ids = np.array(sorted(Country.objects.values_list('id', flat=True)), dtype=np.int64)
+        return cls(np.array(terms), idf, genre_ids, country_ids)
+
+    def vectorize(self, title, description, country_id, genre_ids):
+        """Метод для получения нормированного вектора медиа"""
+        vector = np.zeros(self.dimension, dtype=np.float32)
+
+        pairs = [
+            (self.term_columns[term], count) for term, count in count_terms(title, description).items()
+            if term in self.term_columns
+        ]
+        if pairs:
+            columns, counts = map(list, zip(*pairs))
+            vector[columns] = (1 + np.log(np.array(counts, dtype=np.float32))) * self.idf[columns]
+
+        for column in {self.genre_columns[pk] for pk in genre_ids if pk in self.genre_columns}:
+            vector[column] = 1
+        if country_id in self.country_columns:
+            vector[self.country_columns[country_id]] = 1
+
+        blocks = (
+            (slice(0, len(self.terms)), TEXT_WEIGHT),
+            (slice(len(self.terms), len(self.terms) + len(self.genre_ids)), GENRES_WEIGHT),
+            (slice(len(self.terms) + len(self.genre_ids), self.dimension), COUNTRY_WEIGHT),
+        )
+        for block, weight in blocks:
+            norm = np.linalg.norm(vector[block])
+            if norm:
+                vector[block] *= np.sqrt(weight) / norm
+        return vector
+
+    def save(self, path):
+        """Метод для сохранения модели рядом с матрицей"""
+        np.savez(
+            os.path.join(path, 'model.npz'),
+            terms=self.terms, idf=self.idf, genre_ids=self.genre_ids, country_ids=self.country_ids,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Метод для загрузки модели"""
+        with np.load(os.path.join(path, 'model.npz')) as data:
+            return cls(data['terms'], data['idf'], data['genre_ids'], data['country_ids'])
+
+
+class SimilarIndex:
+    """
+    Индекс векторов медиа в каталоге SIMILAR_INDEX_DIR.
+    Каждая полная перестройка пишет новое поколение в отдельный подкаталог и переключает файл CURRENT
+    атомарной заменой; процессы замечают переключение по inode и времени изменения CURRENT и открывают новое поколение.
+    Точечные обновления пишут строки текущего поколения на месте: memmap общий, процессы видят их сразу.
+    Писать в индекс может один процесс одновременно (блокировка SIMILAR_LOCK), читать — любые.
+    """
+
+    def __init__(self):
+        self._current_stamp = None
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def _current_path(self):
+        """Метод для получения пути к файлу с именем текущего поколения"""
+        return os.path.join(get_index_dir(), CURRENT_FILE)
+
+    def _open(self, mode='r'):
+        """
+        Метод для открытия текущего поколения: (каталог, ids, types, vectors) или None, если индекс не построен.
+        Для чтения открытые массивы переиспользуются, пока CURRENT не изменился.
+        """
+        try:
+            stat = os.stat(self._current_path())
+        except FileNotFoundError:
+            return None
+
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if mode == 'r' and self._arrays is not None and stamp == self._current_stamp:
+                return self._arrays
+
+            with open(self._current_path()) as file:
+                path = os.path.join(get_index_dir(), file.read().strip())
+            arrays = (path, *(np.load(os.path.join(path, name), mmap_mode=mode) for name in (
+                'ids.npy', 'types.npy', 'vectors.npy',
+            )))
+            if mode == 'r':
+                self._arrays, self._current_stamp = arrays, stamp
+            return arrays
+
+    def rebuild(self):
+        """
+        Метод для полной перестройки индекса по опубликованным медиа.
+        Возвращает количество медиа или None, если индекс занят другим процессом.
+        """
+        with cache_lock(SIMILAR_LOCK, timeout=SIMILAR_LOCK_TIMEOUT) as acquired:
+            return self._rebuild() if acquired else None
+
+    def _rebuild(self):
+        """Метод для перестройки индекса под блокировкой"""
+        documents = list(iter_documents(AbstractMedia.objects.filter(is_published=True)))
+        model = SimilarModel.fit(documents)
+        capacity = max(16, int(len(documents) * (1 + CAPACITY_RESERVE)))
+
+        index_dir = get_index_dir()
+        os.makedirs(index_dir, exist_ok=True)
+        generation = f'{time.time_ns()}'
+        path = os.path.join(index_dir, generation)
+        os.makedirs(path)
+
+        ids = np.lib.format.open_memmap(os.path.join(path, 'ids.npy'), 'w+', np.int64, (capacity,))
+        types = np.lib.format.open_memmap(os.path.join(path, 'types.npy'), 'w+', np.int8, (capacity,))
+        vectors = np.lib.format.open_memmap(
+            os.path.join(path, 'vectors.npy'), 'w+', np.float32, (capacity, model.dimension),
+        )
+        for row, (pk, media_type, title, description, country_id, genre_ids) in enumerate(documents):
+            vectors[row] = model.vectorize(title, description, country_id, genre_ids)
+            types[row] = media_type
+            ids[row] = pk
+        for array in (ids, types, vectors):
+            array.flush()
+        model.save(path)
+        del ids, types, vectors
+
+        temporary = os.path.join(index_dir, f'{CURRENT_FILE}.{generation}')
+        with open(temporary, 'w') as file:
+            file.write(generation)
+        os.replace(temporary, self._current_path())
+
+        # Открытые другими процессами файлы старых поколений остаются доступны до их переоткрытия
+        for name in os.listdir(index_dir):
+            if name != generation and os.path.isdir(os.path.join(index_dir, name)):
+                shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+        logger.info('Индекс похожих медиа перестроен: %s медиа, %s признаков', len(documents), model.dimension)
+        return len(documents)
+
+    def update(self, media_ids):
+        """
+        Метод для обновления строк изменённых медиа: перезапись вектора, добавление в пустую строку
+        или удаление снятых с публикации и удалённых. Если индекса нет или не осталось пустых строк,
+        индекс перестраивается целиком. Возвращает False, если индекс занят другим процессом.
+        """
+        with cache_lock(SIMILAR_LOCK, timeout=SIMILAR_LOCK_TIMEOUT) as acquired:
+            if not acquired:
+                return False
+
+            arrays = self._open('r+')
+            if arrays is None:
+                self._rebuild()
+                return True
+
+            path, ids, types, vectors = arrays
+            model = SimilarModel.load(path)
+            documents = {
+                document[0]: document for document in iter_documents(
+                    AbstractMedia.objects.filter(pk__in=media_ids, is_published=True),
+                )
+            }
+            try:
+                for pk in media_ids:
+                    self._update_row(model, ids, types, vectors, pk, documents.get(pk))
+            except SimilarIndexFull:
+                self._rebuild()
+                return True
+
+            for array in (ids, types, vectors):
+                array.flush()
+            return True
+
+    @staticmethod
+    def _update_row(model, ids, types, vectors, pk, document):
+        """
+        Метод для записи строки медиа; document=None удаляет медиа из индекса.
+        ID пишется последним: читатель не сопоставит ID со старым вектором.
+        """
+        rows = np.flatnonzero(ids == pk)
+        if document is None:
+            if len(rows):
+                ids[rows] = 0
+                vectors[rows] = 0
+            return
+
+        if len(rows):
+            row = rows[0]
+        else:
+            free = np.flatnonzero(ids == 0)
+            if not len(free):
+                raise SimilarIndexFull()
+            row = free[0]
+
+        _, media_type, title, description, country_id, genre_ids = document
+        vectors[row] = model.vectorize(title, description, country_id, genre_ids)
+        types[row] = media_type
+        ids[row] = pk
+
+    def neighbours(self, pk, limit=SIMILAR_LIMIT):
+        """
+        Метод для получения ID медиа того же типа, ближайших к медиа pk, по убыванию сходства: [(ID, сходство)].
+        Сходство всех строк считается одним умножением матрицы на вектор.
+        """
+        arrays = self._open()
+        if arrays is None:
+            return []
+
+        _, ids, types, vectors = arrays
+        rows = np.flatnonzero(ids == pk)
+        if not len(rows):
+            return []
+
+        row = rows[0]
+        scores = vectors @ vectors[row]
+        scores[(ids == 0) | (types != types[row])] = 0
+        scores[row] = 0
+
+        limit = min(limit, len(scores))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[position]), float(scores[position])) for position in best if scores[position] > 0]
+
+
+similar_index = SimilarIndex()
+
+
+def schedule_similar_update(pk):
+    """Метод для обновления строки медиа в индексе похожих после фиксации транзакции"""
+    def schedule():
+        from tasks.tasks import update_similar_index
+
+        update_similar_index.delay([pk])
+
+    transaction.on_commit(schedule, robust=True)
@@ -0,0 +1,85 @@
+"""Модуль предрассчитанного снимка данных главной страницы"""
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+
+from MoviePlatform.db_routing import use_primary
+
+from .caching import get_table_versions
+from .models import AbstractMedia, Movie, TVShow
+from .pagination import KeysetPaginator
+
+logger = logging.getLogger(__name__)
+
+HOME_SNAPSHOT_KEY = 'home_snapshot'
+HOME_SNAPSHOT_SCHEDULED_KEY = 'home_snapshot_scheduled'
+HOME_SNAPSHOT_TABLES = ('movie', 'tvshow')
+HOME_SNAPSHOT_DEBOUNCE = 5
+HOME_PAGE_SIZE = 5
+HOME_ORDERING = ('-release_date', '-id')
+HOME_ORDERING_FIELDS = [field.lstrip('-') for field in HOME_ORDERING]
+HOME_TOP_SIZE = 3
+
+
+def get_home_queryset(model):
+    """
+    Метод для получения опубликованных медиа главной страницы.
+    Запрос строится по AbstractMedia с фильтром по типу, а не по таблице модели: так страница
+    читается из индекса abstractmedia_published_idx без соединения и сортировки.
+    """
+    return AbstractMedia.objects.instance_of(model).filter(is_published=True)
+
+
+def get_home_paginator(queryset):
+    """Метод для получения keyset-пагинатора главной страницы: новые медиа первыми"""
+    return KeysetPaginator(queryset, HOME_ORDERING, HOME_PAGE_SIZE)
+
+
+def build_home_snapshot():
+    """
+    Сборка снимка главной страницы: первые страницы фильмов и сериалов, курсоры следующих страниц,
+    количество и топ-3. Хранятся только ID, поэтому документ компактный.
+    """
+    snapshot = {'versions': get_table_versions(*HOME_SNAPSHOT_TABLES)}
+
+    # Снимок помечен текущими версиями таблиц, поэтому читается из основной базы, а не из отстающей реплики
+    with use_primary():
+        for prefix, model in (('movies', Movie), ('tvshows', TVShow)):
+            page = get_home_paginator(
+                get_home_queryset(model).non_polymorphic().only(*HOME_ORDERING_FIELDS)
+            ).page()
+            snapshot[prefix] = {
+                'ids': [obj.pk for obj in page],
+                'next_cursor': page.next_cursor,
+            }
+
+        snapshot['high_rated_movies'] = list(Movie.get_high_rated().values_list('id', flat=True)[:HOME_TOP_SIZE])
+        snapshot['high_rated_tvshows'] = list(TVShow.get_high_rated().values_list('id', flat=True)[:HOME_TOP_SIZE])
+        snapshot['movie_count'] = Movie.objects.count()
+        snapshot['tvshow_count'] = TVShow.objects.count()
+
+    cache.set(HOME_SNAPSHOT_KEY, snapshot, timeout=None)
+    return snapshot
+
+
+def get_home_snapshot():
+    """
+    Метод для получения снимка главной страницы.
+    Снимок, собранный до изменения таблиц фильмов или сериалов, не используется.
+    """
+    snapshot = cache.get(HOME_SNAPSHOT_KEY)
+    if snapshot is None or snapshot['versions'] != get_table_versions(*HOME_SNAPSHOT_TABLES):
+        return None
+    return snapshot
+
+
+def schedule_home_snapshot():
+    """Метод для отложенной пересборки снимка после фиксации транзакции, не чаще раза в несколько секунд"""
+    def schedule():
+        if cache.add(HOME_SNAPSHOT_SCHEDULED_KEY, 1, timeout=HOME_SNAPSHOT_DEBOUNCE):
+            from tasks.tasks import build_home_snapshot as build_home_snapshot_task
+
+            build_home_snapshot_task.apply_async(countdown=HOME_SNAPSHOT_DEBOUNCE)
+
+    transaction.on_commit(schedule, robust=True)
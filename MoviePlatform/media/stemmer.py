@@ -0,0 +1,75 @@
+"""Модуль нормализации текста для полнотекстового поиска: приведение регистра и стемминг Snowball для русского"""
+import re
+
+WORD_RE = re.compile(r'\w+')
+
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(r'(ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(в|вши|вшись))$')
+_REFLEXIVE = re.compile(r'(ся|сь)$')
+_ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_PARTICIPLE = re.compile(r'(ивш|ывш|ующ|(?<=[ая])(ем|нн|вш|ющ|щ))$')
+_VERB = re.compile(
+    r'(ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю'
+    r'|(?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_I = re.compile(r'и$')
+_R2_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя][аеиоуыэюя].*ость?$')
+_DERIVATIONAL = re.compile(r'ость?$')
+_SOFT_SIGN = re.compile(r'ь$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_DOUBLE_N = re.compile(r'нн$')
+
+
+def _strip(pattern, text):
+    """Метод для удаления окончания; возвращает текст и признак удаления"""
+    stripped = pattern.sub('', text, count=1)
+    return stripped, stripped != text
+
+
+def stem(word):
+    """
+    Метод для получения основы русского слова по алгоритму Snowball.
+    Окончания снимаются только в области RV (после первой гласной); слова без кириллицы не меняются.
+    """
+    match = _RV.match(word)
+    if match is None:
+        return word
+    prefix, rv = match.groups()
+
+    rv, removed = _strip(_PERFECTIVE_GERUND, rv)
+    if not removed:
+        rv, _ = _strip(_REFLEXIVE, rv)
+        rv, removed = _strip(_ADJECTIVE, rv)
+        if removed:
+            rv, _ = _strip(_PARTICIPLE, rv)
+        else:
+            rv, removed = _strip(_VERB, rv)
+            if not removed:
+                rv, _ = _strip(_NOUN, rv)
+
+    rv, _ = _strip(_I, rv)
+
+    if _R2_DERIVATIONAL.match(rv):
+        rv, _ = _strip(_DERIVATIONAL, rv)
+
+    rv, removed = _strip(_SOFT_SIGN, rv)
+    if not removed:
+        rv, _ = _strip(_SUPERLATIVE, rv)
+        rv = _DOUBLE_N.sub('н', rv, count=1)
+
+    return prefix + rv
+
+
+def tokenize(text):
+    """Метод для разбиения текста на нормализованные токены: нижний регистр, «ё» как «е», основы слов"""
+    return [stem(word) for word in WORD_RE.findall((text or '').casefold().replace('ё', 'е'))]
+
+
+def normalize(text):
+    """Метод для получения нормализованного текста для поискового индекса"""
+    return ' '.join(tokenize(text))
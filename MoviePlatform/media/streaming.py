@@ -0,0 +1,160 @@
+"""
+Модуль отдачи файлов медиа с поддержкой докачки и перемотки: заголовки Range и If-Range,
+условные запросы по сильному ETag и Last-Modified.
+
+Файл не читается в память целиком: весь файл отдаётся через FileResponse, и WSGI-сервер с wsgi.file_wrapper
+(gunicorn, uWSGI) передаёт его в сокет через sendfile, минуя Python; диапазон читается блоками по
+STREAM_BLOCK_SIZE. За nginx или Apache отдачу можно целиком передать прокси (настройка MEDIA_FILE_OFFLOAD),
+тогда процесс Django только проверяет доступ и выставляет заголовок X-Accel-Redirect или X-Sendfile.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+STREAM_BLOCK_SIZE = 256 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """Диапазон лежит за пределами файла"""
+
+
+class FileRange:
+    """Файл, читаемый только в пределах диапазона [start, start + length)"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        """Чтение не дальше конца диапазона"""
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        """Закрытие файла"""
+        self.file.close()
+
+
+def get_file_etag(stat):
+    """
+    Метод для получения сильного ETag файла по размеру и времени изменения в наносекундах.
+    Загруженные файлы не перезаписываются на месте (хранилище выбирает новое имя),
+    поэтому совпадение ETag означает побайтово тот же файл, и по нему можно продолжать докачку.
+    """
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Метод для разбора заголовка Range: возвращает (начало, конец) включительно
+    или None, если заголовок нужно проигнорировать и отдать файл целиком (нет заголовка, другая единица,
+    несколько диапазонов, ошибка синтаксиса). Диапазон за пределами файла, в том числе любой диапазон
+    пустого файла, — RangeNotSatisfiable.
+    """
+    match = RANGE_RE.match((header or '').replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    if size == 0:
+        raise RangeNotSatisfiable
+
+    start, end = match.groups()
+    if not start:
+        # Суффикс: последние N байт
+        if int(end) == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(end), 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        if start >= size:
+            raise RangeNotSatisfiable
+        return None
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    Метод для проверки условия If-Range: диапазон отдаётся, только если файл не изменился.
+    Сравнение ETag сильное, поэтому слабый ETag не совпадает никогда; дата должна совпасть точно.
+    """
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def offload_response(name, path, filename, as_attachment):
+    """
+    Метод для передачи отдачи файла прокси: nginx получает внутренний адрес в X-Accel-Redirect,
+    Apache и lighttpd — путь к файлу в X-Sendfile. Диапазоны и условные запросы прокси обрабатывает сам.
+    """
+    response = FileResponse(filename=filename, as_attachment=as_attachment)
+    response.set_headers(None)
+    if settings.MEDIA_FILE_OFFLOAD == 'nginx':
+        response['X-Accel-Redirect'] = settings.MEDIA_FILE_OFFLOAD_PREFIX + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, path, filename=None, as_attachment=False):
+    """
+    Отдача файла с диапазонами и условными запросами.
+    304 и 412 — по If-None-Match, If-Match и датам, 206 — один диапазон из Range, 416 — диапазон за концом файла,
+    иначе 200 с файлом целиком. На HEAD файл не открывается.
+    """
+    stat = os.stat(path)
+    size, etag, last_modified = stat.st_size, get_file_etag(stat), int(stat.st_mtime)
+    filename = filename or os.path.basename(path)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        if response.status_code == 304:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is not None and not if_range_matches(request, etag, last_modified):
+        byte_range = None
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1
+    if request.method == 'HEAD':
+        response = FileResponse(filename=filename, as_attachment=as_attachment)
+        response.set_headers(None)
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), filename=filename, as_attachment=as_attachment)
+    else:
+        response = FileResponse(
+            FileRange(open(path, 'rb'), start, length), filename=filename, as_attachment=as_attachment,
+        )
+    response.block_size = STREAM_BLOCK_SIZE
+
+    if byte_range is not None:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,271 @@
+"""Модуль подсказок по началу названия медиа (search-as-you-type)"""
+import bisect
+import json
+import logging
+import os
+import threading
+
+from django.db import connection, transaction
+
+from .caching import CHANNEL_PREFIX, ensure_listener, publish, subscribe
+from .models import AbstractMedia, Movie, TVShow
+from .stemmer import WORD_RE
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_CHANNEL = f'{CHANNEL_PREFIX}suggest'
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+# Префиксы не длиннее этого подходят к слишком многим ключам, поэтому для них выдача хранится уже отсортированной
+SUGGEST_BUCKET_LENGTH = 2
+
+
+def normalize_title(text):
+    """Метод для приведения текста к виду ключа индекса: нижний регистр, «ё» как «е», слова через пробел"""
+    return ' '.join(WORD_RE.findall(text.casefold().replace('ё', 'е')))
+
+
+def title_keys(title):
+    """Метод для получения ключей индекса: название с каждого слова, чтобы «дракона» находило всё название"""
+    words = normalize_title(title).split(' ')
+    return {' '.join(words[position:]) for position in range(len(words)) if words[position]}
+
+
+def title_buckets(keys):
+    """Метод для получения коротких префиксов ключей, под которыми медиа хранится в отсортированных корзинах"""
+    return {key[:length] for key in keys for length in range(1, SUGGEST_BUCKET_LENGTH + 1) if len(key) >= length}
+
+
+def rank(pk, entry):
+    """Метод для получения ключа сортировки выдачи: выше средняя оценка, затем по названию"""
+    title, _, rating = entry
+    return -rating, title, pk
+
+
+class SuggestIndex:
+    """
+    Префиксный индекс названий опубликованных фильмов и сериалов в памяти процесса.
+    Ключи хранятся в отсортированном массиве пар (ключ, ID), поэтому поиск по префиксу — два bisect
+    и обход только подходящего диапазона. Для коротких префиксов, под которые попадает большая часть
+    индекса, медиа дополнительно лежат в корзинах, отсортированных по средней оценке: запрос читает
+    первые limit элементов, не ранжируя весь диапазон.
+    Индекс строится один раз в фоновом потоке (warm_up) при запуске процесса и дальше обновляется только
+    по уведомлениям об изменениях; уведомления, пришедшие во время построения, применяются после него.
+    Заново индекс строится, только если подписка на уведомления прерывалась, и тоже в фоне.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._entries = {}
+        self._buckets = {}
+        self._ready = False
+        self._building_pid = None
+        self._pending_events = None
+        self._lock = threading.RLock()
+
+    def rebuild(self):
+        """Метод для полного построения индекса по таблицам фильмов и сериалов"""
+        with self._lock:
+            self._pending_events = []
+
+        try:
+            entries = {}
+            for media_type, model in (('movie', Movie), ('tvshow', TVShow)):
+                for pk, title, rating in model.objects.filter(is_published=True).values_list(
+                    'id', 'title', 'average_rating'
+                ):
+                    entries[pk] = (title, media_type, rating)
+
+            keys = []
+            buckets = {}
+            for pk, entry in entries.items():
+                entry_keys = title_keys(entry[0])
+                keys += [(key, pk) for key in entry_keys]
+                for bucket in title_buckets(entry_keys):
+                    buckets.setdefault(bucket, []).append(rank(pk, entry))
+            keys.sort()
+            for items in buckets.values():
+                items.sort()
+        except Exception:
+            with self._lock:
+                self._pending_events = None
+            raise
+
+        with self._lock:
+            self._entries, self._keys, self._buckets = entries, keys, buckets
+            pending, self._pending_events = self._pending_events, None
+            for event in pending:
+                self._apply(event)
+            self._ready = True
+
+    def _build_in_background(self):
+        """Построение индекса в фоновом потоке; соединение с базой потока закрывается по завершении"""
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Не удалось построить индекс подсказок')
+        finally:
+            connection.close()
+            with self._lock:
+                self._building_pid = None
+
+    def warm_up(self):
+        """
+        Метод для запуска построения индекса в фоновом потоке, если оно ещё не идёт в этом процессе.
+        Вызывается при запуске веб-сервера (wsgi.py, asgi.py); запросы не ждут построения.
+        """
+        ensure_listener()
+        with self._lock:
+            if self._building_pid == os.getpid():
+                return
+            self._building_pid = os.getpid()
+        threading.Thread(target=self._build_in_background, name='suggest-index-build', daemon=True).start()
+
+    def reset(self):
+        """Метод для перестройки индекса после потери уведомлений; до её окончания выдача идёт из прежнего индекса"""
+        self.warm_up()
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """
+        Метод для получения медиа, название или слово названия которых начинается с prefix.
+        Пока индекс строится при запуске процесса, подсказок нет.
+        """
+        key = normalize_title(prefix)
+        if not key:
+            return []
+
+        if not self._ready:
+            self.warm_up()
+            return []
+
+        ensure_listener()
+        with self._lock:
+            if len(key) <= SUGGEST_BUCKET_LENGTH:
+                best = [pk for _, _, pk in self._buckets.get(key, [])[:limit]]
+            else:
+                low = bisect.bisect_left(self._keys, (key,))
+                high = bisect.bisect_left(self._keys, (key + '\uffff',))
+                ids = {pk for _, pk in self._keys[low:high]}
+                best = [pk for _, _, pk in sorted(rank(pk, self._entries[pk]) for pk in ids)[:limit]]
+            return [
+                {'id': pk, 'type': self._entries[pk][1], 'title': self._entries[pk][0], 'rating': self._entries[pk][2]}
+                for pk in best
+            ]
+
+    def _remove_entry(self, pk):
+        """Метод для удаления медиа из ключей и корзин индекса; возвращает прежнюю запись"""
+        entry = self._entries.pop(pk, None)
+        if entry is None:
+            return None
+
+        keys = title_keys(entry[0])
+        for key in keys:
+            position = bisect.bisect_left(self._keys, (key, pk))
+            if position < len(self._keys) and self._keys[position] == (key, pk):
+                del self._keys[position]
+        item = rank(pk, entry)
+        for bucket in title_buckets(keys):
+            items = self._buckets.get(bucket, [])
+            position = bisect.bisect_left(items, item)
+            if position < len(items) and items[position] == item:
+                del items[position]
+        return entry
+
+    def _add_entry(self, pk, entry):
+        """Метод для добавления медиа в ключи и корзины индекса"""
+        self._entries[pk] = entry
+        keys = title_keys(entry[0])
+        for key in keys:
+            bisect.insort(self._keys, (key, pk))
+        item = rank(pk, entry)
+        for bucket in title_buckets(keys):
+            bisect.insort(self._buckets.setdefault(bucket, []), item)
+
+    def upsert(self, pk, media_type, title, rating):
+        """Метод для добавления или обновления медиа в индексе"""
+        with self._lock:
+            self._remove_entry(pk)
+            self._add_entry(pk, (title, media_type, rating))
+
+    def remove(self, pk):
+        """Метод для удаления медиа из индекса"""
+        with self._lock:
+            self._remove_entry(pk)
+
+    def set_rating(self, pk, rating):
+        """Метод для обновления средней оценки медиа: ключи не меняются, медиа переставляется в корзинах"""
+        with self._lock:
+            entry = self._remove_entry(pk)
+            if entry is not None:
+                self._add_entry(pk, (entry[0], entry[1], rating))
+
+    def _apply(self, event):
+        """Метод для применения разобранного уведомления"""
+        if event['op'] == 'upsert':
+            self.upsert(event['id'], event['type'], event['title'], event['rating'])
+        elif event['op'] == 'remove':
+            self.remove(event['id'])
+        elif event['op'] == 'rating':
+            self.set_rating(event['id'], event['rating'])
+        elif event['op'] == 'ratings':
+            for pk, rating in event['ratings']:
+                self.set_rating(pk, rating)
+
+    def handle_event(self, message):
+        """
+        Метод для применения уведомления об изменении медиа.
+        Во время построения индекса уведомления откладываются, до первого построения не нужны.
+        """
+        event = json.loads(message)
+        with self._lock:
+            if self._pending_events is not None:
+                self._pending_events.append(event)
+            elif self._ready:
+                self._apply(event)
+
+
+suggest_index = SuggestIndex()
+subscribe(SUGGEST_CHANNEL, suggest_index.handle_event, on_disconnect=suggest_index.reset)
+
+
+def _publish_after_commit(build_event):
+    """Метод для рассылки уведомления индексам всех процессов после фиксации транзакции"""
+    transaction.on_commit(lambda: publish(SUGGEST_CHANNEL, json.dumps(build_event())), robust=True)
+
+
+def publish_media_changed(pk, media_type):
+    """Метод для уведомления об изменении медиа; актуальные название и оценка читаются один раз после фиксации"""
+    def build_event():
+        row = AbstractMedia.objects.non_polymorphic().filter(pk=pk).values_list(
+            'title', 'average_rating', 'is_published'
+        ).first()
+        if row is None or not row[2]:
+            return {'op': 'remove', 'id': pk}
+        return {'op': 'upsert', 'id': pk, 'type': media_type, 'title': row[0], 'rating': row[1]}
+
+    _publish_after_commit(build_event)
+
+
+def publish_media_removed(pk):
+    """Метод для уведомления об удалении медиа"""
+    _publish_after_commit(lambda: {'op': 'remove', 'id': pk})
+
+
+def publish_rating_changed(media_id):
+    """Метод для уведомления об изменении средней оценки медиа"""
+    def build_event():
+        rating = AbstractMedia.objects.non_polymorphic().filter(pk=media_id).values_list(
+            'average_rating', flat=True
+        ).first()
+        return {'op': 'rating', 'id': media_id, 'rating': rating or 0}
+
+    _publish_after_commit(build_event)
+
+
+def publish_ratings_changed(media_ids):
+    """Метод для уведомления об изменении средних оценок множества медиа одним сообщением"""
+    def build_event():
+        ratings = AbstractMedia.objects.non_polymorphic().filter(pk__in=media_ids).values_list('id', 'average_rating')
+        return {'op': 'ratings', 'ratings': list(ratings)}
+
+    _publish_after_commit(build_event)
@@ -1,6 +1,12 @@
 ﻿from django import template
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
 
+from media.caching import CARD_KEY, CARD_TIMEOUT, REPLICA_CARD_TIMEOUT, get_card_versions
 from media.models import Media
+from media.posters import get_poster_context
 
 register = template.Library()
 
@@ -19,3 +25,67 @@ def top_rated_media():
 @register.filter(name='rating_to_stars')
 def rating_to_stars(value):
     return '⭐' * value
+
+
+class CardCacheNode(template.Node):
+    """Узел шаблона, кэширующий отрендеренную карточку медиа по id и версии объекта"""
+
+    def __init__(self, nodelist, obj, fragment_name):
+        self.nodelist = nodelist
+        self.obj = obj
+        self.fragment_name = fragment_name
+
+    def render(self, context):
+        obj = self.obj.resolve(context)
+        fragment_name = self.fragment_name.resolve(context)
+
+        version = getattr(obj, 'card_version', None) or get_card_versions([obj.pk])[obj.pk]
+        cache_key = CARD_KEY.format(fragment_name, obj.pk, version)
+
+        html = cache.get(cache_key)
+        if html is None:
+            html = self.nodelist.render(context)
+            timeout = CARD_TIMEOUT if obj._state.db in (None, DEFAULT_DB_ALIAS) else REPLICA_CARD_TIMEOUT
+            cache.set(cache_key, html, timeout=timeout)
+        return html
+
+
+@register.tag('card_cache')
+def card_cache(parser, token):
+    """
+    Кэширование карточки медиа:
+    {% card_cache movie "movie_card" %} ... {% endcard_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' принимает объект и имя фрагмента.")
+
+    nodelist = parser.parse(('endcard_cache',))
+    parser.delete_first_token()
+    return CardCacheNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
+
+
+@register.simple_tag
+def poster(media, sizes='100vw', **attrs):
+    """
+    Постер медиа: <picture> с копиями в AVIF и WebP и <img> с копиями в JPEG, браузер выбирает
+    копию по sizes и плотности экрана. Пока копии не построены, выводится оригинал.
+    {% poster movie sizes="(min-width: 768px) 20vw, 100vw" class="card-img-top" %}
+    """
+    context = get_poster_context(media)
+    if context is None:
+        return ''
+
+    attrs = {'loading': 'lazy', 'decoding': 'async', **attrs}
+    if context['width']:
+        attrs = {'width': context['width'], 'height': context['height'], **attrs}
+    if context['srcset']:
+        attrs = {'srcset': context['srcset'], 'sizes': sizes, **attrs}
+
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}"{}></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+            (mime_type, srcset, sizes) for mime_type, srcset in context['sources']
+        )),
+        context['src'], media.title, flatatt(attrs),
+    )
@@ -0,0 +1,372 @@
+"""
+Модуль трендов: рейтинги медиа по недавней активности оценок с экспоненциальным затуханием,
+общий и по каждому жанру и стране.
+
+Используется прямое затухание (forward decay): вклад оценки, поставленной в момент t, равен
+вес * 2 ** ((t - epoch) / TRENDING_HALF_LIFE) и больше не меняется, поэтому запись — одно
+увеличение счёта в отсортированном множестве за O(log n), а порядок медиа совпадает с порядком
+по затухшим к текущему моменту счетам. Чтобы счета не переполнились, эпоха периодически переносится
+вперёд с пересчётом всех множеств (maintain).
+"""
+import functools
+import heapq
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .caching import CHANNEL_PREFIX, get_redis
+from .models import AbstractMedia, Rating
+
+TRENDING_PREFIX = f'{CHANNEL_PREFIX}trending:'
+TRENDING_EPOCH_KEY = f'{TRENDING_PREFIX}epoch'
+TRENDING_BOARDS_KEY = f'{TRENDING_PREFIX}boards'
+TRENDING_MEDIA_KEY = f'{TRENDING_PREFIX}media'
+GLOBAL_BOARD = 'global'
+TRENDING_LIMIT = 10
+TRENDING_MAX_LIMIT = 100
+# Вклад оценки уменьшается вдвое за сутки
+TRENDING_HALF_LIFE = 60 * 60 * 24
+# Эпоха переносится, когда множитель свежих вкладов достигает 2 ** 30; до переполнения double далеко
+TRENDING_REBASE_AFTER = TRENDING_HALF_LIFE * 30
+# Сколько медиа хранится в каждом рейтинге и ниже какого затухшего счёта медиа удаляется
+TRENDING_BOARD_SIZE = 1000
+TRENDING_MIN_SCORE = 0.001
+# Оценки старше этого окна при перестройке не учитываются: их вклад меньше 2 ** -14
+TRENDING_REBUILD_WINDOW = TRENDING_HALF_LIFE * 14
+
+
+def genre_board(genre_id):
+    """Метод для получения имени рейтинга жанра"""
+    return f'genre:{genre_id}'
+
+
+def country_board(country_id):
+    """Метод для получения имени рейтинга страны"""
+    return f'country:{country_id}'
+
+
+def rating_weight(rating):
+    """Метод для получения веса оценки: высокая оценка продвигает медиа сильнее низкой"""
+    return int(rating) / 5
+
+
+class TrendingBackend:
+    """
+    Интерфейс хранилища трендов.
+    Хранит для каждого рейтинга счета медиа, относительные к эпохе, и сведения о медиа для выдачи.
+    """
+
+    def add(self, entries):
+        """
+        Метод для учёта активности. entries — список (ID медиа, сведения о медиа, рейтинги, вес, время),
+        где сведения — словарь id/type/title, рейтинги — имена рейтингов, в которые входит медиа.
+        """
+        raise NotImplementedError
+
+    def top(self, board, limit=TRENDING_LIMIT):
+        """Метод для получения лучших медиа рейтинга: список сведений о медиа со счётом на текущий момент"""
+        raise NotImplementedError
+
+    def set_media(self, media_id, info):
+        """Метод для обновления сведений о медиа; info=None убирает медиа из выдачи"""
+        raise NotImplementedError
+
+    def maintain(self, now=None):
+        """Метод для переноса эпохи при необходимости и удаления медиа с пренебрежимо малым счётом"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Метод для удаления всех рейтингов"""
+        raise NotImplementedError
+
+    @staticmethod
+    def decay(timestamp, epoch):
+        """Метод для получения множителя вклада в момент timestamp относительно эпохи"""
+        return 2 ** ((timestamp - epoch) / TRENDING_HALF_LIFE)
+
+
+class RedisTrendingBackend(TrendingBackend):
+    """
+    Хранилище трендов в Redis: рейтинг — ZSET, сведения о медиа — хеш.
+    Запись и чтение выполняются Lua-скриптами: эпоха читается атомарно вместе с изменением,
+    а лучшие медиа со сведениями о них возвращаются за одно обращение.
+    """
+    ADD_SCRIPT = """
+        local epoch = redis.call('GET', KEYS[1])
+        if not epoch then
+            epoch = ARGV[1]
+            redis.call('SET', KEYS[1], epoch)
+        end
+        local half_life = tonumber(ARGV[2])
+        local position = 3
+        while position <= #ARGV do
+            local member, info, weight, timestamp, boards =
+                ARGV[position], ARGV[position + 1], ARGV[position + 2], ARGV[position + 3], ARGV[position + 4]
+            local score = tonumber(weight) * math.pow(2, (tonumber(timestamp) - tonumber(epoch)) / half_life)
+            redis.call('HSET', KEYS[3], member, info)
+            for board in string.gmatch(boards, '[^ ]+') do
+                redis.call('ZINCRBY', KEYS[4] .. board, score, member)
+                redis.call('SADD', KEYS[2], board)
+            end
+            position = position + 5
+        end
+        return epoch
+    """
+    TOP_SCRIPT = """
+        local limit = tonumber(ARGV[1])
+        local result = {redis.call('GET', KEYS[1]) or false}
+        local start = 0
+        while #result < limit * 2 + 1 do
+            local page = redis.call('ZREVRANGE', KEYS[2], start, start + limit * 2 - 1, 'WITHSCORES')
+            if #page == 0 then
+                break
+            end
+            for index = 1, #page, 2 do
+                local info = redis.call('HGET', KEYS[3], page[index])
+                if info and #result < limit * 2 + 1 then
+                    table.insert(result, info)
+                    table.insert(result, page[index + 1])
+                end
+            end
+            start = start + limit * 2
+        end
+        return result
+    """
+    MAINTAIN_SCRIPT = """
+        local epoch = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+        local now, half_life = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local factor = 1
+        if now - epoch > tonumber(ARGV[3]) then
+            factor = math.pow(2, (epoch - now) / half_life)
+            epoch = now
+            redis.call('SET', KEYS[1], epoch)
+        end
+        local floor = tonumber(ARGV[5]) * math.pow(2, (now - epoch) / half_life)
+        for _, board in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+            local key = KEYS[3] .. board
+            if factor ~= 1 then
+                redis.call('ZUNIONSTORE', key, 1, key, 'WEIGHTS', factor)
+            end
+            redis.call('ZREMRANGEBYSCORE', key, '-inf', '(' .. floor)
+            redis.call('ZREMRANGEBYRANK', key, 0, -tonumber(ARGV[4]) - 1)
+            if redis.call('EXISTS', key) == 0 then
+                redis.call('SREM', KEYS[2], board)
+            end
+        end
+        return tostring(epoch)
+    """
+
+    def __init__(self, redis=None):
+        self.redis = redis or get_redis()
+        self._add = self.redis.register_script(self.ADD_SCRIPT)
+        self._top = self.redis.register_script(self.TOP_SCRIPT)
+        self._maintain = self.redis.register_script(self.MAINTAIN_SCRIPT)
+
+    def add(self, entries):
+        """Учёт активности одним вызовом скрипта"""
+        args = [int(time.time()), TRENDING_HALF_LIFE]
+        for media_id, info, boards, weight, timestamp in entries:
+            args += [media_id, json.dumps(info, ensure_ascii=False), weight, timestamp, ' '.join(boards)]
+        if len(args) > 2:
+            self._add(
+                keys=[TRENDING_EPOCH_KEY, TRENDING_BOARDS_KEY, TRENDING_MEDIA_KEY, TRENDING_PREFIX], args=args,
+            )
+
+    def top(self, board, limit=TRENDING_LIMIT):
+        """Лучшие медиа рейтинга со сведениями за одно обращение к Redis"""
+        epoch, *rows = self._top(
+            keys=[TRENDING_EPOCH_KEY, TRENDING_PREFIX + board, TRENDING_MEDIA_KEY], args=[limit],
+        )
+        if epoch is None:
+            return []
+
+        scale = 1 / self.decay(time.time(), float(epoch))
+        return [
+            {**json.loads(info), 'score': round(float(score) * scale, 4)}
+            for info, score in zip(rows[::2], rows[1::2])
+        ]
+
+    def set_media(self, media_id, info):
+        """Обновление сведений о медиа в хеше"""
+        if info is None:
+            self.redis.hdel(TRENDING_MEDIA_KEY, media_id)
+        else:
+            self.redis.hset(TRENDING_MEDIA_KEY, media_id, json.dumps(info, ensure_ascii=False))
+
+    def maintain(self, now=None):
+        """Перенос эпохи и обрезка рейтингов одним атомарным скриптом"""
+        self._maintain(
+            keys=[TRENDING_EPOCH_KEY, TRENDING_BOARDS_KEY, TRENDING_PREFIX],
+            args=[int(now or time.time()), TRENDING_HALF_LIFE, TRENDING_REBASE_AFTER, TRENDING_BOARD_SIZE,
+                  TRENDING_MIN_SCORE],
+        )
+
+    def clear(self):
+        """Удаление всех ключей трендов"""
+        boards = [TRENDING_PREFIX + board.decode() for board in self.redis.smembers(TRENDING_BOARDS_KEY)]
+        self.redis.delete(TRENDING_EPOCH_KEY, TRENDING_BOARDS_KEY, TRENDING_MEDIA_KEY, *boards)
+
+
+class InMemoryTrendingBackend(TrendingBackend):
+    """
+    Хранилище трендов в памяти процесса для разработки без Redis и тестов.
+    Та же модель счёта, что у Redis; выборка лучших — частичная сортировка heapq.
+    """
+
+    def __init__(self):
+        self.epoch = None
+        self.boards = {}
+        self.media = {}
+        self._lock = threading.Lock()
+
+    def add(self, entries):
+        """Учёт активности"""
+        with self._lock:
+            if self.epoch is None:
+                self.epoch = int(time.time())
+            for media_id, info, boards, weight, timestamp in entries:
+                self.media[media_id] = info
+                score = weight * self.decay(timestamp, self.epoch)
+                for board in boards:
+                    scores = self.boards.setdefault(board, {})
+                    scores[media_id] = scores.get(media_id, 0) + score
+
+    def top(self, board, limit=TRENDING_LIMIT):
+        """Лучшие медиа рейтинга"""
+        with self._lock:
+            if self.epoch is None:
+                return []
+            scores = self.boards.get(board, {})
+            best = heapq.nlargest(
+                limit, (media_id for media_id in scores if media_id in self.media), key=scores.__getitem__,
+            )
+            scale = 1 / self.decay(time.time(), self.epoch)
+            return [{**self.media[media_id], 'score': round(scores[media_id] * scale, 4)} for media_id in best]
+
+    def set_media(self, media_id, info):
+        """Обновление сведений о медиа"""
+        with self._lock:
+            if info is None:
+                self.media.pop(media_id, None)
+            else:
+                self.media[media_id] = info
+
+    def maintain(self, now=None):
+        """Перенос эпохи и обрезка рейтингов"""
+        now = int(now or time.time())
+        with self._lock:
+            if self.epoch is None:
+                return
+            if now - self.epoch > TRENDING_REBASE_AFTER:
+                factor = self.decay(self.epoch, now)
+                for scores in self.boards.values():
+                    for media_id in scores:
+                        scores[media_id] *= factor
+                self.epoch = now
+
+            floor = TRENDING_MIN_SCORE * self.decay(now, self.epoch)
+            for board, scores in list(self.boards.items()):
+                kept = heapq.nlargest(TRENDING_BOARD_SIZE, scores.items(), key=lambda item: item[1])
+                self.boards[board] = {media_id: score for media_id, score in kept if score >= floor}
+                if not self.boards[board]:
+                    del self.boards[board]
+
+    def clear(self):
+        """Удаление всех рейтингов"""
+        with self._lock:
+            self.epoch = None
+            self.boards = {}
+            self.media = {}
+
+
+@functools.cache
+def get_trending_backend():
+    """
+    Метод для получения хранилища трендов из настройки TRENDING_BACKEND.
+    По умолчанию используется Redis, если кэш работает через django-redis, иначе хранилище в памяти.
+    """
+    backend = getattr(settings, 'TRENDING_BACKEND', None)
+    if backend:
+        return import_string(backend)()
+    return RedisTrendingBackend() if get_redis() is not None else InMemoryTrendingBackend()
+
+
+def load_media_entries(media_ids):
+    """
+    Метод для загрузки сведений об опубликованных медиа и рейтингов, в которые они входят: {ID: (сведения, рейтинги)}.
+    Два запроса: медиа и их жанры.
+    """
+    rows = AbstractMedia.objects.non_polymorphic().filter(pk__in=media_ids, is_published=True).values_list(
+        'id', 'title', 'country_id', 'polymorphic_ctype_id',
+    )
+    entries = {
+        pk: (
+            {'id': pk, 'type': ContentType.objects.get_for_id(ctype_id).model, 'title': title},
+            [GLOBAL_BOARD, country_board(country_id)],
+        )
+        for pk, title, country_id, ctype_id in rows
+    }
+    for media_id, genre_id in AbstractMedia.genres.through.objects.filter(
+        abstractmedia__in=list(entries),
+    ).values_list('abstractmedia_id', 'genre_id'):
+        entries[media_id][1].append(genre_board(genre_id))
+    return entries
+
+
+def record_ratings(ratings, retracted=()):
+    """
+    Метод для учёта оценок в трендах. ratings — список (ID медиа, оценка, время оценки в секундах).
+    retracted — оценки в том же формате, вклад которых вычитается: прежние значения изменённых оценок,
+    так что изменённая оценка учитывается один раз, как при перестройке трендов.
+    Снятые с публикации и удалённые медиа пропускаются.
+    """
+    entries = load_media_entries({media_id for media_id, _, _ in [*ratings, *retracted]})
+    get_trending_backend().add([
+        (media_id, *entries[media_id], sign * rating_weight(rating), timestamp)
+        for sign, items in ((-1, retracted), (1, ratings))
+        for media_id, rating, timestamp in items if media_id in entries
+    ])
+
+
+def record_ratings_after_commit(ratings, retracted=()):
+    """Метод для учёта оценок в трендах после фиксации транзакции, в которой они записаны"""
+    transaction.on_commit(lambda: record_ratings(ratings, retracted), robust=True)
+
+
+def update_trending_media(media_id, media_type, title, is_published):
+    """Метод для обновления названия медиа в выдаче трендов; снятое с публикации медиа из выдачи убирается"""
+    info = {'id': media_id, 'type': media_type, 'title': title} if is_published else None
+    transaction.on_commit(lambda: get_trending_backend().set_media(media_id, info), robust=True)
+
+
+def rebuild_trending(batch_size=1000):
+    """
+    Метод для перестройки трендов по оценкам из базы, например после потери данных Redis.
+    Учитываются оценки за TRENDING_REBUILD_WINDOW; возвращает количество учтённых оценок.
+    """
+    backend = get_trending_backend()
+    backend.clear()
+
+    ratings = Rating.objects.filter(
+        media__isnull=False, rated_at__gte=timezone.now() - timedelta(seconds=TRENDING_REBUILD_WINDOW),
+    ).values_list('media_id', 'rating', 'rated_at').order_by('rated_at').iterator(chunk_size=batch_size)
+
+    count = 0
+    batch = []
+    for media_id, rating, rated_at in ratings:
+        batch.append((media_id, rating, rated_at.timestamp()))
+        if len(batch) == batch_size:
+            record_ratings(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        record_ratings(batch)
+        count += len(batch)
+    return count
@@ -12,6 +12,7 @@ urlpatterns = [
     path('complex_querries/', views.ComplexQueriesView.as_view(), name='complex_querries'),
     path('media/', views.media_list_view, name='media_list'),
     path('media/<int:pk>/', views.media_detail_view, name='media_detail'),
+    path('media/<int:pk>/file/', views.media_file_view, name='media_file'),
     path('media/<int:pk>/rate/<int:rating>/edit/', views.ReviewEditView.as_view(), name='rate_media'),
     path('media/<int:pk>/rate/<int:rating>/delete/', views.ReviewDeleteView.as_view(), name='delete_rating'),
     path('add_media/', views.add_media_view, name='add_media'),
@@ -1,28 +1,35 @@
 """Модуль представлений приложения media"""
-from django.core.cache import cache
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models.aggregates import Count
-from django.http import HttpResponseRedirect
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import redirect, render, get_object_or_404
+from django.views.decorators.http import require_safe
 from django.views.generic import ListView, TemplateView, DetailView, CreateView
 
+from media.caching import attach_card_versions, country_cache, genre_cache, get_or_compute, get_table_versions
 from media.forms import MediaForm
-from media.models import Movie, TVShow, Country, Genre, Rating, Media, AbstractMedia
+from media.models import Movie, TVShow, Rating, Media, AbstractMedia
+from media.pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from media.rating_buffer import apply_pending_rating, submit_rating
+from media.search import SEARCH_ORDERING, search_media
+from media.snapshots import HOME_PAGE_SIZE, HOME_TOP_SIZE, get_home_paginator, get_home_queryset, get_home_snapshot
+from media.streaming import offload_response, serve_file
+
+HOME_TOP_KEY = 'home_top:{}'
+HOME_TOP_TABLES = ('movie', 'tvshow', 'rating')
 
 
 def media_list_view(request):
     # chaining filters
     media_list = Media.objects.prefetch_related('genres').filter(rating__gte=1).order_by('-release_date')
 
-    paginator = Paginator(media_list, 5)
-    page = request.GET.get('page')
+    paginator = KeysetPaginator(media_list, ('-release_date', '-id'), 5)
 
     try:
-        media = paginator.page(page)
-    except PageNotAnInteger:
-        media = paginator.page(1)
-    except EmptyPage:
-        media = paginator.page(paginator.num_pages)
+        media = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        media = paginator.page()
 
     media_titles = media_list.values_list('title', flat=True)
     has_high_rated = media_list.filter(rating__gte=4).exists()
@@ -39,66 +46,110 @@ def media_detail_view(request, pk):
     return render(request, 'media_detail.html', {'media': media})
 
 
+@require_safe
+def media_file_view(request, pk):
+    """
+    Отдача файла медиа с поддержкой докачки и перемотки (Range, If-Range) и условных запросов по ETag.
+    С параметром ?download файл отдаётся как вложение.
+    """
+    name = Media.objects.filter(pk=pk).values_list('file', flat=True).first()
+    if not name:
+        raise Http404
+    path = Media._meta.get_field('file').storage.path(name)
+    if not os.path.isfile(path):
+        raise Http404
+
+    as_attachment = 'download' in request.GET
+    if settings.MEDIA_FILE_OFFLOAD:
+        return offload_response(name, path, os.path.basename(name), as_attachment)
+    return serve_file(request, path, as_attachment=as_attachment)
+
+
 class MediaView(TemplateView):
     """Представление для отображения списка фильмов и сериалов"""
     template_name = 'media/media.html'
     context_object_name = 'media'
 
     def get_context_data(self, **kwargs):
-        """Метод для получения контекста"""
+        """
+        Метод для получения контекста.
+        Первые страницы и топ берутся из снимка, собранного задачей Celery;
+        поиск и дальние страницы считаются живыми запросами.
+        """
         context = super().get_context_data(**kwargs)
 
         search_query = self.request.GET.get('search', '').strip()
+        context['search_query'] = search_query
 
-        tvshows_list = cache.get('tvshows_list')
-        if not tvshows_list:
-            tvshows_list = TVShow.objects.all()
-            cache.set('tvshows_list', tvshows_list, timeout=60 * 15)  # 15 минут
-        else:
-            tvshows_list = TVShow.objects.filter(id__in=[tvshow.id for tvshow in tvshows_list])
-
-        movies_list = cache.get('movies_list')
-        if not movies_list:
-            movies_list = Movie.objects.all()
-            cache.set('movies_list', movies_list, timeout=60 * 15)
-        else:
-            movies_list = Movie.objects.filter(id__in=[movie.id for movie in movies_list])
-
-        tvshows_list = tvshows_list.distinct()
-        movies_list = movies_list.distinct()
-
-        tvshows_list = tvshows_list.exclude(is_published=False)
-        movies_list = movies_list.exclude(is_published=False)
-
-        if search_query:
-            tvshows_list = tvshows_list.filter(title__icontains=search_query)
-            movies_list = movies_list.filter(title__icontains=search_query)
+        snapshot = None if search_query else get_home_snapshot()
+        objects = self.get_snapshot_objects(snapshot) if snapshot else {}
 
-        tvshows_paginator = Paginator(tvshows_list, 5)
-        movies_paginator = Paginator(movies_list, 5)
+        context['tvshows'] = self.get_page(TVShow, 'tvshows', search_query, snapshot, objects)
+        context['movies'] = self.get_page(Movie, 'movies', search_query, snapshot, objects)
 
-        tvshows_page_number = self.request.GET.get('tvshows_page')
-        movies_page_number = self.request.GET.get('movies_page')
-
-        tvshows_page = tvshows_paginator.get_page(tvshows_page_number)
-        movies_page = movies_paginator.get_page(movies_page_number)
+        top = snapshot
+        if not snapshot:
+            # Пока снимок пересобирается, топ и количество берутся из кэша по версиям таблиц: в нём только ID,
+            # поэтому после записи карточки строятся из свежих объектов, а не из закэшированных до неё
+            top = get_or_compute(
+                HOME_TOP_KEY.format(get_table_versions(*HOME_TOP_TABLES)), self.build_top, timeout=60 * 15,
+            )
+            objects = self.load_media([*top['high_rated_movies'], *top['high_rated_tvshows']])
 
-        context['tvshows'] = tvshows_page
-        context['movies'] = movies_page
+        high_rated_movies = [objects[pk] for pk in top['high_rated_movies'] if pk in objects]
+        high_rated_tvshows = [objects[pk] for pk in top['high_rated_tvshows'] if pk in objects]
+        context['movie_count'] = top['movie_count']
+        context['tvshow_count'] = top['tvshow_count']
 
-        high_rated_movies = Movie.get_high_rated()[0:3]
-        high_rated_tvshows = TVShow.get_high_rated()[0:3]
+        context['high_rated_movies'] = attach_card_versions(high_rated_movies)
+        context['high_rated_tvshows'] = attach_card_versions(high_rated_tvshows)
 
-        movie_count = Movie.objects.aggregate(total=Count('id'))['total']
-        context['movie_count'] = movie_count
+        return context
 
-        tvshow_count = TVShow.objects.aggregate(total=Count('id'))['total']
-        context['tvshow_count'] = tvshow_count
+    @staticmethod
+    def load_media(ids):
+        """Метод для загрузки медиа по ID одним запросом сразу как фильмов и сериалов"""
+        return {pk: media.as_subtype() for pk, media in AbstractMedia.catalog().in_bulk(set(ids)).items()}
+
+    def get_snapshot_objects(self, snapshot):
+        """Метод для загрузки всех медиа снимка одним запросом"""
+        return self.load_media([
+            *snapshot['movies']['ids'], *snapshot['tvshows']['ids'],
+            *snapshot['high_rated_movies'], *snapshot['high_rated_tvshows'],
+        ])
+
+    @staticmethod
+    def build_top():
+        """Метод для расчёта ID топа и количества фильмов и сериалов, когда снимка главной страницы нет"""
+        return {
+            'high_rated_movies': list(Movie.get_high_rated().values_list('id', flat=True)[:HOME_TOP_SIZE]),
+            'high_rated_tvshows': list(TVShow.get_high_rated().values_list('id', flat=True)[:HOME_TOP_SIZE]),
+            'movie_count': Movie.objects.count(),
+            'tvshow_count': TVShow.objects.count(),
+        }
+
+    def get_page(self, model, prefix, search_query, snapshot, objects):
+        """Метод для получения страницы фильмов или сериалов по курсору; результаты поиска идут по релевантности"""
+        cursor = self.request.GET.get(f'{prefix}_cursor')
+
+        if snapshot and not cursor:
+            page = KeysetPage(
+                [objects[pk] for pk in snapshot[prefix]['ids'] if pk in objects],
+                next_cursor=snapshot[prefix]['next_cursor'],
+            )
+        else:
+            queryset = get_home_queryset(model)
+            if search_query:
+                paginator = KeysetPaginator(search_media(queryset, search_query), SEARCH_ORDERING, HOME_PAGE_SIZE)
+            else:
+                paginator = get_home_paginator(queryset)
+            try:
+                page = paginator.page(cursor)
+            except InvalidCursor:
+                page = paginator.page()
 
-        context['high_rated_movies'] = high_rated_movies
-        context['high_rated_tvshows'] = high_rated_tvshows
-
-        return context
+        page.object_list = attach_card_versions(page.object_list)
+        return page
 
 
 class MovieView(DetailView):
@@ -110,15 +161,13 @@ class MovieView(DetailView):
     def get_context_data(self, **kwargs):
         """Метод для получения контекста"""
         context = super().get_context_data(**kwargs)
-        reviews = Movie.reviews(self.object)
+        reviews = apply_pending_rating(Movie.reviews(self.object), self.request.user, self.object)
         for review in reviews:
             review.full_stars = range(review.rating)
             review.empty_stars = range(5 - review.rating)
 
         context['reviews'] = reviews
 
-        print([review.full_stars for review in reviews])
-
         return context
 
     def post(self, request, *args, **kwargs):
@@ -127,11 +176,7 @@ class MovieView(DetailView):
         rating = request.POST.get('rating')
 
         if rating and 1 <= int(rating) <= 5:
-            Rating.objects.create(
-                media=movie,
-                user=request.user,
-                rating=int(rating),
-            )
+            submit_rating(request.user, movie, int(rating))
 
         request.session['last_viewed_movie'] = movie.pk
 
@@ -147,15 +192,13 @@ class TVShowView(DetailView):
     def get_context_data(self, **kwargs):
         """Метод для получения контекста"""
         context = super().get_context_data(**kwargs)
-        reviews = TVShow.reviews(self.object)
+        reviews = apply_pending_rating(TVShow.reviews(self.object), self.request.user, self.object)
         for review in reviews:
             review.full_stars = range(review.rating)
             review.empty_stars = range(5 - review.rating)
 
         context['reviews'] = reviews
 
-        print([review.full_stars for review in reviews])
-
         return context
 
     def post(self, request, *args, **kwargs):
@@ -164,107 +207,67 @@ class TVShowView(DetailView):
         rating = request.POST.get('rating')
 
         if rating and 1 <= int(rating) <= 5:
-            Rating.objects.create(
-                media=tvshow,
-                user=request.user,
-                rating=int(rating),
-            )
+            submit_rating(request.user, tvshow, int(rating))
 
         request.session['last_viewed_tvshow'] = tvshow.pk
 
         return redirect('tvshow', pk=tvshow.pk)
 
 
-class ReviewEditView(TemplateView):
-    """Представление для редактирования отзыва"""
-    template_name = 'media/review_edit.html'
-
+class ReviewMediaMixin:
+    """
+    Примесь представлений отзыва: медиа и оценка берутся по ID из URL.
+    Медиа загружается одним запросом сразу как фильм или сериал.
+    """
     media_type = None
     media_id = None
 
+    def get_media(self):
+        """Метод для получения медиа отзыва"""
+        media = get_object_or_404(AbstractMedia.catalog(), pk=self.kwargs.get('pk')).as_subtype()
+        self.media_type = media.get_media_type()
+        self.media_id = media.pk
+        return media
+
+    def get_rating(self):
+        """Метод для получения оценки, принадлежащей медиа из URL"""
+        return get_object_or_404(Rating, pk=self.kwargs.get('rating'), media_id=self.kwargs.get('pk'))
+
     def get_context_data(self, **kwargs):
         """Метод для получения контекста"""
         context = super().get_context_data(**kwargs)
-        media_id = self.kwargs.get('pk')
-        rating_id = self.kwargs.get('rating')
+        context['media'] = self.get_media()
+        context['rating'] = self.get_rating()
+        return context
 
-        context['media'] = get_object_or_404(Movie, pk=media_id)
-        if not context['media']:
-            context['media'] = get_object_or_404(TVShow, pk=media_id)
-            if not context['media']:
-                raise ValueError('Media not found')
+    def redirect_to_media(self):
+        """Метод для перехода на страницу медиа"""
+        media = self.get_media()
+        return redirect(self.media_type, pk=media.pk)
 
-        self.media_type = context['media'].get_media_type()
-        self.media_id = media_id
-        context['rating'] = Rating.objects.get(pk=rating_id)
-        if context['rating'].media.id != int(media_id):
-            raise ValueError('Rating not found')
 
-        return context
+class ReviewEditView(ReviewMediaMixin, TemplateView):
+    """Представление для редактирования отзыва"""
+    template_name = 'media/review_edit.html'
 
     def post(self, request, *args, **kwargs):
         """Метод для обновления рейтинга"""
-        rating = Rating.objects.get(pk=self.kwargs.get('rating'))
-        rating.rating = request.POST.get('rating')
+        rating = self.get_rating()
+        rating.rating = int(request.POST.get('rating'))
         rating.save()
-        media = get_object_or_404(Movie, pk=self.kwargs.get('pk'))
-        if not media:
-            media = get_object_or_404(TVShow, pk=self.kwargs.get('pk'))
-            if not media:
-                raise ValueError('Media not found')
 
-        media_type = media.get_media_type()
+        return self.redirect_to_media()
 
-        if media_type == 'movie':
-            return redirect('movie', pk=media.id)
-        elif media_type == 'tvshow':
-            return redirect('tvshow', pk=media.id)
 
-
-class ReviewDeleteView(TemplateView):
+class ReviewDeleteView(ReviewMediaMixin, TemplateView):
     """Представление для удаления отзыва"""
     template_name = 'media/review_delete.html'
 
-    media_type = None
-    media_id = None
-
-    def get_context_data(self, **kwargs):
-        """Метод для получения контекста"""
-        context = super().get_context_data(**kwargs)
-        media_id = self.kwargs.get('pk')
-        rating_id = self.kwargs.get('rating')
-
-        context['media'] = get_object_or_404(Movie, pk=media_id)
-        if not context['media']:
-            context['media'] = get_object_or_404(TVShow, pk=media_id)
-            if not context['media']:
-                raise ValueError('Media not found')
-
-        self.media_type = context['media'].get_media_type()
-        self.media_id = media_id
-        context['rating'] = Rating.objects.get(pk=rating_id)
-        if context['rating'].media.id != int(media_id):
-            raise ValueError('Rating not found')
-
-        return context
-
     def post(self, request, *args, **kwargs):
         """Метод для удаления рейтинга"""
-        rating = Rating.objects.get(pk=self.kwargs.get('rating'))
-        media = get_object_or_404(Movie, pk=self.kwargs.get('pk'))
-        if not media:
-            media = get_object_or_404(TVShow, pk=self.kwargs.get('pk'))
-            if not media:
-                raise ValueError('Media not found')
-
-        media_type = media.get_media_type()
-
-        rating.delete()
+        self.get_rating().delete()
 
-        if media_type == 'movie':
-            return redirect('movie', pk=media.id)
-        elif media_type == 'tvshow':
-            return redirect('tvshow', pk=media.id)
+        return self.redirect_to_media()
 
 
 class AddMovieView(CreateView):
@@ -277,8 +280,8 @@ class AddMovieView(CreateView):
     def get_context_data(self, **kwargs):
         """Метод для получения контекста"""
         context = super().get_context_data(**kwargs)
-        context['countries'] = Country.objects.all()
-        context['genres'] = Genre.objects.all()
+        context['countries'] = country_cache.all()
+        context['genres'] = genre_cache.all()
         return context
 
     def form_valid(self, form):
@@ -297,8 +300,8 @@ class AddTVShowView(CreateView):
     def get_context_data(self, **kwargs):
         """Метод для получения контекста"""
         context = super().get_context_data(**kwargs)
-        context['countries'] = Country.objects.all()
-        context['genres'] = Genre.objects.all()
+        context['countries'] = country_cache.all()
+        context['genres'] = genre_cache.all()
         return context
 
 
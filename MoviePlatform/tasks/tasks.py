@@ -1,41 +1,42 @@
 ﻿"""Модуль задач Celery"""
+from smtplib import SMTPException
+
 from celery import shared_task
-from django.core.mail import send_mail
-from django.contrib.auth.models import User
 
-from media.models import Movie, TVShow, Rating
+from MoviePlatform.db_routing import sync_replicas as sync_replica_files
+from media.digest import DIGEST_CHUNK_SIZE, deliver_digest, fan_out_digest, get_digest_period
+from media.models import Rating
+from media.posters import build_poster_variants as build_poster_variant_files
+from media.rating_buffer import flush_ratings
+from media.recommendations import compute_recommendations, store_recommendations
+from media.similar import similar_index
+from media.snapshots import build_home_snapshot as build_home_snapshot_document
+from media.trending import get_trending_backend
 
 
 @shared_task
-def send_high_rated_media_to_users():
-    """Отправка списка медиа с высоким рейтингом"""
-    threshold = 4.0
-    movies = Movie.get_high_rated(threshold)
-    tvshows = TVShow.get_high_rated(threshold)
-    print('aaaaaa')
-
-    if movies.exists() or tvshows.exists():
-        message = "Рекомендуем посмотреть:\n\n"
+def send_high_rated_media_to_users(period=None, chunk_size=DIGEST_CHUNK_SIZE):
+    """
+    Рассылка подборки за период (по умолчанию текущая неделя): персональной по рекомендациям
+    или общего списка медиа с высоким рейтингом.
+    Получатели распределяются по задачам send_digest_chunk частями по chunk_size адресов.
+    """
+    period = period or get_digest_period()
+    dispatched = fan_out_digest(period, send_digest_chunk.delay, chunk_size)
+    if dispatched is None:
+        return f"Рассылка {period} уже распределяется."
 
-        if movies.exists():
-            message += "Фильмы:\n"
-            for movie in movies:
-                message += f"- {movie.title} ({movie.release_date.year})\n"
+    return f"Рассылка {period}: получателей в очереди: {dispatched}."
 
-        if tvshows.exists():
-            message += "\nСериалы:\n"
-            for show in tvshows:
-                message += f"- {show.title} ({show.release_date.year})\n"
 
-        send_mail(
-            'Ваши рекомендации на неделю',
-            message,
-            'noreply@movieplatform.com',
-            [user.email for user in User.objects.all() if user.email and user.email != ''],
-            fail_silently=False,
-        )
-
-    return f"Отправлены рекомендации: {movies.count()} фильмов и {tvshows.count()} сериалов."
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_digest_chunk(self, period, recipients):
+    """Отправка подборки части получателей через одно SMTP-соединение"""
+    try:
+        sent = deliver_digest(period, recipients)
+    except (SMTPException, OSError) as exc:
+        raise self.retry(exc=exc)
+    return f"Отправлено писем: {sent} из {len(recipients)}."
 
 
 @shared_task
@@ -43,3 +44,73 @@ def clean_empty_ratings():
     """Удаление рейтингов без связанного медиа"""
     deleted_count, _ = Rating.objects.filter(media__isnull=True).delete()
     return f"Удалено {deleted_count} записей без медиа."
+
+
+@shared_task
+def build_home_snapshot():
+    """Сборка снимка данных главной страницы"""
+    snapshot = build_home_snapshot_document()
+    return f"Снимок главной страницы собран: {snapshot['movie_count']} фильмов и {snapshot['tvshow_count']} сериалов."
+
+
+@shared_task
+def sync_replicas():
+    """Копирование основной базы в реплики для чтения"""
+    aliases = sync_replica_files()
+    return f"Синхронизировано реплик: {len(aliases)}."
+
+
+@shared_task
+def build_recommendations():
+    """
+    Расчёт персональных рекомендаций всех пользователей с оценками.
+    Задача направляется в очередь cpu (CELERY_TASK_ROUTES): её воркер работает без gevent.
+    """
+    recommendations = compute_recommendations()
+    store_recommendations(recommendations)
+    return f"Рассчитаны рекомендации для {len(recommendations)} пользователей."
+
+
+@shared_task
+def rebuild_similar_index():
+    """Полная перестройка индекса похожих медиа: обновление словаря, IDF, жанров и стран"""
+    count = similar_index.rebuild()
+    if count is None:
+        return "Индекс похожих медиа уже перестраивается."
+    return f"Индекс похожих медиа перестроен: {count} медиа."
+
+
+@shared_task(bind=True, max_retries=12)
+def update_similar_index(self, media_ids):
+    """
+    Обновление строк изменённых медиа в индексе похожих.
+    Пока индекс занят, задача повторяется с задержкой от 10 секунд до 5 минут; вместе повторы ждут дольше
+    SIMILAR_LOCK_TIMEOUT, поэтому изменения, сделанные во время самой долгой перестройки, не теряются.
+    """
+    if not similar_index.update(media_ids):
+        raise self.retry(countdown=min(10 * 2 ** self.request.retries, 60 * 5))
+    return f"Обновлено медиа в индексе похожих: {len(media_ids)}."
+
+
+@shared_task
+def maintain_trending():
+    """Перенос эпохи трендов при необходимости и удаление медиа с затухшей активностью"""
+    get_trending_backend().maintain()
+    return "Тренды обслужены."
+
+
+@shared_task
+def flush_rating_buffer():
+    """Запись оценок из очереди отложенной записи в базу пачками"""
+    processed = flush_ratings()
+    if processed is None:
+        return "Очередь оценок уже записывается."
+    return f"Записано событий оценок: {processed}."
+
+
+@shared_task
+def build_poster_variants(model_label, pk):
+    """Построение копий постера медиа в современных форматах"""
+    if not build_poster_variant_files(model_label, pk):
+        return f"Копии постера {model_label} {pk} не построены."
+    return f"Построены копии постера {model_label} {pk}."